@@ -0,0 +1,115 @@
+"""
+Замер задержки от нажатия модератором "Одобрить" до ответа на кнопку и до публикации в канале
+в режимах polling и webhook. Бот работает с локальной заглушкой Bot API (fake_telegram.py),
+задержка сети до Telegram имитируется параметром --delay.
+
+    python benchmarks/approve_latency.py [--rounds 20] [--delay 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+FAKE_PORT = 8089
+WEBHOOK_PORT = 8090
+MODERATOR_ID = 1
+TARGET_CHANNEL = '-1001'
+
+# Настройки задаются до импорта бота: config читает их при импорте
+DB_DIR = tempfile.mkdtemp(prefix='approve_bench_')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}",
+    BOT_TOKEN='123456:FAKE',
+    BOT_API_URL=f'http://127.0.0.1:{FAKE_PORT}',
+    MODERATOR_IDS=str(MODERATOR_ID),
+    TARGET_CHANNEL=TARGET_CHANNEL,
+    WEBHOOK_URL=f'http://127.0.0.1:{WEBHOOK_PORT}',
+    WEBHOOK_HOST='127.0.0.1',
+    WEBHOOK_PORT=str(WEBHOOK_PORT),
+    # Лимиты частоты не должны влиять на замер
+    RATE_LIMIT_GLOBAL_PER_SECOND='10000',
+    RATE_LIMIT_CHAT_PER_SECOND='10000',
+    RATE_LIMIT_CHAT_BURST='10000',
+    RATE_LIMIT_GROUP_PER_MINUTE='1000000',
+    RATE_LIMIT_GROUP_BURST='10000',
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bot as moderation_bot  # noqa: E402
+from database import get_async_session, init_db_async, News  # noqa: E402
+from fake_telegram import FakeTelegram  # noqa: E402
+
+
+async def create_news(number):
+    async with get_async_session() as session:
+        news = News(
+            source_channel='bench', message_id=number, content=f'Новость {number}',
+            original_content=f'Новость {number}', has_media=False
+        )
+        session.add(news)
+        await session.commit()
+        return news.id
+
+
+async def measure(fake, mode, rounds, offset):
+    """Возвращает задержки ответа на кнопку и публикации для каждого нажатия"""
+    if mode == 'webhook':
+        ready = fake.expect(lambda method, data: method == 'setWebhook')
+        task = asyncio.create_task(moderation_bot.run_webhook())
+    else:
+        ready = fake.expect(lambda method, data: method == 'getUpdates')
+        task = asyncio.create_task(moderation_bot.run_polling())
+    await asyncio.wait_for(ready, 30)
+    await asyncio.sleep(0.5)
+
+    answers, publishes = [], []
+    for number in range(offset, offset + rounds):
+        news_id = await create_news(number)
+        answered = fake.expect(lambda method, data: method == 'answerCallbackQuery')
+        published = fake.expect(
+            lambda method, data: method == 'sendMessage' and str(data.get('chat_id')) == TARGET_CHANNEL
+        )
+        started = time.perf_counter()
+        await fake.push_update(**fake.make_callback_update(MODERATOR_ID, f'approve_{news_id}'))
+        answers.append(await asyncio.wait_for(answered, 30) - started)
+        publishes.append(await asyncio.wait_for(published, 30) - started)
+        await asyncio.sleep(0.05)
+
+    if mode == 'webhook':
+        task.cancel()
+    else:
+        moderation_bot.dp.stop_polling()
+    await asyncio.gather(task, return_exceptions=True)
+    return answers, publishes
+
+
+def summary(values):
+    values = sorted(values)
+    p50 = values[len(values) // 2] * 1000
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+    return f"p50 {p50:7.1f} мс   p99 {p99:7.1f} мс"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.05, help='задержка ответа заглушки Bot API, с')
+    args = parser.parse_args()
+
+    await init_db_async()
+    fake = await FakeTelegram(port=FAKE_PORT, delay=args.delay).start()
+    try:
+        print(f"{args.rounds} нажатий, задержка Bot API {args.delay * 1000:.0f} мс")
+        for position, mode in enumerate(('polling', 'webhook')):
+            answers, publishes = await measure(fake, mode, args.rounds, position * args.rounds)
+            print(f"{mode:<8} ответ на кнопку: {summary(answers)}   публикация: {summary(publishes)}")
+    finally:
+        await (await moderation_bot.bot.get_session()).close()
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+"""
+Локальная заглушка Telegram Bot API для замеров без сети.
+
+Отвечает на методы Bot API, записывает все вызовы со временем получения и доставляет боту
+обновления так же, как Telegram: через getUpdates (long polling) или запросом на webhook
+с секретом в заголовке. Ответ на webhook с методом (например, answerCallbackQuery) записывается как вызов.
+Часть отправок можно отклонять ответом 429, как при превышении лимитов Telegram.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Fake bot', 'username': 'fake_bot'}
+
+# Методы, на которые Telegram может ответить 429
+SEND_METHODS = ('sendMessage', 'sendPhoto', 'sendDocument', 'sendVideo', 'sendMediaGroup', 'editMessageText',
+                'editMessageCaption', 'editMessageMedia', 'editMessageReplyMarkup')
+
+
+class FakeTelegram:
+    def __init__(self, host='127.0.0.1', port=8089, delay=0.0, rate_limit_ratio=0.0, retry_after=1):
+        self.host = host
+        self.port = port
+        self.delay = delay  # Искусственная задержка ответа, имитирующая сеть до Telegram
+        self.rate_limit_ratio = rate_limit_ratio  # Доля отправок, отклоняемых ответом 429
+        self.retry_after = retry_after  # retry_after в ответе 429, сек
+        self.rate_limited = 0  # Сколько запросов отклонено
+        self.calls = []  # (время, метод, параметры)
+        self.waiters = []  # (проверка, future) для expect
+        self.updates = asyncio.Queue()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1000)
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.runner = None
+        self.http = None
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.http = aiohttp.ClientSession()
+        return self
+
+    async def stop(self):
+        await self.http.close()
+        await self.runner.cleanup()
+
+    def record(self, method, data):
+        now = time.perf_counter()
+        self.calls.append((now, method, data))
+        for check, future in list(self.waiters):
+            if not future.done() and check(method, data):
+                future.set_result(now)
+                self.waiters.remove((check, future))
+
+    def expect(self, check):
+        """
+        Future со временем получения первого следующего вызова, для которого check(метод, параметры) истинно.
+        Создается до действия, вызов от которого ожидается, чтобы не пропустить быстрый ответ.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((check, future))
+        return future
+
+    @staticmethod
+    async def read_params(request):
+        if request.content_type.startswith('multipart'):
+            data = {}
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    size = 0
+                    while chunk := await part.read_chunk(65536):
+                        size += len(chunk)
+                    data[part.name] = (part.filename, size)
+                else:
+                    data[part.name] = (await part.read()).decode()
+            return data
+        if request.content_type == 'application/json':
+            return await request.json()
+        return dict(await request.post())
+
+    def make_message(self, chat_id, **fields):
+        return dict(
+            message_id=next(self.message_ids), date=int(time.time()), chat={'id': int(chat_id), 'type': 'private'},
+            **fields
+        )
+
+    def make_result(self, method, data):
+        chat_id = data.get('chat_id', 0)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return None  # Обрабатывается отдельно
+        if method in ('setWebhook', 'deleteWebhook', 'answerCallbackQuery', 'deleteMessage'):
+            return True
+        if method == 'getChat':
+            return {'id': int(chat_id) if str(chat_id).lstrip('-').isdigit() else -1001, 'type': 'channel',
+                    'title': 'Fake channel'}
+        if method == 'getChatMember':
+            return {'status': 'administrator', 'user': BOT_USER, 'can_post_messages': True}
+        if method == 'sendPhoto':
+            file_id = f'photo{len(self.calls)}'
+            return self.make_message(chat_id, caption=data.get('caption'), photo=[
+                {'file_id': file_id, 'file_unique_id': file_id, 'width': 1280, 'height': 720}
+            ])
+        if method == 'sendDocument':
+            file_id = f'document{len(self.calls)}'
+            return self.make_message(chat_id, caption=data.get('caption'), document={
+                'file_id': file_id, 'file_unique_id': file_id
+            })
+        if method == 'sendMediaGroup':
+            media = data['media'] if isinstance(data['media'], list) else json.loads(data['media'])
+            return [
+                self.make_message(chat_id, photo=[{
+                    'file_id': f'group{len(self.calls)}_{position}', 'file_unique_id': f'group{position}',
+                    'width': 1280, 'height': 720
+                }])
+                for position, _ in enumerate(media)
+            ]
+        return self.make_message(chat_id, text=data.get('text') or data.get('caption') or '')
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        data = await self.read_params(request)
+        if method == 'getUpdates':
+            return await self.get_updates(data)
+        if method in SEND_METHODS and self.rate_limit_ratio and random.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            return web.json_response({
+                'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+        if method == 'setWebhook':
+            self.webhook_url = data.get('url')
+            self.webhook_secret = data.get('secret_token')
+        elif method == 'deleteWebhook':
+            self.webhook_url = None
+        self.record(method, data)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return web.json_response({'ok': True, 'result': self.make_result(method, data)})
+
+    async def get_updates(self, data):
+        """Long polling: отдает накопленные обновления или ждет первого до таймаута запроса"""
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), float(data.get('timeout') or 0) or 0.01))
+        except asyncio.TimeoutError:
+            pass
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        self.record('getUpdates', data)
+        return web.json_response({'ok': True, 'result': updates})
+
+    async def push_update(self, **update):
+        """Доставляет обновление боту: на webhook, если он установлен, иначе в очередь getUpdates"""
+        update = dict(update, update_id=next(self.update_ids))
+        if self.webhook_url is None:
+            await self.updates.put(update)
+            return
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret or ''}
+        async with self.http.post(self.webhook_url, json=update, headers=headers) as response:
+            if response.content_type == 'application/json':
+                answer = await response.json()
+                if answer.get('method'):
+                    self.record(answer['method'], answer)
+
+    def make_callback_update(self, user_id, data, message_id=1):
+        """Нажатие кнопки пользователем в личном чате с ботом"""
+        user = {'id': user_id, 'is_bot': False, 'first_name': 'Moderator'}
+        return {'callback_query': {
+            'id': str(next(self.message_ids)),
+            'from': user,
+            'chat_instance': '1',
+            'data': data,
+            'message': {
+                'message_id': message_id, 'date': int(time.time()), 'text': 'news',
+                'chat': {'id': user_id, 'type': 'private'}, 'from': BOT_USER,
+            },
+        }}
@@ -0,0 +1,151 @@
+"""
+Синтетические сообщения каналов для замеров без Telegram.
+
+Сообщения и события повторяют то, что парсер читает у объектов Telethon: текст, медиа (настоящие
+MessageMediaPhoto и MessageMediaDocument), части альбома, дату и канал. FakeTelethonClient "скачивает"
+медиа, записывая файл нужного размера с задержкой, зависящей от размера.
+"""
+import asyncio
+import itertools
+import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon.tl.types import (
+    MessageMediaPhoto, MessageMediaDocument, Photo, Document, DocumentAttributeFilename, PeerChannel
+)
+
+# Доли типов постов по умолчанию; также доступен тип album
+DEFAULT_MIX = {'text': 0.6, 'photo': 0.3, 'document': 0.1}
+
+ALPHABET = 'абвгдежзиклмнопрстуфхцчшэюя'
+
+
+def make_photo(media_id, size):
+    photo = Photo(id=media_id, access_hash=media_id, file_reference=b'', date=None, sizes=[], dc_id=2)
+    # Размер не входит в Photo, а нужен заглушке клиента для "скачивания"
+    photo.bench_size = size
+    return MessageMediaPhoto(photo=photo)
+
+
+def make_document(media_id, size, file_name='report.pdf', mime_type='application/pdf'):
+    """Документ; без file_name - без DocumentAttributeFilename, как видео, голосовые и кружки"""
+    attributes = [DocumentAttributeFilename(file_name=file_name)] if file_name else []
+    document = Document(
+        id=media_id, access_hash=media_id, file_reference=b'', date=None, mime_type=mime_type, size=size, dc_id=2,
+        attributes=attributes
+    )
+    return MessageMediaDocument(document=document)
+
+
+def get_media_size(media):
+    if isinstance(media, MessageMediaPhoto):
+        return media.photo.bench_size
+    if isinstance(media, MessageMediaDocument):
+        return media.document.size
+    return 0
+
+
+def make_message(channel_id, message_id, text, media=None, grouped_id=None, date=None):
+    """Сообщение канала с полями, которые использует парсер"""
+    return SimpleNamespace(
+        id=message_id, text=text, message=text, media=media, grouped_id=grouped_id,
+        date=date or datetime.now(timezone.utc), peer_id=PeerChannel(channel_id)
+    )
+
+
+def make_event(message, username, title=None):
+    """Событие NewMessage: канал приходит вместе с обновлением, как обычно бывает в Telegram"""
+    channel_id = message.peer_id.channel_id
+    chat = SimpleNamespace(id=channel_id, username=username, title=title or username, access_hash=channel_id)
+
+    async def get_chat():
+        return chat
+
+    return SimpleNamespace(message=message, chat=chat, chat_id=channel_id, get_chat=get_chat)
+
+
+class FakeTelethonClient:
+    """Клиент, скачивающий медиа с задержкой latency + размер / bandwidth"""
+
+    def __init__(self, latency=0.05, bandwidth=20 * 1024 * 1024):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.downloads = 0
+
+    async def download_media(self, message, path):
+        size = get_media_size(message.media)
+        await asyncio.sleep(self.latency + size / self.bandwidth)
+        # Содержимое зависит от ID медиа, чтобы разные файлы не совпадали по хешу
+        header = f'{message.media!r}'.encode()[:size]
+        with open(path, 'wb') as file:
+            file.write(header)
+            file.truncate(size)
+        self.downloads += 1
+        return path
+
+    def is_connected(self):
+        return False
+
+
+class EventGenerator:
+    """
+    Поток постов из нескольких каналов с заданной частотой и долями типов постов.
+    Каждый пост содержит метку bench-<номер>, по которой замер находит его в вызовах Bot API.
+    """
+
+    def __init__(self, channels=5, rate=50.0, mix=None, photo_size=200 * 1024, document_size=2 * 1024 * 1024,
+                 seed=1):
+        self.channels = [(1000 + number, f'bench_channel{number}') for number in range(channels)]
+        self.rate = rate  # Постов в секунду; 0 - без пауз
+        self.mix = mix or DEFAULT_MIX
+        self.photo_size = photo_size
+        self.document_size = document_size
+        self.random = random.Random(seed)
+        self.message_ids = itertools.count(1)
+        self.media_ids = itertools.count(10 ** 6)
+        self.grouped_ids = itertools.count(10 ** 9)
+        # Большой словарь, чтобы посты не считались повторами друг друга
+        self.words = [
+            ''.join(self.random.choice(ALPHABET) for _ in range(self.random.randint(3, 10))) for _ in range(5000)
+        ]
+
+    def make_post(self, number):
+        """События поста номер number (у альбома - по одному на часть) и его тип"""
+        channel_id, username = self.channels[number % len(self.channels)]
+        kind = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        text = f'bench-{number} ' + ' '.join(self.random.choices(self.words, k=self.random.randint(10, 60)))
+        if kind == 'album':
+            grouped_id = next(self.grouped_ids)
+            messages = [
+                make_message(
+                    channel_id, next(self.message_ids), text if position == 0 else '',
+                    make_photo(next(self.media_ids), self.photo_size), grouped_id
+                )
+                for position in range(self.random.randint(2, 5))
+            ]
+            return [make_event(message, username) for message in messages], kind
+        media = None
+        if kind == 'photo':
+            media = make_photo(next(self.media_ids), self.photo_size)
+        elif kind == 'document':
+            # Половина документов без имени файла: парсер подбирает его по MIME-типу
+            if self.random.random() < 0.5:
+                media = make_document(next(self.media_ids), self.document_size)
+            else:
+                media = make_document(next(self.media_ids), self.document_size, None, 'video/mp4')
+        message = make_message(channel_id, next(self.message_ids), text, media)
+        return [make_event(message, username)], kind
+
+    async def generate(self, posts):
+        """Выдает (номер, события поста, тип) с частотой rate постов в секунду"""
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        for number in range(posts):
+            if self.rate:
+                # Пуассоновский поток: паузы между постами случайны, как в настоящих каналах
+                due += self.random.expovariate(self.rate)
+                if due > loop.time():
+                    await asyncio.sleep(due - loop.time())
+            events, kind = self.make_post(number)
+            yield number, events, kind
@@ -0,0 +1,88 @@
+"""
+Замер записи новостей в базу: по одной новости на транзакцию (как парсер писал раньше)
+и пачками через IngestBuffer. Новости приходят одновременно из N задач, как при всплеске постов.
+
+    python benchmarks/ingest_buffer.py [--posts 2000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# База для замера создается во временной директории, рабочая база не затрагивается
+DB_DIR = tempfile.mkdtemp(prefix='ingest_bench_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_async_session, init_db_async, insert_news_ignore, update_channel_state  # noqa: E402
+from ingest_buffer import IngestBuffer  # noqa: E402
+
+
+def make_values(channel, message_id):
+    content = f'Новость {message_id} из канала {channel}: ' + 'текст новости ' * 20
+    return dict(
+        source_channel=channel,
+        message_id=message_id,
+        content=content,
+        original_content=content,
+        has_media=False,
+        media_type=None,
+        media_name=None,
+        media_status=None,
+        telegram_media_id=None,
+    )
+
+
+async def save_one(values):
+    """Запись одной новости отдельной транзакцией"""
+    async with get_async_session() as session:
+        await insert_news_ignore(session, values)
+        await update_channel_state(session, values['source_channel'], values['message_id'])
+        await session.commit()
+
+
+async def run(name, save, posts, concurrency, offset):
+    queue = asyncio.Queue()
+    for i in range(posts):
+        queue.put_nowait(make_values(f'channel{i % 10}', offset + i))
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            values = queue.get_nowait()
+            started = time.perf_counter()
+            await save(values)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{name:<14} {posts / elapsed:10.0f} постов/с   p50 {p50:7.1f} мс   p99 {p99:7.1f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    await init_db_async()
+    print(f"{args.posts} постов, {args.concurrency} одновременных задач, база {os.environ['DATABASE_URL']}")
+
+    await run('по одной', save_one, args.posts, args.concurrency, 0)
+
+    buffer = IngestBuffer()
+    await run('IngestBuffer', buffer.submit, args.posts, args.concurrency, args.posts)
+    await buffer.close()
+    stats = buffer.get_stats()
+    print(f"пачек: {stats['batches']}, средний размер пачки: {stats['avg_batch_size']:.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,315 @@
+"""
+Сквозной замер без Telegram: посты каналов -> парсер (process_message) -> рассылка модераторам
+ботом -> одобрение -> публикация в канал. Посты генерирует fake_telethon.py, Bot API заменяет
+fake_telegram.py с задержкой ответа и долей ответов 429.
+
+Выводит пропускную способность и задержки p50/p99 каждого этапа и потребление памяти.
+Запускать перед обновлением зависимостей и после изменений в парсере или боте:
+
+    python benchmarks/pipeline.py [--posts 500] [--rate 50] [--mix text=0.6,photo=0.3,document=0.1]
+                                  [--api-delay 0.03] [--rate-limit-ratio 0.01] [--telegram-limits]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+FAKE_PORT = 8091
+TARGET_CHANNEL = '-1001'
+
+# Настройки задаются до импорта парсера и бота: config читает их при импорте
+WORK_DIR = tempfile.mkdtemp(prefix='pipeline_bench_')
+
+
+def configure(moderators, telegram_limits):
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}",
+        CHANNEL_CACHE_PATH=os.path.join(WORK_DIR, 'channel_cache.json'),
+        BOT_TOKEN='123456:FAKE',
+        BOT_API_URL=f'http://127.0.0.1:{FAKE_PORT}',
+        MODERATOR_IDS=','.join(str(moderator_id) for moderator_id in range(1, moderators + 1)),
+        TARGET_CHANNEL=TARGET_CHANNEL,
+        CAPTURE_PATH='',
+    )
+    if not telegram_limits:
+        # Без лимитов Telegram замер показывает скорость самого кода
+        os.environ.update(
+            RATE_LIMIT_GLOBAL_PER_SECOND='100000',
+            RATE_LIMIT_CHAT_PER_SECOND='100000',
+            RATE_LIMIT_CHAT_BURST='100000',
+            RATE_LIMIT_GROUP_PER_MINUTE='10000000',
+            RATE_LIMIT_GROUP_BURST='100000',
+        )
+    # Хранилище медиа создается в текущей директории
+    os.chdir(WORK_DIR)
+    # Модули проекта раньше модулей замеров: benchmarks/ingest_buffer.py не должен заменить ingest_buffer.py
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Метка поста в тексте, по которой он находится в вызовах Bot API
+TOKEN = re.compile(r'bench-(\d+)\b')
+
+MEDIA_METHODS = ('sendPhoto', 'sendDocument', 'sendMediaGroup')
+
+
+class CallIndex:
+    """Разбирает вызовы заглушки Bot API по мере поступления: когда какой пост дошел до каких чатов"""
+
+    def __init__(self, fake, moderator_ids):
+        self.fake = fake
+        self.moderator_ids = {str(moderator_id) for moderator_id in moderator_ids}
+        self.position = 0
+        self.notified = {}  # Номер поста -> {модератор: время первого сообщения}
+        self.media_notified = {}  # Номер поста -> {модератор: время сообщения с медиа}
+        self.published = {}  # Номер поста -> время публикации
+
+    def update(self):
+        calls = self.fake.calls
+        while self.position < len(calls):
+            sent_at, method, data = calls[self.position]
+            self.position += 1
+            chat_id = str(data.get('chat_id'))
+            match = TOKEN.search(str(data))
+            if match is None:
+                continue
+            number = int(match.group(1))
+            if chat_id == TARGET_CHANNEL:
+                self.published.setdefault(number, sent_at)
+            elif chat_id in self.moderator_ids:
+                self.notified.setdefault(number, {}).setdefault(chat_id, sent_at)
+                if method in MEDIA_METHODS:
+                    self.media_notified.setdefault(number, {}).setdefault(chat_id, sent_at)
+
+    def count_complete(self, table, numbers):
+        self.update()
+        return sum(1 for number in numbers if len(table.get(number, ())) == len(self.moderator_ids))
+
+
+def percentiles(values):
+    if not values:
+        return "нет данных"
+    values = sorted(values)
+    p50 = values[len(values) // 2] * 1000
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+    return f"p50 {p50:8.1f} мс   p99 {p99:8.1f} мс"
+
+
+def get_rss_mb():
+    """Пиковый размер процесса в памяти (ru_maxrss в Linux - в КБ)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def wait_until(check, timeout):
+    """Ждет, пока check() (функция или корутина) не вернет истину; False по таймауту"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        result = check()
+        if asyncio.iscoroutine(result):
+            result = await result
+        if result:
+            return True
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, share = part.partition('=')
+        mix[kind.strip()] = float(share)
+    return mix
+
+
+async def run_pipeline(args, posts, title):
+    """
+    Прогоняет посты через парсер и бота и печатает отчет.
+    posts - асинхронный итератор (номер поста, события Telethon); номер поста должен быть в тексте как bench-<номер>.
+    """
+    import bot as moderation_bot
+    from database import get_async_session, init_db_async, News, MEDIA_PENDING, MEDIA_READY, MEDIA_ALBUM
+    from fake_telegram import FakeTelegram
+    from fake_telethon import FakeTelethonClient
+    from parser import NewsParser
+    from rate_limiter import get_rate_limiter
+    from sqlalchemy import select, func
+
+    await init_db_async()
+    fake = await FakeTelegram(
+        port=FAKE_PORT, delay=args.api_delay, rate_limit_ratio=args.rate_limit_ratio, retry_after=args.retry_after
+    ).start()
+    moderator_ids = list(range(1, args.moderators + 1))
+    index = CallIndex(fake, moderator_ids)
+
+    parser = NewsParser()
+    parser.client = FakeTelethonClient(latency=args.download_latency, bandwidth=args.bandwidth)
+    parser.start_workers()
+    events_task = asyncio.create_task(moderation_bot.process_parser_events())
+    ready = fake.expect(lambda method, data: method == 'getUpdates')
+    polling_task = asyncio.create_task(moderation_bot.run_polling())
+    await asyncio.wait_for(ready, 30)
+
+    async def load_news():
+        """Сохраненные новости по номеру поста: (ID, повтор ли, ждет ли модератор отдельное сообщение с медиа)"""
+        async with get_async_session() as session:
+            rows = (await session.execute(
+                select(News.id, News.content, News.duplicate_of, News.media_type, News.media_status)
+            )).all()
+        news = {}
+        for news_id, content, duplicate_of, media_type, media_status in rows:
+            match = TOKEN.search(content)
+            if match:
+                has_media_message = media_type != MEDIA_ALBUM and media_status == MEDIA_READY
+                news[int(match.group(1))] = (news_id, duplicate_of is not None, has_media_message)
+        return news
+
+    rss_before = get_rss_mb()
+    injected = {}
+    handlers = set()
+    try:
+        # Этап 1: посты приходят из источника и рассылаются модераторам
+        print(f"{title}, {args.moderators} модератора, задержка Bot API {args.api_delay * 1000:.0f} мс, "
+              f"429 на {args.rate_limit_ratio:.1%} отправок")
+        started = time.perf_counter()
+        async for number, events in posts:
+            injected.setdefault(number, time.perf_counter())
+            for event in events:
+                # Telethon обрабатывает каждое обновление в отдельной задаче
+                task = asyncio.create_task(parser.process_message(event))
+                handlers.add(task)
+                task.add_done_callback(handlers.discard)
+        await asyncio.gather(*handlers)
+        # Альбомы сохраняются после окна сбора частей
+        await asyncio.gather(*(album['task'] for album in list(parser.albums.values())), return_exceptions=True)
+
+        # Повторы модераторам не отправляются, пустые сообщения не сохраняются - их не ждем
+        numbers = [number for number, (_, duplicate, _) in (await load_news()).items() if not duplicate]
+        if not await wait_until(lambda: index.count_complete(index.notified, numbers) == len(numbers), args.timeout):
+            print(f"Не дождались рассылки {len(numbers) - index.count_complete(index.notified, numbers)} новостей")
+
+        # Новость с недокачанным медиа одобрить нельзя, поэтому дожидаемся загрузок
+        async def downloads_finished():
+            async with get_async_session() as session:
+                return not await session.scalar(select(func.count(News.id)).where(News.media_status == MEDIA_PENDING))
+
+        if not await wait_until(downloads_finished, args.timeout):
+            print("Не дождались скачивания всех медиа")
+        news = await load_news()
+        media_numbers = [number for number in numbers if news[number][2]]
+        if not await wait_until(
+            lambda: index.count_complete(index.media_notified, media_numbers) == len(media_numbers), args.timeout
+        ):
+            print(f"Не дождались медиа {len(media_numbers) - index.count_complete(index.media_notified, media_numbers)} "
+                  f"новостей")
+
+        notified = {
+            number: max(index.notified[number].values())
+            for number in numbers if len(index.notified.get(number, ())) == len(moderator_ids)
+        }
+        notify_latencies = [notified_at - injected[number] for number, notified_at in notified.items()]
+        media_latencies = [
+            max(index.media_notified[number].values()) - injected[number]
+            for number in media_numbers if len(index.media_notified.get(number, ())) == len(moderator_ids)
+        ]
+        elapsed = max(max(notified.values(), default=started) - started, 1e-6)
+        print(f"постов: {len(injected)}, новостей: {len(news)}, из них повторов: {len(news) - len(numbers)}")
+        print(f"рассылка модераторам:  {len(notify_latencies) / elapsed:8.1f} постов/с   {percentiles(notify_latencies)}")
+        print(f"медиа модераторам:     {'':8} {'':7}   {percentiles(media_latencies)}")
+
+        # Этап 2: модератор одобряет все новости, бот публикует их в канал
+        approved = {}
+        started = time.perf_counter()
+        for number in numbers:
+            approved[number] = time.perf_counter()
+            await fake.push_update(**fake.make_callback_update(moderator_ids[0], f'approve_{news[number][0]}'))
+            if args.approve_rate:
+                await asyncio.sleep(1 / args.approve_rate)
+
+        await wait_until(lambda: (index.update(), len(index.published) >= len(numbers))[1], args.timeout)
+        publish_latencies = [index.published[number] - approved[number] for number in approved if number in index.published]
+        elapsed = max(max(index.published.values(), default=started) - started, 1e-6)
+        print(f"публикация:            {len(publish_latencies) / elapsed:8.1f} постов/с   {percentiles(publish_latencies)}")
+        if len(publish_latencies) < len(numbers):
+            print(f"Не опубликовано: {len(numbers) - len(publish_latencies)} из {len(numbers)}")
+
+        download_stats = parser.get_download_stats()
+        ingest_stats = parser.ingest.get_stats()
+        rate_stats = get_rate_limiter().get_stats()
+        print(f"скачано медиа: {download_stats['completed']}, {download_stats['bytes'] / 1024 / 1024:.1f} МБ; "
+              f"средняя пачка записи в базу: {ingest_stats['avg_batch_size']:.1f}; "
+              f"ответов 429: {fake.rate_limited}, повторов: {rate_stats['retries_429']}, "
+              f"ожидание в ограничителе: {rate_stats['total_wait_seconds']:.1f} с")
+        print(f"память: пик {get_rss_mb():.0f} МБ, рост за замер {get_rss_mb() - rss_before:.0f} МБ")
+        if args.tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            print(f"tracemalloc: сейчас {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ")
+    finally:
+        moderation_bot.dp.stop_polling()
+        events_task.cancel()
+        await asyncio.gather(polling_task, events_task, return_exceptions=True)
+        await parser.stop()
+        await (await moderation_bot.bot.get_session()).close()
+        await fake.stop()
+
+
+def add_common_arguments(parser):
+    """Параметры модераторов, заглушек Telegram и вывода, общие для замеров через run_pipeline"""
+    parser.add_argument('--moderators', type=int, default=2)
+    parser.add_argument('--download-latency', type=float, default=0.05, help='задержка начала скачивания медиа, с')
+    parser.add_argument('--bandwidth', type=float, default=20 * 1024 * 1024, help='скорость скачивания, байт/с')
+    parser.add_argument('--api-delay', type=float, default=0.03, help='задержка ответа Bot API, с')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='доля отправок с ответом 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after в ответе 429, с')
+    parser.add_argument('--telegram-limits', action='store_true', help='оставить лимиты Telegram в ограничителе')
+    parser.add_argument('--approve-rate', type=float, default=0, help='одобрений в секунду, 0 - все сразу')
+    parser.add_argument('--timeout', type=float, default=300, help='сколько ждать завершения этапа, с')
+    parser.add_argument('--tracemalloc', action='store_true', help='считать память Python (замедляет замер)')
+    parser.add_argument('--verbose', action='store_true', help='выводить логи парсера и бота')
+
+
+def setup(args):
+    """Настраивает окружение до импорта парсера и бота"""
+    configure(args.moderators, args.telegram_limits)
+    # Парсер и бот настраивают логирование при импорте; уровень меняется после него
+    import bot, parser as news_parser  # noqa: F401
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+
+async def run(args):
+    from fake_telethon import EventGenerator
+
+    generator = EventGenerator(
+        channels=args.channels, rate=args.rate, mix=parse_mix(args.mix),
+        photo_size=args.photo_size, document_size=args.document_size
+    )
+    posts = ((number, events) async for number, events, _ in generator.generate(args.posts))
+    title = f"{args.posts} постов ({args.mix}), {args.rate or 'без ограничения'} постов/с"
+    await run_pipeline(args, posts, title)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=50, help='постов в секунду, 0 - все сразу')
+    parser.add_argument('--mix', default='text=0.6,photo=0.3,document=0.1',
+                        help='доли типов постов: text, photo, document, album')
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--photo-size', type=int, default=200 * 1024, help='байт')
+    parser.add_argument('--document-size', type=int, default=2 * 1024 * 1024, help='байт')
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup(args)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
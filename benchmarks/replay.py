@@ -0,0 +1,123 @@
+"""
+Воспроизведение записанного трафика каналов через парсер и бота без Telegram.
+
+Запись делает парсер, если задан CAPTURE_PATH: каждое входящее сообщение (и правка) сохраняется
+в сжатый файл JSON-строк с временем получения, текстом, частью альбома и типом, ID и размером медиа.
+Здесь сообщения подаются в process_message с исходными паузами, ускоренными в --speed раз
+(0 - без пауз), медиа "скачивается" с размером из записи, а Bot API заменяет локальная заглушка.
+Отчет тот же, что у pipeline.py.
+
+    python benchmarks/replay.py capture.jsonl.gz [--speed 1|10|0] [--api-delay 0.03] [--rate-limit-ratio 0.01]
+
+Правки постов записываются, но при воспроизведении пропускаются: парсер их не обрабатывает.
+В текст каждого поста добавляется метка bench-<номер>, по которой замер находит его в вызовах Bot API.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import add_common_arguments, setup, run_pipeline  # noqa: E402
+
+# Медиа без известного размера "скачивается" файлом такого размера, байт
+MIN_MEDIA_SIZE = 1024
+
+
+def load_posts(path):
+    """
+    Новые сообщения записи по времени получения с номерами постов (у частей альбома номер общий)
+    и текстом с меткой поста. Возвращает (список (время, номер, запись, текст), число правок).
+    """
+    from capture import read_capture, EVENT_NEW
+
+    records = sorted(read_capture(path), key=lambda record: record['t'])
+    messages = [record for record in records if record['event'] == EVENT_NEW]
+    # Метка ставится в подпись альбома, а если подписи нет ни у одной части - в первую часть
+    albums_with_text = {
+        (record['channel_id'], record['grouped_id']) for record in messages if record['grouped_id'] and record['text']
+    }
+    numbers = {}
+    posts = []
+    for record in messages:
+        album = (record['channel_id'], record['grouped_id']) if record['grouped_id'] else None
+        key = album or ('message', record['channel_id'], record['id'])
+        first_part = key not in numbers
+        number = numbers.setdefault(key, len(numbers))
+        text = record['text']
+        if text or album is None or (first_part and album not in albums_with_text):
+            text = f"bench-{number} {text}"
+        posts.append((record['t'], number, record, text))
+    return posts, len(records) - len(messages)
+
+
+def make_replay_event(record, text):
+    from fake_telethon import make_photo, make_document, make_message, make_event
+    from telethon.tl.types import MessageMediaWebPage, MessageMediaUnsupported, WebPageEmpty
+
+    media = None
+    description = record['media']
+    if description is not None:
+        size = max(description.get('size') or 0, MIN_MEDIA_SIZE)
+        if description['type'] == 'photo':
+            media = make_photo(description['id'], size)
+        elif description['type'] == 'document':
+            media = make_document(
+                description['id'], size, description.get('file_name'),
+                description.get('mime_type') or 'application/octet-stream'
+            )
+        elif description['type'] == 'webpage':
+            media = MessageMediaWebPage(webpage=WebPageEmpty(id=0))
+        else:
+            media = MessageMediaUnsupported()
+    # Время поста - момент воспроизведения, как у живого сообщения
+    message = make_message(
+        record['channel_id'], record['id'], text, media, record['grouped_id'], datetime.now(timezone.utc)
+    )
+    return make_event(message, record['username'], record['title'])
+
+
+async def replay(posts, speed):
+    """Выдает (номер поста, [событие]) с исходными паузами, ускоренными в speed раз"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first = posts[0][0] if posts else 0
+    for received_at, number, record, text in posts:
+        if speed:
+            due = started + (received_at - first) / speed
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+        yield number, [make_replay_event(record, text)]
+
+
+def describe(posts, edits):
+    media = [record['media'] for _, _, record, _ in posts if record['media']]
+    albums = {(record['channel_id'], record['grouped_id']) for _, _, record, _ in posts if record['grouped_id']}
+    duration = posts[-1][0] - posts[0][0] if posts else 0
+    size = sum(item.get('size') or 0 for item in media)
+    return (f"запись: {len(posts)} сообщений за {duration:.0f} с, альбомов {len(albums)}, "
+            f"медиа {len(media)} ({size / 1024 / 1024:.1f} МБ), правок {edits} (пропускаются)")
+
+
+async def run(args):
+    posts, edits = load_posts(args.capture)
+    title = f"{describe(posts, edits)}; скорость {f'x{args.speed:g}' if args.speed else 'максимальная'}"
+    await run_pipeline(args, replay(posts, args.speed), title)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='файл записи (CAPTURE_PATH)')
+    parser.add_argument('--speed', type=float, default=1, help='ускорение пауз между сообщениями, 0 - без пауз')
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    args.capture = os.path.abspath(args.capture)
+    setup(args)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
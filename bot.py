@@ -1,15 +1,36 @@
 import os
+import re
+import html
+import time
 import asyncio
 import logging
-import mimetypes
+import secrets
+import aiohttp
+from datetime import datetime, timezone
+from aiohttp import web
 from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils.exceptions import BadRequest, RetryAfter
 
-from config import BOT_TOKEN, MODERATOR_IDS, TARGET_CHANNEL
-from database import get_session, News, init_db
+import metrics
+from config import (
+    BOT_TOKEN, MODERATOR_IDS, TARGET_CHANNEL, BOT_API_URL, BOT_API_CONNECTION_LIMIT, BOT_API_CONNECT_TIMEOUT,
+    BOT_API_TIMEOUT, NOTIFY_CONCURRENCY, IPC_MAX_IN_FLIGHT, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST,
+    WEBHOOK_PORT, WEBHOOK_SECRET, QUEUE_PAGE_SIZE, QUEUE_PREVIEW_LENGTH
+)
+from database import (
+    get_async_session, News, init_db_async, set_media_file_id, set_album_file_ids, get_news_stats,
+    get_review_queue_page, count_review_queue, review_news_bulk, QUEUE_MEDIA_TYPES, MEDIA_PENDING,
+    MEDIA_READY
+)
+from ipc import get_news_channel, NEWS_SAVED, NEWS_MEDIA_READY, NEWS_MEDIA_FAILED
+from rate_limiter import get_rate_limiter, TooManyRequests
+from webhook import create_webhook_app, answer_in_response
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,12 +39,107 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = Bot(token=BOT_TOKEN)
+bot_api_request_seconds = metrics.histogram(
+    'bot_api_request_seconds', 'Время запроса к Bot API без ожидания в ограничителе частоты', ['method']
+)
+bot_api_errors = metrics.counter('bot_api_errors_total', 'Запросы к Bot API, завершившиеся ошибкой', ['method'])
+update_seconds = metrics.histogram('bot_update_seconds', 'Время обработки обновления диспетчером', ['type'])
+notify_latency_seconds = metrics.histogram(
+    'news_notify_latency_seconds', 'От публикации поста в канале-источнике до рассылки модераторам'
+)
+notify_fanout_seconds = metrics.histogram(
+    'news_notify_fanout_seconds', 'Рассылка одной новости всем модераторам, включая загрузку файла'
+)
+approve_publish_seconds = metrics.histogram(
+    'news_approve_publish_seconds', 'От нажатия "Одобрить" до публикации в целевом канале'
+)
+queue_depth = metrics.gauge('queue_depth', 'Глубина внутренних очередей', ['queue'])
+rate_limit_delayed = metrics.counter('rate_limit_delayed_total', 'Запросы, задержанные ограничителем частоты')
+rate_limit_wait_seconds = metrics.counter('rate_limit_wait_seconds_total', 'Суммарное ожидание в ограничителе частоты')
+rate_limit_retries = metrics.counter('rate_limit_retries_total', 'Повторы после ответа 429')
+
+
+class RateLimitedBot(Bot):
+    """Бот, все запросы которого к чатам проходят через общий с парсером ограничитель частоты"""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        chat_id = (data or {}).get('chat_id')
+        if chat_id is None:
+            # Запросы без чата (ответы на callback, getMe) под лимиты отправки сообщений не попадают
+            return await self.timed_request(method, data, files, **kwargs)
+        
+        async def send():
+            # При повторе после 429 файлы нужно отправлять с начала. aiohttp закрывает файл после
+            # отправки, поэтому закрытый файл открывается заново по его пути
+            attempt_files = {}
+            reopened = []
+            for key, file in (files or {}).items():
+                source = file.file if isinstance(file, types.InputFile) else file
+                if getattr(source, 'closed', False) and getattr(source, 'name', None):
+                    reopened.append(open(source.name, 'rb'))
+                    filename = file.filename if isinstance(file, types.InputFile) else os.path.basename(source.name)
+                    file = (filename, reopened[-1])
+                elif hasattr(source, 'seek'):
+                    source.seek(0)
+                attempt_files[key] = file
+            try:
+                return await self.timed_request(method, data, attempt_files or files, **kwargs)
+            except RetryAfter as e:
+                raise TooManyRequests(e.timeout) from e
+            finally:
+                for file in reopened:
+                    file.close()
+        
+        return await get_rate_limiter().call(chat_id, send)
+
+    async def timed_request(self, method, data=None, files=None, **kwargs):
+        """Запрос к Bot API с замером времени и учетом ошибок по методу"""
+        started = time.monotonic()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            bot_api_errors.inc(method=method)
+            raise
+        finally:
+            bot_api_request_seconds.observe(time.monotonic() - started, method=method)
+
+
+# Инициализация бота: все сообщения в Telegram отправляются через его пул соединений
+bot = RateLimitedBot(
+    token=BOT_TOKEN,
+    server=TelegramAPIServer.from_base(BOT_API_URL),
+    connections_limit=BOT_API_CONNECTION_LIMIT,
+    timeout=aiohttp.ClientTimeout(total=BOT_API_TIMEOUT, connect=BOT_API_CONNECT_TIMEOUT)
+)
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
 
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Замеряет время обработки каждого обновления по его типу (message, callback_query)"""
+
+    UPDATE_TYPES = ('message', 'callback_query', 'edited_message', 'channel_post', 'edited_channel_post')
+
+    async def on_pre_process_update(self, update, data):
+        data['update_started'] = time.monotonic()
+
+    async def on_post_process_update(self, update, result, data):
+        started = data.get('update_started')
+        if started is None:
+            return
+        update_type = next((name for name in self.UPDATE_TYPES if getattr(update, name) is not None), 'other')
+        update_seconds.observe(time.monotonic() - started, type=update_type)
+
+
+dp.middleware.setup(UpdateTimingMiddleware())
+
+
+async def answer_callback(callback_query, text=None, show_alert=None):
+    """Отвечает на нажатие кнопки; в режиме webhook ответ уходит в ответе на запрос Telegram, без отдельного запроса"""
+    if not answer_in_response(callback_query.id, text, show_alert):
+        await bot.answer_callback_query(callback_query.id, text, show_alert=show_alert)
+
+
 class ReviewStates(StatesGroup):
     waiting_for_review = State()
     waiting_for_edit_text = State()
@@ -56,13 +172,15 @@ async def cmd_help(message: types.Message):
         "<b>Доступные команды:</b>\n"
         "/start - Запуск бота\n"
         "/help - Показать справку\n"
-        "/stats - Статистика модерации\n\n"
+        "/stats - Статистика модерации\n"
+        "/queue [канал] [text|photo|document|album] - Очередь непроверенных новостей\n\n"
         "<b>Действия с новостями:</b>\n"
         "✅ <i>Одобрить</i> - Новость будет опубликована в целевой канал\n"
         "✏️ <i>Редактировать</i> - Изменить текст новости перед публикацией\n"
         "✏️ <i>Редактировать (опубликованную)</i> - Изменить текст уже опубликованной новости\n"
         "🔄 <i>Восстановить оригинал</i> - Вернуть текст новости к исходному состоянию\n"
-        "🗑️ <i>Удалить</i> - Удалить опубликованную новость из канала (она вернется в очередь на публикацию)\n\n"
+        "🗑️ <i>Удалить</i> - Удалить опубликованную новость из канала (она вернется в очередь на публикацию)\n"
+        "⬜ <i>Отметить</i> (в /queue) - Одобрить или отклонить отмеченные, всю страницу или весь канал одним действием\n\n"
         "Новости публикуются в канал <b>{}</b>".format(TARGET_CHANNEL),
         parse_mode="HTML"
     )
@@ -75,20 +193,27 @@ async def cmd_stats(message: types.Message):
         await message.reply("У вас нет доступа к этому боту.")
         return
     
-    session = get_session()
-    
-    # Получаем статистику
-    total_news = session.query(News).count()
-    published_news = session.query(News).filter(News.is_published == True).count()
-    pending_news = session.query(News).filter(News.is_published == False).count()
+    # Счетчики ведутся базой при вставке и изменении новостей, поэтому запрос не зависит от размера архива
+    async with get_async_session() as session:
+        stats = await get_news_stats(session)
     
     # Формируем сообщение со статистикой
     stats_message = (
         "📊 <b>Статистика модерации</b>\n\n"
-        f"Всего новостей: <b>{total_news}</b>\n"
-        f"Опубликовано: <b>{published_news}</b>\n"
-        f"Ожидает публикации: <b>{pending_news}</b>\n"
+        f"Всего новостей: <b>{stats['total']}</b>\n"
+        f"Просмотрено: <b>{stats['reviewed']}</b>\n"
+        f"Опубликовано: <b>{stats['published']}</b>\n"
+        f"Ожидает публикации: <b>{stats['pending']}</b>\n"
     )
+    if stats['channels']:
+        stats_message += "\n<b>По каналам:</b>\n" + "".join(
+            f"{channel}: {row['total']} (опубликовано {row['published']})\n"
+            for channel, row in stats['channels']
+        )
+    if stats['days']:
+        stats_message += "\n<b>По дням:</b>\n" + "".join(
+            f"{day}: {row['total']} (опубликовано {row['published']})\n" for day, row in stats['days']
+        )
     
     await message.reply(stats_message, parse_mode="HTML")
 
@@ -98,7 +223,7 @@ async def process_edit_callback(callback_query: types.CallbackQuery, state: FSMC
     """Обрабатывает запрос на редактирование новости"""
     user_id = callback_query.from_user.id
     if user_id not in MODERATOR_IDS:
-        await bot.answer_callback_query(callback_query.id, "У вас нет доступа.")
+        await answer_callback(callback_query, "У вас нет доступа.")
         return
     
     # Получаем ID новости из callback_data
@@ -112,11 +237,11 @@ async def process_edit_callback(callback_query: types.CallbackQuery, state: FSMC
     else:
         news_id = int(callback_data.split('_')[1])
     
-    session = get_session()
-    news = session.query(News).filter(News.id == news_id).first()
+    async with get_async_session() as session:
+        news = await session.get(News, news_id)
     
     if not news:
-        await bot.answer_callback_query(callback_query.id, "Новость не найдена.")
+        await answer_callback(callback_query, "Новость не найдена.")
         return
     
     # Сохраняем ID новости, флаг опубликованной новости и ID сообщения в состоянии
@@ -131,7 +256,7 @@ async def process_edit_callback(callback_query: types.CallbackQuery, state: FSMC
     await ReviewStates.waiting_for_edit_text.set()
     
     # Отвечаем на callback
-    await bot.answer_callback_query(callback_query.id)
+    await answer_callback(callback_query)
     
     # Отправляем сообщение с просьбой ввести новый текст
     edit_type = "опубликованной " if is_published_edit else ""
@@ -150,32 +275,32 @@ async def process_restore_original(callback_query: types.CallbackQuery):
     """Обрабатывает запрос на восстановление оригинального текста новости"""
     user_id = callback_query.from_user.id
     if user_id not in MODERATOR_IDS:
-        await bot.answer_callback_query(callback_query.id, "У вас нет доступа.")
+        await answer_callback(callback_query, "У вас нет доступа.")
         return
     
     # Получаем ID новости из callback_data
     news_id = int(callback_query.data.split('_')[2])
     
-    session = get_session()
-    news = session.query(News).filter(News.id == news_id).first()
-    
-    if not news:
-        await bot.answer_callback_query(callback_query.id, "Новость не найдена.")
-        return
-    
-    if not news.original_content:
-        await bot.answer_callback_query(callback_query.id, "Оригинальный текст не найден.")
-        return
-    
-    # Получаем оригинальный текст и текущий текст для информирования
-    old_content = news.content
-    original_content = news.original_content
-    
-    # Восстанавливаем оригинальный текст
-    news.content = original_content
-    session.commit()
+    async with get_async_session() as session:
+        news = await session.get(News, news_id)
+        
+        if not news:
+            await answer_callback(callback_query, "Новость не найдена.")
+            return
+        
+        if not news.original_content:
+            await answer_callback(callback_query, "Оригинальный текст не найден.")
+            return
+        
+        # Получаем оригинальный текст и текущий текст для информирования
+        old_content = news.content
+        original_content = news.original_content
+        
+        # Восстанавливаем оригинальный текст
+        news.content = original_content
+        await session.commit()
     
-    await bot.answer_callback_query(callback_query.id, "Текст восстановлен до оригинального.")
+    await answer_callback(callback_query, "Текст восстановлен до оригинального.")
     
     # Определяем тип сообщения (опубликованное или нет)
     is_published = news.is_published and news.published_message_id
@@ -190,51 +315,7 @@ async def process_restore_original(callback_query: types.CallbackQuery):
                     target_channel = f'@{target_channel}'  # Добавляем @ если это username без @
             
             # Обновляем сообщение в канале
-            if news.has_media and news.media_path and os.path.exists(news.media_path):
-                # Читаем файл в память
-                with open(news.media_path, 'rb') as file:
-                    file_content = file.read()
-                
-                # Обработка разных типов медиа
-                if news.media_type == 'photo':
-                    await bot.edit_message_media(
-                        chat_id=target_channel,
-                        message_id=news.published_message_id,
-                        media=types.InputMediaPhoto(
-                            media=file_content,
-                            caption=news.content
-                        )
-                    )
-                else:  # document
-                    # Определяем тип файла
-                    mime_type = mimetypes.guess_type(news.media_path)[0]
-                    
-                    # Если это изображение, отправляем как фото для лучшего отображения
-                    if mime_type and mime_type.startswith('image/'):
-                        await bot.edit_message_media(
-                            chat_id=target_channel,
-                            message_id=news.published_message_id,
-                            media=types.InputMediaPhoto(
-                                media=file_content,
-                                caption=news.content
-                            )
-                        )
-                    else:
-                        await bot.edit_message_media(
-                            chat_id=target_channel,
-                            message_id=news.published_message_id,
-                            media=types.InputMediaDocument(
-                                media=file_content,
-                                caption=news.content
-                            )
-                        )
-            else:
-                # Обновляем только текст
-                await bot.edit_message_text(
-                    chat_id=target_channel,
-                    message_id=news.published_message_id,
-                    text=news.content
-                )
+            await edit_published_news(target_channel, news)
         except Exception as e:
             logger.error(f"Ошибка при обновлении опубликованной новости: {e}")
     
@@ -269,37 +350,15 @@ async def process_restore_original(callback_query: types.CallbackQuery):
     # Обновляем сообщение с новостью у модератора
     try:
         # Обновляем оригинальное сообщение
-        if news.has_media and news.media_path and os.path.exists(news.media_path):
-            # Читаем файл в память
-            with open(news.media_path, 'rb') as file:
-                file_content = file.read()
-            
-            mime_type = mimetypes.guess_type(news.media_path)[0]
-            
-            # Если это фото или документ-изображение, обновляем как фото
-            if news.media_type == 'photo' or (mime_type and mime_type.startswith('image/')):
-                await bot.edit_message_media(
-                    chat_id=callback_query.message.chat.id,
-                    message_id=callback_query.message.message_id,
-                    media=types.InputMediaPhoto(
-                        media=file_content,
-                        caption=message_text,
-                        parse_mode="HTML"
-                    ),
-                    reply_markup=markup
-                )
-            else:
-                # Иначе обновляем как документ
-                await bot.edit_message_media(
-                    chat_id=callback_query.message.chat.id,
-                    message_id=callback_query.message.message_id,
-                    media=types.InputMediaDocument(
-                        media=file_content,
-                        caption=message_text,
-                        parse_mode="HTML"
-                    ),
-                    reply_markup=markup
-                )
+        if has_media_source(news):
+            await edit_news_media(
+                callback_query.message.chat.id,
+                callback_query.message.message_id,
+                news,
+                message_text,
+                parse_mode="HTML",
+                reply_markup=markup
+            )
         else:
             # Обновляем только текст оригинального сообщения
             await bot.edit_message_text(
@@ -322,6 +381,14 @@ async def process_restore_original(callback_query: types.CallbackQuery):
             logger.error(f"Дополнительная ошибка при обновлении кнопок: {e2}")
 
 
+async def finish_edit(state):
+    """Выходит из редактирования, сохраняя фильтры /queue"""
+    queue = (await state.get_data()).get('queue')
+    await state.finish()
+    if queue:
+        await state.update_data(queue=queue)
+
+
 @dp.message_handler(state=ReviewStates.waiting_for_edit_text)
 async def process_edit_text(message: types.Message, state: FSMContext):
     """Обрабатывает ввод нового текста для новости"""
@@ -339,21 +406,21 @@ async def process_edit_text(message: types.Message, state: FSMContext):
     request_message_id = data.get('request_message_id')
     
     # Получаем новость из базы данных
-    session = get_session()
-    news = session.query(News).filter(News.id == news_id).first()
-    
-    if not news:
-        await message.reply("Новость не найдена.")
-        await state.finish()
-        return
-    
-    # Обновляем текст новости
-    old_content = news.content
-    news.content = message.text
-    session.commit()
+    async with get_async_session() as session:
+        news = await session.get(News, news_id)
+        
+        if not news:
+            await message.reply("Новость не найдена.")
+            await finish_edit(state)
+            return
+        
+        # Обновляем текст новости
+        old_content = news.content
+        news.content = message.text
+        await session.commit()
     
     # Сбрасываем состояние
-    await state.finish()
+    await finish_edit(state)
     
     # Формируем сообщение об успешном обновлении
     success_message = (
@@ -371,53 +438,7 @@ async def process_edit_text(message: types.Message, state: FSMContext):
                     target_channel = f'@{target_channel}'  # Добавляем @ если это username без @
             
             # Обновляем сообщение в канале
-            if news.has_media and news.media_path and os.path.exists(news.media_path):
-                logger.info(f"Обновление опубликованной новости {news.id} с медиа")
-                
-                # Читаем файл в память
-                with open(news.media_path, 'rb') as file:
-                    file_content = file.read()
-                
-                # Обработка разных типов медиа
-                if news.media_type == 'photo':
-                    await bot.edit_message_media(
-                        chat_id=target_channel,
-                        message_id=news.published_message_id,
-                        media=types.InputMediaPhoto(
-                            media=file_content,
-                            caption=news.content
-                        )
-                    )
-                else:  # document
-                    # Определяем тип файла
-                    mime_type = mimetypes.guess_type(news.media_path)[0]
-                    
-                    # Если это изображение, отправляем как фото для лучшего отображения
-                    if mime_type and mime_type.startswith('image/'):
-                        await bot.edit_message_media(
-                            chat_id=target_channel,
-                            message_id=news.published_message_id,
-                            media=types.InputMediaPhoto(
-                                media=file_content,
-                                caption=news.content
-                            )
-                        )
-                    else:
-                        await bot.edit_message_media(
-                            chat_id=target_channel,
-                            message_id=news.published_message_id,
-                            media=types.InputMediaDocument(
-                                media=file_content,
-                                caption=news.content
-                            )
-                        )
-            else:
-                # Обновляем только текст
-                await bot.edit_message_text(
-                    chat_id=target_channel,
-                    message_id=news.published_message_id,
-                    text=news.content
-                )
+            await edit_published_news(target_channel, news)
             
             # Клавиатура для опубликованной новости
             markup = InlineKeyboardMarkup(row_width=2)
@@ -457,39 +478,16 @@ async def process_edit_text(message: types.Message, state: FSMContext):
     
     try:
         # Обновляем оригинальное сообщение
-        if news.has_media and news.media_path and os.path.exists(news.media_path):
+        if has_media_source(news):
             logger.info(f"Обновление сообщения новости {news.id} с медиа")
-            
-            # Читаем файл в память
-            with open(news.media_path, 'rb') as file:
-                file_content = file.read()
-            
-            mime_type = mimetypes.guess_type(news.media_path)[0]
-            
-            # Если это фото или документ-изображение, обновляем как фото
-            if news.media_type == 'photo' or (mime_type and mime_type.startswith('image/')):
-                await bot.edit_message_media(
-                    chat_id=original_chat_id,
-                    message_id=original_message_id,
-                    media=types.InputMediaPhoto(
-                        media=file_content,
-                        caption=message_text,
-                        parse_mode="HTML"
-                    ),
-                    reply_markup=markup
-                )
-            else:
-                # Иначе обновляем как документ
-                await bot.edit_message_media(
-                    chat_id=original_chat_id,
-                    message_id=original_message_id,
-                    media=types.InputMediaDocument(
-                        media=file_content,
-                        caption=message_text,
-                        parse_mode="HTML"
-                    ),
-                    reply_markup=markup
-                )
+            await edit_news_media(
+                original_chat_id,
+                original_message_id,
+                news,
+                message_text,
+                parse_mode="HTML",
+                reply_markup=markup
+            )
         else:
             # Обновляем только текст оригинального сообщения
             await bot.edit_message_text(
@@ -525,124 +523,597 @@ async def process_edit_text(message: types.Message, state: FSMContext):
             logger.error(f"Не удалось удалить сообщение-запрос: {e}")
 
 
+async def approve_news(session, news, started):
+    """
+    Одобряет и публикует новость. При ошибке публикации возвращает новость в очередь и пробрасывает
+    исключение. Возвращает опубликованное сообщение.
+    """
+    news.is_reviewed = True
+    news.is_approved = True
+    await session.commit()
+    return await publish_approved_news(session, news, started)
+
+
+async def publish_approved_news(session, news, started):
+    """Публикует одобренную новость; при ошибке возвращает ее в очередь и пробрасывает исключение"""
+    try:
+        published_msg = await publish_news(news)
+    except Exception:
+        # Возвращаем статус новости
+        news.is_reviewed = False
+        news.is_approved = False
+        await session.commit()
+        raise
+    
+    if published_msg:
+        news.is_published = True
+        news.published_message_id = published_msg.message_id
+        await session.commit()
+        approve_publish_seconds.observe(time.monotonic() - started)
+    return published_msg
+
+
 @dp.callback_query_handler(lambda c: c.data.startswith(('approve_', 'delete_', 'dummy_')))
 async def process_review_callback(callback_query: types.CallbackQuery):
     """Обрабатывает результаты рецензирования и удаления"""
     user_id = callback_query.from_user.id
     if user_id not in MODERATOR_IDS:
-        await bot.answer_callback_query(callback_query.id, "У вас нет доступа.")
+        await answer_callback(callback_query, "У вас нет доступа.")
         return
     
     parts = callback_query.data.split('_')
     action = parts[0]
     news_id = int(parts[1])
+    started = time.monotonic()
     
-    session = get_session()
-    news = session.query(News).filter(News.id == news_id).first()
-    
-    if not news:
-        await bot.answer_callback_query(callback_query.id, "Новость не найдена.")
-        return
-    
-    if action == 'approve':
-        # Одобряем и публикуем новость
-        news.is_reviewed = True
-        news.is_approved = True
-        session.commit()
+    async with get_async_session() as session:
+        news = await session.get(News, news_id)
         
-        await bot.answer_callback_query(callback_query.id, "Новость одобрена и публикуется...")
+        if not news:
+            await answer_callback(callback_query, "Новость не найдена.")
+            return
         
-        # Публикуем новость
-        try:
-            published_msg = await publish_news(news)
-            if published_msg:
-                news.is_published = True
-                news.published_message_id = published_msg.message_id
-                session.commit()
-                
-                # Обновляем клавиатуру с кнопками
-                markup = InlineKeyboardMarkup(row_width=2)
-                markup.add(
-                    InlineKeyboardButton("Опубликовано", callback_data=f"dummy_{news.id}"),
-                    InlineKeyboardButton("Редактировать", callback_data=f"edit_published_{news.id}"),
-                    InlineKeyboardButton("Удалить", callback_data=f"delete_{news.id}")
-                )
-                
-                # Добавляем кнопку восстановления оригинала, если текущий текст отличается от оригинального
-                if news.content != news.original_content:
-                    markup.add(InlineKeyboardButton("Восстановить оригинал", callback_data=f"restore_original_{news.id}"))
-                
-                await bot.edit_message_reply_markup(
-                    chat_id=callback_query.message.chat.id,
-                    message_id=callback_query.message.message_id,
-                    reply_markup=markup
-                )
-                
-        except Exception as e:
-            logger.error(f"Ошибка при публикации новости {news.id}: {e}")
-            await bot.answer_callback_query(callback_query.id, f"Ошибка при публикации: {e}")
-            # Возвращаем статус новости
-            news.is_reviewed = False
-            news.is_approved = False
-            session.commit()
+        if action == 'approve' and news.media_status == MEDIA_PENDING:
+            # Без этого новость ушла бы в канал без медиа
+            await answer_callback(callback_query, "Медиафайл еще загружается, попробуйте через несколько секунд.")
+            return
+        
+        if action == 'approve':
+            if news.is_published:
+                await answer_callback(callback_query, "Новость уже опубликована.")
+                return
+            
+            await answer_callback(callback_query, "Новость одобрена и публикуется...")
             
-    elif action == 'delete':
-        # Удаляем опубликованную новость из целевого канала
-        if news.is_published and news.published_message_id:
+            # Одобряем и публикуем новость
             try:
-                # Создаем правильный формат имени канала
-                target_channel = TARGET_CHANNEL
-                if target_channel and not target_channel.startswith('@') and not target_channel.startswith('-'):
-                    if not target_channel.isdigit():  # Если это не числовой ID
-                        target_channel = f'@{target_channel}'  # Добавляем @ если это username без @
-                
-                # Удаляем сообщение из канала
-                await bot.delete_message(
-                    chat_id=target_channel,
-                    message_id=news.published_message_id
-                )
-                
-                # Обновляем статус в базе данных - возвращаем новость в исходное состояние
-                news.is_published = False
-                news.published_message_id = None
-                news.is_reviewed = False
-                news.is_approved = False
-                session.commit()
-                
-                await bot.answer_callback_query(callback_query.id, "Новость удалена из канала и возвращена в очередь на публикацию.")
-                
-                # Обновляем клавиатуру для возможности редактирования и повторной публикации
-                markup = InlineKeyboardMarkup(row_width=2)
-                markup.add(
-                    InlineKeyboardButton("Опубликовать", callback_data=f"approve_{news.id}"),
-                    InlineKeyboardButton("Редактировать", callback_data=f"edit_{news.id}")
-                )
-                
-                # Добавляем кнопку восстановления оригинала, если текущий текст отличается от оригинального
-                if news.content != news.original_content:
-                    markup.add(InlineKeyboardButton("Восстановить оригинал", callback_data=f"restore_original_{news.id}"))
-                
-                await bot.edit_message_reply_markup(
-                    chat_id=callback_query.message.chat.id,
-                    message_id=callback_query.message.message_id,
-                    reply_markup=markup
-                )
-                
+                published_msg = await approve_news(session, news, started)
+                if published_msg:
+                    # Обновляем клавиатуру с кнопками
+                    markup = InlineKeyboardMarkup(row_width=2)
+                    markup.add(
+                        InlineKeyboardButton("Опубликовано", callback_data=f"dummy_{news.id}"),
+                        InlineKeyboardButton("Редактировать", callback_data=f"edit_published_{news.id}"),
+                        InlineKeyboardButton("Удалить", callback_data=f"delete_{news.id}")
+                    )
+                    
+                    # Добавляем кнопку восстановления оригинала, если текущий текст отличается от оригинального
+                    if news.content != news.original_content:
+                        markup.add(InlineKeyboardButton("Восстановить оригинал", callback_data=f"restore_original_{news.id}"))
+                    
+                    await bot.edit_message_reply_markup(
+                        chat_id=callback_query.message.chat.id,
+                        message_id=callback_query.message.message_id,
+                        reply_markup=markup
+                    )
+                    
             except Exception as e:
-                logger.error(f"Ошибка при удалении новости из канала: {e}")
-                await bot.answer_callback_query(callback_query.id, f"Ошибка при удалении: {e}")
-        else:
-            await bot.answer_callback_query(callback_query.id, "Эта новость не была опубликована.")
-    
-    elif action == 'dummy':
-        # Для неактивных кнопок, просто закрываем запрос
-        await bot.answer_callback_query(callback_query.id)
+                logger.error(f"Ошибка при публикации новости {news.id}: {e}")
+                await answer_callback(callback_query, f"Ошибка при публикации: {e}")
+                
+        elif action == 'delete':
+            # Удаляем опубликованную новость из целевого канала
+            if news.is_published and news.published_message_id:
+                try:
+                    # Создаем правильный формат имени канала
+                    target_channel = TARGET_CHANNEL
+                    if target_channel and not target_channel.startswith('@') and not target_channel.startswith('-'):
+                        if not target_channel.isdigit():  # Если это не числовой ID
+                            target_channel = f'@{target_channel}'  # Добавляем @ если это username без @
+                    
+                    # Удаляем сообщение из канала (у альбома - все его сообщения)
+                    for message_id in get_published_message_ids(news):
+                        await bot.delete_message(chat_id=target_channel, message_id=message_id)
+                    for item in news.media_items:
+                        item.published_message_id = None
+                    
+                    # Обновляем статус в базе данных - возвращаем новость в исходное состояние
+                    news.is_published = False
+                    news.published_message_id = None
+                    news.is_reviewed = False
+                    news.is_approved = False
+                    await session.commit()
+                    
+                    await answer_callback(callback_query, "Новость удалена из канала и возвращена в очередь на публикацию.")
+                    
+                    # Обновляем клавиатуру для возможности редактирования и повторной публикации
+                    markup = InlineKeyboardMarkup(row_width=2)
+                    markup.add(
+                        InlineKeyboardButton("Опубликовать", callback_data=f"approve_{news.id}"),
+                        InlineKeyboardButton("Редактировать", callback_data=f"edit_{news.id}")
+                    )
+                    
+                    # Добавляем кнопку восстановления оригинала, если текущий текст отличается от оригинального
+                    if news.content != news.original_content:
+                        markup.add(InlineKeyboardButton("Восстановить оригинал", callback_data=f"restore_original_{news.id}"))
+                    
+                    await bot.edit_message_reply_markup(
+                        chat_id=callback_query.message.chat.id,
+                        message_id=callback_query.message.message_id,
+                        reply_markup=markup
+                    )
+                    
+                except Exception as e:
+                    logger.error(f"Ошибка при удалении новости из канала: {e}")
+                    await answer_callback(callback_query, f"Ошибка при удалении: {e}")
+            else:
+                await answer_callback(callback_query, "Эта новость не была опубликована.")
+        
+        elif action == 'dummy':
+            # Для неактивных кнопок, просто закрываем запрос
+            await answer_callback(callback_query)
 
 
 @dp.callback_query_handler(lambda c: c.data.startswith('dummy_'))
 async def process_dummy_callback(callback_query: types.CallbackQuery):
     """Обрабатывает нажатия на неактивные кнопки"""
-    await bot.answer_callback_query(callback_query.id, "Действие уже выполнено.")
+    await answer_callback(callback_query, "Действие уже выполнено.")
+
+
+# Подписи типов медиа в очереди модерации
+QUEUE_MEDIA_LABELS = {'text': 'текст', 'photo': 'фото', 'document': 'документ', 'album': 'альбом'}
+
+
+def encode_queue_key(key):
+    """Ключ страницы очереди (date, id) для callback_data; пустая строка - начало очереди"""
+    return f"{key[0].isoformat()}_{key[1]}" if key else ''
+
+
+def decode_queue_key(value):
+    if not value:
+        return None
+    date, news_id = value.rsplit('_', 1)
+    return datetime.fromisoformat(date), int(news_id)
+
+
+def parse_queue_filters(args):
+    """Фильтры из аргументов /queue: тип медиа (text, photo, document, album) и канал-источник"""
+    filters = {'channel': None, 'media': None}
+    for arg in args.split():
+        if arg.lower() in QUEUE_MEDIA_TYPES:
+            filters['media'] = arg.lower()
+        else:
+            filters['channel'] = arg.lstrip('@')
+    return filters
+
+
+def make_preview(content, length=QUEUE_PREVIEW_LENGTH):
+    """Начало текста новости без HTML-разметки: обрезанная разметка сломала бы сообщение"""
+    text = html.unescape(re.sub(r'<[^>]+>', '', content or '')).strip()
+    if len(text) > length:
+        text = text[:length].rstrip() + '…'
+    return html.escape(text)
+
+
+async def render_queue_page(start, filters, selected=()):
+    """
+    Текст и кнопки страницы очереди, начинающейся с ключа start, и ID новостей на ней.
+    selected - ID новостей, отмеченных для пакетного одобрения или отклонения.
+    """
+    async with get_async_session() as session:
+        items, prev_start, next_start = await get_review_queue_page(
+            session, start, QUEUE_PAGE_SIZE, filters['channel'], filters['media']
+        )
+        total = await count_review_queue(session, filters['channel'], filters['media'])
+    
+    title = f"📋 <b>Очередь модерации</b>: {total}"
+    if filters['channel']:
+        title += f", канал <b>{filters['channel']}</b>"
+    if filters['media']:
+        title += f", {QUEUE_MEDIA_LABELS[filters['media']]}"
+    lines = [title, ""]
+    if not items:
+        lines.append("Непроверенных новостей нет.")
+    
+    markup = InlineKeyboardMarkup(row_width=3)
+    page_key = encode_queue_key(start)
+    for news in items:
+        media_label = QUEUE_MEDIA_LABELS.get(news.media_type or 'text', news.media_type)
+        if news.media_status == MEDIA_PENDING:
+            media_label += " ⏳"
+        lines.append(
+            f"<b>№{news.id}</b> · {news.source_channel} · {media_label} · {news.date:%d.%m %H:%M}\n"
+            f"{make_preview(news.content)}\n"
+        )
+        markup.row(
+            InlineKeyboardButton(f"✅ №{news.id}", callback_data=f"queue_approve_{news.id}_{page_key}"),
+            InlineKeyboardButton(
+                f"{'☑️' if news.id in selected else '⬜'} №{news.id}", callback_data=f"queue_select_{news.id}_{page_key}"
+            ),
+            InlineKeyboardButton(f"👁 №{news.id}", callback_data=f"queue_open_{news.id}")
+        )
+    
+    # Пакетные действия: отмеченные новости, вся страница, все новости канала по текущим фильтрам
+    if selected:
+        markup.row(
+            InlineKeyboardButton(f"✅ Отмеченные ({len(selected)})", callback_data=f"queue_bulk_approve_sel_{page_key}"),
+            InlineKeyboardButton(f"❌ Отмеченные ({len(selected)})", callback_data=f"queue_bulk_reject_sel_{page_key}")
+        )
+    if items:
+        markup.row(
+            InlineKeyboardButton("✅ Всю страницу", callback_data=f"queue_bulk_approve_page_{page_key}"),
+            InlineKeyboardButton("❌ Всю страницу", callback_data=f"queue_bulk_reject_page_{page_key}")
+        )
+    if items and filters['channel']:
+        markup.row(
+            InlineKeyboardButton(f"✅ Весь канал ({total})", callback_data=f"queue_bulk_approve_chan_{page_key}"),
+            InlineKeyboardButton(f"❌ Весь канал ({total})", callback_data=f"queue_bulk_reject_chan_{page_key}")
+        )
+    
+    navigation = []
+    if prev_start:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f"queue_page_{encode_queue_key(prev_start)}"))
+    navigation.append(InlineKeyboardButton("🔄 Обновить", callback_data=f"queue_page_{page_key}"))
+    if next_start:
+        navigation.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"queue_page_{encode_queue_key(next_start)}"))
+    markup.row(*navigation)
+    return "\n".join(lines), markup, [news.id for news in items]
+
+
+async def show_queue_page(message, start, state):
+    """Перерисовывает сообщение очереди на месте вместо отправки нового"""
+    data = await state.get_data()
+    text, markup, page_ids = await render_queue_page(
+        start, data.get('queue') or parse_queue_filters(''), set(data.get('queue_selected', []))
+    )
+    # Кнопки "Всю страницу" относятся к показанным новостям, даже если очередь с тех пор изменилась
+    await state.update_data(queue_page=page_ids)
+    try:
+        await bot.edit_message_text(
+            text, chat_id=message.chat.id, message_id=message.message_id, parse_mode='HTML', reply_markup=markup
+        )
+    except BadRequest as e:
+        # Страница не изменилась (например, "Обновить" без новых новостей)
+        if 'message is not modified' not in str(e).lower():
+            raise
+
+
+@dp.message_handler(commands=['queue'])
+async def cmd_queue(message: types.Message, state: FSMContext):
+    """Показывает непроверенные новости постранично: /queue [канал] [text|photo|document|album]"""
+    if message.from_user.id not in MODERATOR_IDS:
+        await message.reply("У вас нет доступа к этому боту.")
+        return
+    
+    # Фильтры нужны при каждом переходе по страницам, а в callback_data (64 байта) имя канала может не поместиться
+    filters = parse_queue_filters(message.get_args() or '')
+    text, markup, page_ids = await render_queue_page(None, filters)
+    await state.update_data(queue=filters, queue_selected=[], queue_page=page_ids)
+    await message.reply(text, parse_mode='HTML', reply_markup=markup)
+
+
+@dp.callback_query_handler(lambda c: c.data.startswith('queue_'))
+async def process_queue_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    """Листание очереди, одобрение новости из нее, открытие новости целиком и пакетные действия"""
+    if callback_query.from_user.id not in MODERATOR_IDS:
+        await answer_callback(callback_query, "У вас нет доступа.")
+        return
+    
+    action, _, value = callback_query.data[len('queue_'):].partition('_')
+    
+    if action == 'page':
+        await answer_callback(callback_query)
+        await show_queue_page(callback_query.message, decode_queue_key(value), state)
+    
+    elif action == 'open':
+        async with get_async_session() as session:
+            news = await session.get(News, int(value))
+        if not news:
+            await answer_callback(callback_query, "Новость не найдена.")
+            return
+        await answer_callback(callback_query)
+        await notify_moderators(news, [callback_query.from_user.id])
+    
+    elif action == 'approve':
+        news_id, _, page_key = value.partition('_')
+        started = time.monotonic()
+        async with get_async_session() as session:
+            news = await session.get(News, int(news_id))
+            if not news or news.is_reviewed:
+                await answer_callback(callback_query, "Новость уже проверена или удалена.")
+            elif news.media_status == MEDIA_PENDING:
+                await answer_callback(callback_query, "Медиафайл еще загружается, попробуйте через несколько секунд.")
+                return
+            else:
+                await answer_callback(callback_query, f"Новость №{news.id} одобрена и публикуется...")
+                try:
+                    await approve_news(session, news, started)
+                except Exception as e:
+                    logger.error(f"Ошибка при публикации новости {news.id}: {e}")
+                    await bot.send_message(callback_query.from_user.id, f"Ошибка при публикации новости №{news.id}: {e}")
+        await show_queue_page(callback_query.message, decode_queue_key(page_key), state)
+    
+    elif action == 'select':
+        news_id, _, page_key = value.partition('_')
+        selected = set((await state.get_data()).get('queue_selected', []))
+        selected ^= {int(news_id)}
+        await state.update_data(queue_selected=sorted(selected))
+        await answer_callback(callback_query)
+        await show_queue_page(callback_query.message, decode_queue_key(page_key), state)
+    
+    elif action == 'bulk':
+        decision, scope, page_key = value.split('_', 2)
+        await review_queue_bulk(callback_query, state, decision == 'approve', scope)
+        await show_queue_page(callback_query.message, decode_queue_key(page_key), state)
+
+
+async def review_queue_bulk(callback_query, state, approved, scope):
+    """
+    Одобряет или отклоняет сразу несколько новостей очереди: отмеченные (scope sel), показанные на странице (page)
+    или все новости канала по текущим фильтрам (chan). Решение записывается в базу одним запросом,
+    одобренные новости затем публикуются по очереди в фоне.
+    """
+    data = await state.get_data()
+    filters = data.get('queue') or parse_queue_filters('')
+    if scope == 'chan':
+        if not filters['channel']:
+            await answer_callback(callback_query, "Сначала выберите канал: /queue <канал>")
+            return
+        news_ids = None
+    else:
+        news_ids = data.get('queue_selected' if scope == 'sel' else 'queue_page') or []
+        if not news_ids:
+            await answer_callback(callback_query, "Нет новостей для обработки.")
+            return
+    
+    started = time.monotonic()
+    async with get_async_session() as session:
+        reviewed_ids = await review_news_bulk(session, approved, news_ids, filters['channel'], filters['media'])
+        await session.commit()
+    
+    selected = set(data.get('queue_selected', [])) - set(reviewed_ids)
+    await state.update_data(queue_selected=sorted(selected))
+    
+    verb = "Одобрено" if approved else "Отклонено"
+    text = f"{verb} новостей: {len(reviewed_ids)}"
+    if news_ids is not None and len(reviewed_ids) < len(news_ids):
+        text += f", пропущено {len(news_ids) - len(reviewed_ids)} (уже проверены или медиа еще загружается)"
+    if approved and reviewed_ids:
+        text += ". Публикуются по очереди"
+        task = asyncio.create_task(publish_news_bulk(reviewed_ids, callback_query.from_user.id, started))
+        bulk_publications.add(task)
+        task.add_done_callback(bulk_publications.discard)
+    logger.info(f"{text}: {reviewed_ids}")
+    await answer_callback(callback_query, text, show_alert=True)
+
+
+# Фоновые пакетные публикации; пакеты публикуются по одному, чтобы новости шли в канал в порядке очереди
+bulk_publications = set()
+bulk_publish_lock = asyncio.Lock()
+bulk_publish_pending = set()  # ID одобренных пакетом новостей, которые еще не опубликованы
+
+
+async def publish_news_bulk(news_ids, moderator_id, started):
+    """
+    Публикует одобренные пакетом новости по одной. Темп задает общий ограничитель частоты, поэтому пакет
+    не упирается в лимиты Telegram для канала. По окончании сообщает модератору итог.
+    """
+    bulk_publish_pending.update(news_ids)
+    published, failed = 0, []
+    async with bulk_publish_lock:
+        for news_id in news_ids:
+            try:
+                async with get_async_session() as session:
+                    news = await session.get(News, news_id)
+                    if news is None or news.is_published or not news.is_approved:
+                        continue
+                    if await publish_approved_news(session, news, started):
+                        published += 1
+            except Exception as e:
+                logger.error(f"Ошибка при пакетной публикации новости {news_id}: {e}")
+                failed.append(news_id)
+            finally:
+                bulk_publish_pending.discard(news_id)
+    
+    text = f"📤 Пакетная публикация завершена: опубликовано {published} из {len(news_ids)}"
+    if failed:
+        text += "\nНе удалось опубликовать и возвращены в очередь: " + ", ".join(f"№{news_id}" for news_id in failed)
+    try:
+        await bot.send_message(moderator_id, text)
+    except Exception as e:
+        logger.error(f"Не удалось отправить итог пакетной публикации модератору {moderator_id}: {e}")
+
+
+class MediaUnavailable(Exception):
+    """Файл медиа удален из хранилища, а кэшированного file_id нет или Telegram его отклонил"""
+
+
+def has_file_or_file_id(media):
+    """Есть ли у медиа кэшированный file_id или файл на диске"""
+    return bool(media.media_file_id or (media.media_path and os.path.exists(media.media_path)))
+
+
+def has_media_source(news):
+    """
+    Можно ли отправить медиа новости одним сообщением: есть кэшированный file_id или файл на диске.
+    Альбом отправляется группой медиа, а модератору его кнопки приходят текстовым сообщением.
+    """
+    return news.has_media and not news.is_album and has_file_or_file_id(news)
+
+
+def get_album_items(news):
+    """Элементы альбома, которые можно отправить (sendMediaGroup принимает не больше 10)"""
+    return [item for item in news.media_items if has_file_or_file_id(item)][:10]
+
+
+def get_published_message_ids(news):
+    """ID сообщений новости в целевом канале"""
+    if news.is_album:
+        message_ids = [item.published_message_id for item in news.media_items if item.published_message_id]
+        if message_ids:
+            return message_ids
+    return [news.published_message_id]
+
+
+def get_message_file_id(message):
+    """Достает file_id медиа из отправленного сообщения"""
+    if not isinstance(message, types.Message):
+        return None
+    if message.photo:
+        # Последний размер фото - самый большой
+        return message.photo[-1].file_id
+    for media in (message.document, message.video, message.animation, message.audio):
+        if media:
+            return media.file_id
+    return None
+
+
+async def call_with_cached_media(news, call):
+    """
+    Выполняет отправку или редактирование медиа новости.
+    Сначала используется кэшированный file_id, загрузка файла с диска - только если Telegram его отклонил.
+    """
+    if news.media_file_id:
+        try:
+            return await call(news.media_file_id)
+        except BadRequest as e:
+            logger.warning(f"file_id медиа новости {news.id} отклонен ({e}), загружаем файл с диска")
+    
+    if not news.media_path or not os.path.exists(news.media_path):
+        raise MediaUnavailable(f"Медиафайл новости {news.id} удален из хранилища")
+    
+    # Файл не читается в память целиком: aiohttp отправляет его с диска частями
+    logger.info(f"Загрузка файла {news.media_path}, размер: {os.path.getsize(news.media_path)} байт")
+    with open(news.media_path, 'rb') as file:
+        message = await call(types.InputFile(file, filename=news.media_name or os.path.basename(news.media_path)))
+    
+    file_id = get_message_file_id(message)
+    if file_id and file_id != news.media_file_id:
+        news.media_file_id = file_id
+        await set_media_file_id(news.id, file_id)
+    return message
+
+
+async def send_news_media(chat_id, news, caption, parse_mode=None, reply_markup=None):
+    """Отправляет медиа новости: изображения как фото, остальное как документ"""
+    async def send(media):
+        if news.upload_type == 'photo':
+            return await bot.send_photo(
+                chat_id=chat_id, photo=media, caption=caption, parse_mode=parse_mode, reply_markup=reply_markup
+            )
+        return await bot.send_document(
+            chat_id=chat_id, document=media, caption=caption, parse_mode=parse_mode, reply_markup=reply_markup
+        )
+    
+    try:
+        return await call_with_cached_media(news, send)
+    except MediaUnavailable as e:
+        # Без файла и file_id отправляем хотя бы текст
+        logger.warning(f"{e}, отправляем только текст")
+        return await bot.send_message(chat_id=chat_id, text=caption, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+async def edit_news_media(chat_id, message_id, news, caption, parse_mode=None, reply_markup=None):
+    """Заменяет медиа и подпись в уже отправленном сообщении"""
+    async def edit(media):
+        media_class = types.InputMediaPhoto if news.upload_type == 'photo' else types.InputMediaDocument
+        return await bot.edit_message_media(
+            chat_id=chat_id,
+            message_id=message_id,
+            media=media_class(media=media, caption=caption, parse_mode=parse_mode),
+            reply_markup=reply_markup
+        )
+    
+    try:
+        return await call_with_cached_media(news, edit)
+    except MediaUnavailable as e:
+        # Медиа в сообщении остается прежним, обновляем только подпись
+        logger.warning(f"{e}, обновляем только подпись")
+        return await bot.edit_message_caption(
+            chat_id=chat_id, message_id=message_id, caption=caption, parse_mode=parse_mode, reply_markup=reply_markup
+        )
+
+
+async def send_news_album(chat_id, news, caption):
+    """
+    Отправляет альбом новости одним sendMediaGroup, подпись - у первого элемента.
+    Сначала используются кэшированные file_id; если Telegram их отклонил, файлы загружаются с диска.
+    Возвращает отправленные сообщения в порядке элементов альбома.
+    """
+    input_media = {
+        'photo': types.InputMediaPhoto,
+        'video': types.InputMediaVideo,
+        'document': types.InputMediaDocument,
+    }
+    items = get_album_items(news)
+    messages = None
+    
+    for use_file_ids in (True, False):
+        if not use_file_ids and not all(item.media_path and os.path.exists(item.media_path) for item in items):
+            # Без файлов на диске повторить отправку нечем
+            break
+        opened_files = []
+        try:
+            media = types.MediaGroup()
+            for position, item in enumerate(items):
+                if use_file_ids and item.media_file_id:
+                    source = item.media_file_id
+                else:
+                    file = open(item.media_path, 'rb')
+                    opened_files.append(file)
+                    source = types.InputFile(file, filename=item.media_name or os.path.basename(item.media_path))
+                media.attach(input_media[item.group_type](media=source, caption=caption if position == 0 else None))
+            messages = await bot.send_media_group(chat_id=chat_id, media=media)
+            break
+        except BadRequest as e:
+            if not use_file_ids:
+                raise
+            logger.warning(f"file_id альбома новости {news.id} отклонены ({e}), загружаем файлы с диска")
+        finally:
+            for file in opened_files:
+                file.close()
+    
+    if messages is None:
+        raise MediaUnavailable(f"Медиафайлы альбома новости {news.id} недоступны")
+    
+    file_ids = {}
+    for item, message in zip(items, messages):
+        file_id = get_message_file_id(message)
+        if file_id and file_id != item.media_file_id:
+            item.media_file_id = file_id
+            file_ids[item.id] = file_id
+    if file_ids:
+        await set_album_file_ids(file_ids)
+    return messages
+
+
+async def edit_published_news(target_channel, news):
+    """Обновляет текст опубликованной новости в канале"""
+    if news.is_album and any(item.published_message_id for item in news.media_items):
+        # Подпись альбома хранится в первом сообщении группы
+        logger.info(f"Обновление подписи опубликованного альбома новости {news.id}")
+        return await bot.edit_message_caption(
+            chat_id=target_channel, message_id=news.published_message_id, caption=news.content
+        )
+    if has_media_source(news):
+        logger.info(f"Обновление опубликованной новости {news.id} с медиа")
+        return await edit_news_media(target_channel, news.published_message_id, news, news.content)
+    # Обновляем только текст
+    return await bot.edit_message_text(
+        chat_id=target_channel,
+        message_id=news.published_message_id,
+        text=news.content
+    )
 
 
 async def publish_news(news):
@@ -654,39 +1125,20 @@ async def publish_news(news):
             if not target_channel.isdigit():  # Если это не числовой ID
                 target_channel = f'@{target_channel}'  # Добавляем @ если это username без @
         
-        if news.has_media and news.media_path and os.path.exists(news.media_path):
+        if news.is_album and len(get_album_items(news)) >= 2:
+            logger.info(f"Публикация альбома новости {news.id} в канал {target_channel}")
+            try:
+                messages = await send_news_album(target_channel, news, news.content)
+                for item, message in zip(get_album_items(news), messages):
+                    item.published_message_id = message.message_id
+                # ID первого сообщения альбома хранится как ID публикации: в нем подпись
+                return messages[0]
+            except MediaUnavailable as e:
+                logger.warning(f"{e}, публикуем только текст")
+                return await bot.send_message(chat_id=target_channel, text=news.content)
+        elif has_media_source(news):
             logger.info(f"Публикация новости {news.id} с медиафайлом {news.media_path} в канал {target_channel}")
-            
-            # Читаем файл в память перед отправкой
-            with open(news.media_path, 'rb') as file:
-                file_content = file.read()
-            
-            logger.info(f"Файл {news.media_path} прочитан в память для публикации, размер: {len(file_content)} байт")
-            
-            # Отправляем сообщение с медиа через бота
-            if news.media_type == 'photo':
-                return await bot.send_photo(
-                    chat_id=target_channel,
-                    photo=file_content,
-                    caption=news.content
-                )
-            elif news.media_type == 'document':
-                # Определяем тип файла
-                mime_type = mimetypes.guess_type(news.media_path)[0]
-                
-                # Если это изображение, отправляем как фото для лучшего отображения
-                if mime_type and mime_type.startswith('image/'):
-                    return await bot.send_photo(
-                        chat_id=target_channel,
-                        photo=file_content,
-                        caption=news.content
-                    )
-                else:
-                    return await bot.send_document(
-                        chat_id=target_channel,
-                        document=file_content,
-                        caption=news.content
-                    )
+            return await send_news_media(target_channel, news, news.content)
         else:
             # Отправляем текстовое сообщение через бота
             logger.info(f"Публикация текстовой новости {news.id} в канал {target_channel}")
@@ -699,10 +1151,203 @@ async def publish_news(news):
         raise
 
 
+# Рассылка новостей модераторам по событиям от парсера
+notify_semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+# ID новости -> {ID модератора: ID текстового превью или None, если модератор уже получил новость с медиа},
+# пока не пришло событие о готовности или ошибке скачивания медиа
+moderator_previews = {}
+announcements = {}  # ID новости -> задача ее рассылки, которую дожидается замена превью
+
+
+def needs_upload(news):
+    """Нужно ли загружать в Telegram хотя бы один файл новости"""
+    if news.is_album:
+        return any(not item.media_file_id for item in get_album_items(news))
+    return not news.media_file_id
+
+
+def has_album_to_send(news):
+    """Можно ли отправить альбом группой медиа: sendMediaGroup принимает от 2 до 10 элементов"""
+    return news.has_media and news.is_album and len(get_album_items(news)) >= 2
+
+
+async def notify_moderator(moderator_id, news, text, markup):
+    """Отправляет новость одному модератору; ошибка не влияет на остальных. Возвращает ID сообщения с кнопками"""
+    async with notify_semaphore:
+        try:
+            if has_album_to_send(news):
+                # К группе медиа нельзя прикрепить кнопки, поэтому текст с кнопками идет следующим сообщением
+                logger.info(f"Отправка альбома новости {news.id} модератору {moderator_id}")
+                try:
+                    await send_news_album(moderator_id, news, None)
+                except (MediaUnavailable, BadRequest) as e:
+                    logger.error(f"Ошибка при отправке альбома новости {news.id}: {e}")
+                    text += "\n\n⚠️ <i>Не удалось отправить альбом, показан только текст</i>"
+                message = await bot.send_message(moderator_id, text, parse_mode='HTML', reply_markup=markup)
+            elif has_media_source(news):
+                logger.info(f"Отправка новости {news.id} с медиа {news.media_path} модератору {moderator_id}")
+                message = await send_news_media(moderator_id, news, text, parse_mode='HTML', reply_markup=markup)
+            else:
+                logger.info(f"Отправка текстовой новости {news.id} модератору {moderator_id}")
+                message = await bot.send_message(moderator_id, text, parse_mode='HTML', reply_markup=markup)
+            
+            logger.info(f"Уведомление о новой новости {news.id} отправлено модератору {moderator_id}")
+            return message.message_id
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления о новой новости модератору {moderator_id}: {e}")
+            return None
+
+
+async def notify_moderators(news, moderator_ids=None):
+    """Отправляет новость модераторам. Возвращает ID отправленных сообщений по модераторам"""
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        InlineKeyboardButton("✅ Одобрить и опубликовать", callback_data=f"approve_{news.id}"),
+        InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_{news.id}")
+    )
+    
+    text = f"📢 <b>Новая новость №{news.id}</b> из канала <b>{news.source_channel}</b>:\n\n{news.content}"
+    if news.media_status == MEDIA_PENDING:
+        text += "\n\n⏳ <i>Медиафайл загружается, новость с медиа придет отдельным сообщением</i>"
+    
+    started = time.monotonic()
+    moderator_ids = list(MODERATOR_IDS if moderator_ids is None else moderator_ids)
+    total = len(moderator_ids)
+    results = []
+    
+    # Файл загружается в Telegram один раз: первому модератору, остальным уходит полученный file_id
+    if (has_album_to_send(news) or has_media_source(news)) and needs_upload(news) and moderator_ids:
+        moderator_id = moderator_ids.pop(0)
+        results.append((moderator_id, await notify_moderator(moderator_id, news, text, markup)))
+    
+    # Остальным модераторам рассылаем параллельно, не более NOTIFY_CONCURRENCY отправок одновременно
+    message_ids = await asyncio.gather(*(
+        notify_moderator(moderator_id, news, text, markup) for moderator_id in moderator_ids
+    ))
+    results += zip(moderator_ids, message_ids)
+    elapsed = time.monotonic() - started
+    
+    sent = {moderator_id: message_id for moderator_id, message_id in results if message_id}
+    notify_fanout_seconds.observe(elapsed)
+    logger.info(f"Уведомление о новости {news.id} разослано {len(sent)}/{total} модераторам за {elapsed:.2f} с")
+    return sent
+
+
+async def announce_news(news_id):
+    """
+    Рассылает модераторам новую новость и запоминает, что они получили: текстовые превью, пока медиа
+    скачивается, или версию с уже готовым медиа
+    """
+    async with get_async_session() as session:
+        news = await session.get(News, news_id)
+    if news is None:
+        return
+    sent = await notify_moderators(news)
+    if sent and news.posted_at is not None:
+        # Время поста известно с точностью до секунды
+        delay = datetime.now(timezone.utc).replace(tzinfo=None) - news.posted_at
+        notify_latency_seconds.observe(max(delay.total_seconds(), 0.0))
+    if news.media_status == MEDIA_PENDING:
+        moderator_previews[news_id] = sent
+    elif news.media_status == MEDIA_READY:
+        # Медиа скачалось раньше, чем бот прочитал новость (например, файл уже был в хранилище или бот
+        # отстает от парсера): модераторы получили версию с медиа, и событие о готовности медиа ее не повторит
+        moderator_previews[news_id] = dict.fromkeys(sent)
+
+
+async def replace_previews_with_media(news_id):
+    """Отправляет модераторам версию новости с медиа и удаляет их текстовые превью"""
+    announcement = announcements.get(news_id)
+    if announcement is not None:
+        await asyncio.gather(announcement, return_exceptions=True)
+    previews = moderator_previews.pop(news_id, None)
+    if previews is not None:
+        # Модераторам, получившим новость уже с медиа, заменять нечего
+        previews = {moderator_id: message_id for moderator_id, message_id in previews.items() if message_id is not None}
+        if not previews:
+            return
+    
+    async with get_async_session() as session:
+        news = await session.get(News, news_id)
+    if news is None:
+        return
+    
+    # Если бот перезапускался, превью неизвестны: медиа получат все модераторы отдельным сообщением
+    sent = await notify_moderators(news, moderator_ids=None if previews is None else list(previews))
+    for moderator_id, message_id in (previews or {}).items():
+        if moderator_id in sent:
+            try:
+                await bot.delete_message(chat_id=moderator_id, message_id=message_id)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить превью {message_id} у модератора {moderator_id}: {e}")
+
+
+async def forget_previews(news_id):
+    """Медиа новости не скачалось: текстовые превью остаются у модераторов, заменять их нечем"""
+    announcement = announcements.get(news_id)
+    if announcement is not None:
+        await asyncio.gather(announcement, return_exceptions=True)
+    if moderator_previews.pop(news_id, None) is not None:
+        logger.warning(f"Медиа новости {news_id} не скачалось, модераторам показан только текст")
+
+
+async def handle_parser_event(event, news_id):
+    try:
+        if event == NEWS_SAVED:
+            await announce_news(news_id)
+        elif event == NEWS_MEDIA_READY:
+            await replace_previews_with_media(news_id)
+        elif event == NEWS_MEDIA_FAILED:
+            await forget_previews(news_id)
+        else:
+            logger.warning(f"Неизвестное событие от парсера: {event}")
+    except Exception as e:
+        logger.error(f"Ошибка при обработке события {event} новости {news_id}: {e}")
+
+
+async def process_parser_events():
+    """
+    Получает от парсера события о новостях и рассылает новости модераторам.
+    Одновременно обрабатывается не больше IPC_MAX_IN_FLIGHT событий: пока бот занят, события ждут
+    в очереди, а когда она заполнится, парсер приостановит передачу.
+    """
+    channel = get_news_channel()
+    slots = asyncio.Semaphore(IPC_MAX_IN_FLIGHT)
+    while True:
+        received = await channel.receive()
+        if received is None:
+            continue
+        event, news_id = received
+        await slots.acquire()
+        task = asyncio.create_task(handle_parser_event(event, news_id))
+        if event == NEWS_SAVED:
+            announcements[news_id] = task
+        
+        def on_done(task, news_id=news_id):
+            slots.release()
+            if announcements.get(news_id) is task:
+                del announcements[news_id]
+        
+        task.add_done_callback(on_done)
+
+
+@metrics.add_collector
+def collect_metrics():
+    rate_stats = get_rate_limiter().get_stats()
+    queue_depth.set(get_news_channel().qsize(), queue='ipc')
+    queue_depth.set(len(announcements), queue='announcements')
+    queue_depth.set(len(moderator_previews), queue='moderator_previews')
+    queue_depth.set(len(bulk_publish_pending), queue='bulk_publish')
+    queue_depth.set(rate_stats['queue_depth'], queue='rate_limiter')
+    rate_limit_delayed.set(rate_stats['delayed'])
+    rate_limit_wait_seconds.set(rate_stats['total_wait_seconds'])
+    rate_limit_retries.set(rate_stats['retries_429'])
+
+
 async def main():
     """Основная функция запуска бота"""
     # Инициализация базы данных
-    init_db()
+    await init_db_async()
     
     # Проверяем, может ли бот публиковать в целевой канал
     try:
@@ -725,10 +1370,46 @@ async def main():
         logger.error(f"Ошибка при проверке доступа к каналу: {e}")
         logger.warning("Убедитесь, что бот добавлен в канал и имеет необходимые права.")
     
+    # Новости от парсера рассылаются модераторам в фоне
+    events_task = asyncio.create_task(process_parser_events())
+    
     # Запуск бота
+    try:
+        if BOT_MODE == 'webhook':
+            await run_webhook()
+        else:
+            await run_polling()
+    finally:
+        events_task.cancel()
+
+
+async def run_polling():
+    """Получает обновления long polling'ом"""
+    # Пока у бота установлен webhook, getUpdates не работает
+    await bot.delete_webhook()
     await dp.start_polling()
 
 
+async def run_webhook():
+    """Принимает обновления от Telegram на встроенном HTTP-сервере"""
+    if not WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook нужно указать WEBHOOK_URL")
+    # Без заданного секрета создается случайный: Telegram получает его заново при каждом запуске
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    
+    runner = web.AppRunner(create_webhook_app(dp, WEBHOOK_PATH, secret))
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    try:
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH, secret_token=secret, allowed_updates=['message', 'callback_query']
+        )
+        logger.info(f"Бот принимает обновления по webhook {WEBHOOK_URL + WEBHOOK_PATH} на порту {WEBHOOK_PORT}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
     try:
@@ -0,0 +1,99 @@
+import gzip
+import json
+import time
+import logging
+
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage
+
+from config import CAPTURE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Типы записей
+EVENT_NEW = 'new'
+EVENT_EDIT = 'edit'
+
+
+def get_photo_size(photo):
+    """Размер самой большой версии фото в байтах"""
+    size = 0
+    for photo_size in photo.sizes or []:
+        size = max(size, getattr(photo_size, 'size', 0) or 0, *(getattr(photo_size, 'sizes', None) or [0]))
+    return size
+
+
+def describe_media(media):
+    """Медиа сообщения без содержимого: тип, ID в Telegram, размер, имя и MIME-тип документа"""
+    if media is None:
+        return None
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return {'type': 'photo', 'id': media.photo.id, 'size': get_photo_size(media.photo)}
+    if isinstance(media, MessageMediaDocument) and media.document:
+        document = media.document
+        file_name = next(
+            (attribute.file_name for attribute in document.attributes if getattr(attribute, 'file_name', None)), None
+        )
+        return {
+            'type': 'document', 'id': document.id, 'size': document.size,
+            'mime_type': document.mime_type, 'file_name': file_name,
+        }
+    if isinstance(media, MessageMediaWebPage):
+        return {'type': 'webpage'}
+    return {'type': 'other', 'class': type(media).__name__}
+
+
+def describe_message(event_type, message, channel_id, channel):
+    """Запись о сообщении канала; channel - запись кэша каналов с username и названием"""
+    return {
+        't': time.time(),
+        'event': event_type,
+        'channel_id': channel_id,
+        'username': channel and channel.get('username'),
+        'title': channel and channel.get('title'),
+        'id': message.id,
+        'date': message.date.timestamp() if message.date else None,
+        'edit_date': message.edit_date.timestamp() if getattr(message, 'edit_date', None) else None,
+        'text': message.message or '',
+        'grouped_id': message.grouped_id,
+        'media': describe_media(message.media),
+    }
+
+
+class CaptureWriter:
+    """
+    Записывает входящие сообщения каналов в сжатый файл JSON-строк для последующего воспроизведения
+    (benchmarks/replay.py). Содержимое медиа не сохраняется - только тип, ID и размер.
+    Файл дописывается: записи нескольких запусков читаются подряд.
+    """
+
+    def __init__(self, path, flush_interval=CAPTURE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.file = gzip.open(path, 'at', encoding='utf-8')
+        self.last_flush = time.monotonic()
+        self.count = 0
+        logger.info(f"Входящие сообщения записываются в {path}")
+
+    def record(self, event_type, message, channel_id, channel):
+        try:
+            self.file.write(json.dumps(describe_message(event_type, message, channel_id, channel), ensure_ascii=False))
+            self.file.write('\n')
+            self.count += 1
+            # Сброс на диск не на каждую запись: иначе gzip почти не сжимает
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+        except Exception as e:
+            logger.error(f"Не удалось записать сообщение {message.id} в {self.path}: {e}")
+
+    def close(self):
+        self.file.close()
+        logger.info(f"В {self.path} записано сообщений: {self.count}")
+
+
+def read_capture(path):
+    """Записи файла по порядку"""
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
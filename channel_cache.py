@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from telethon import errors
+from telethon.tl.types import InputPeerChannel, PeerChannel
+
+from config import CHANNEL_CACHE_PATH, CHANNEL_CACHE_TTL_HOURS
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelCache:
+    """
+    Локальный кэш данных каналов-источников: username, название и access_hash по ID канала.
+    Хранится в JSON-файле, заполняется один раз при запуске и обновляется по мере необходимости,
+    поэтому обработка сообщений не требует запросов к Telegram за данными канала.
+    """
+
+    def __init__(self, path=CHANNEL_CACHE_PATH, ttl=CHANNEL_CACHE_TTL_HOURS * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.channels = {}  # ID канала -> {'username', 'title', 'access_hash', 'updated_at'}
+        self.refresh_tasks = {}  # Фоновые обновления устаревших записей по ID канала
+        self.load()
+
+    def load(self):
+        """Читает кэш из файла; поврежденный файл игнорируется, кэш заполнится заново"""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                self.channels = {int(channel_id): entry for channel_id, entry in json.load(file).items()}
+        except FileNotFoundError:
+            self.channels = {}
+        except (ValueError, OSError) as e:
+            logger.warning(f"Не удалось прочитать кэш каналов {self.path}: {e}")
+            self.channels = {}
+
+    def save(self):
+        """Записывает кэш во временный файл и заменяет им старый, чтобы сбой не оставил файл наполовину записанным"""
+        temp_path = f'{self.path}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({str(channel_id): entry for channel_id, entry in self.channels.items()}, file,
+                          ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш каналов {self.path}: {e}")
+
+    def remember(self, entity, save=True):
+        """Запоминает данные канала из объекта Telethon"""
+        previous = self.channels.get(entity.id, {})
+        self.channels[entity.id] = {
+            'username': getattr(entity, 'username', None),
+            'title': getattr(entity, 'title', None),
+            # В части обновлений канал приходит без access_hash - сохраняем известный
+            'access_hash': getattr(entity, 'access_hash', None) or previous.get('access_hash'),
+            'updated_at': time.time(),
+        }
+        if save:
+            self.save()
+        return self.channels[entity.id]
+
+    def find(self, channel):
+        """Ищет канал по username или ID из SOURCE_CHANNELS; возвращает ID канала или None"""
+        channel = channel.strip().lstrip('@')
+        if channel.lstrip('-').isdigit():
+            channel_id = int(channel)
+            # ID в формате Bot API (-100...) приводится к ID канала в Telethon
+            if channel_id < 0:
+                channel_id = -channel_id - 1000000000000 if channel_id <= -1000000000000 else -channel_id
+            return channel_id if channel_id in self.channels else None
+        for channel_id, entry in self.channels.items():
+            if entry['username'] and entry['username'].lower() == channel.lower():
+                return channel_id
+        return None
+
+    def get_source_name(self, channel_id):
+        """Имя канала для поля source_channel: username, а если его нет - ID"""
+        entry = self.channels.get(channel_id)
+        return (entry and entry['username']) or str(channel_id)
+
+    def get_input_peer(self, channel_id):
+        """Ссылка на канал для запросов Telethon, не требующая разрешения имени через сеть"""
+        entry = self.channels.get(channel_id)
+        if entry is None or entry['access_hash'] is None:
+            return PeerChannel(channel_id)
+        return InputPeerChannel(channel_id, entry['access_hash'])
+
+    def get_peer(self, channel):
+        """Ссылка на канал по username или ID; для канала не из кэша - имя или ID для разрешения через Telethon"""
+        channel_id = self.find(channel)
+        if channel_id is not None:
+            return self.get_input_peer(channel_id)
+        return int(channel) if channel.lstrip('-').isdigit() else channel
+
+    def is_stale(self, channel_id):
+        entry = self.channels.get(channel_id)
+        return entry is None or time.time() - entry['updated_at'] > self.ttl
+
+    async def warm(self, client, channels):
+        """
+        Разрешает каналы из SOURCE_CHANNELS, которых еще нет в кэше. Каналы запрашиваются по одному,
+        при FloodWait ожидание выдерживается. Возвращает ID каналов, которые удалось найти.
+        """
+        changed = False
+        channel_ids = []
+        for channel in channels:
+            channel_id = self.find(channel)
+            if channel_id is None:
+                entity = await self.resolve(client, channel)
+                if entity is None:
+                    continue
+                self.remember(entity, save=False)
+                channel_id = entity.id
+                changed = True
+            if channel_id not in channel_ids:
+                channel_ids.append(channel_id)
+        if changed:
+            self.save()
+        logger.info(f"Кэш каналов: {len(self.channels)} каналов, найдено каналов-источников: {len(channel_ids)}")
+        return channel_ids
+
+    @staticmethod
+    async def resolve(client, channel):
+        """Запрашивает данные канала у Telegram"""
+        ref = int(channel) if channel.lstrip('-').isdigit() else channel.lstrip('@')
+        while True:
+            try:
+                return await client.get_entity(ref)
+            except errors.FloodWaitError as e:
+                logger.warning(f"FloodWait при получении канала {channel}: ждем {e.seconds} с")
+                await asyncio.sleep(e.seconds)
+            except (ValueError, errors.RPCError) as e:
+                logger.error(f"Не удалось получить канал {channel}: {e}")
+                return None
+
+    async def get_for_event(self, event):
+        """
+        Возвращает ID канала сообщения и имя для source_channel.
+        Неизвестный канал берется из самого события, а устаревшая запись обновляется в фоне.
+        """
+        channel_id = event.message.peer_id.channel_id
+        if channel_id not in self.channels:
+            # Данные канала обычно приходят вместе с обновлением, тогда запрос не нужен
+            chat = event.chat or await event.get_chat()
+            self.remember(chat)
+        elif self.is_stale(channel_id) and channel_id not in self.refresh_tasks:
+            self.refresh_tasks[channel_id] = asyncio.create_task(self.refresh(event))
+        return channel_id, self.get_source_name(channel_id)
+
+    async def refresh(self, event):
+        """Обновляет запись канала (например, после смены username)"""
+        channel_id = event.message.peer_id.channel_id
+        try:
+            chat = event.chat or await event.get_chat()
+            if chat is not None:
+                self.remember(chat)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить данные канала {channel_id}: {e}")
+        finally:
+            self.refresh_tasks.pop(channel_id, None)
+
+    async def close(self):
+        tasks = list(self.refresh_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
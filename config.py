@@ -15,14 +15,99 @@ PHONE_NUMBER = os.getenv('PHONE_NUMBER')  # Ваш номер телефона 
 # Данные для бота TelegramBotAPI
 BOT_TOKEN = os.getenv('BOT_TOKEN')  # Получите от @BotFather
 
+# Адрес Bot API (можно указать локальный сервер Bot API или тестовую заглушку)
+BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org').rstrip('/')
+
+# Пул HTTP-соединений бота к Bot API
+BOT_API_CONNECTION_LIMIT = int(os.getenv('BOT_API_CONNECTION_LIMIT', '20'))  # Максимум одновременных соединений
+BOT_API_CONNECT_TIMEOUT = float(os.getenv('BOT_API_CONNECT_TIMEOUT', '10'))  # Таймаут установки соединения, сек
+BOT_API_TIMEOUT = float(os.getenv('BOT_API_TIMEOUT', '120'))  # Общий таймаут запроса с загрузкой файла, сек
+
+# Фоновое скачивание медиа
+MEDIA_DOWNLOAD_WORKERS = int(os.getenv('MEDIA_DOWNLOAD_WORKERS', '3'))  # Одновременных загрузок
+MEDIA_DOWNLOAD_QUEUE_SIZE = int(os.getenv('MEDIA_DOWNLOAD_QUEUE_SIZE', '100'))  # Размер очереди загрузки
+
+# Размер хранилища медиа и вытеснение старых файлов
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))  # Лимит размера хранилища, байт
+MEDIA_STALE_DAYS = float(os.getenv('MEDIA_STALE_DAYS', '7'))  # Через сколько дней непроверенная новость считается устаревшей
+MEDIA_EVICTION_INTERVAL = float(os.getenv('MEDIA_EVICTION_INTERVAL', '300'))  # Как часто проверять размер хранилища, сек
+
+# Части альбома приходят отдельными сообщениями; столько секунд после последней части ждем следующую
+ALBUM_COLLECT_WINDOW = float(os.getenv('ALBUM_COLLECT_WINDOW', '1.5'))
+
+# Поиск повторов одной новости в разных каналах
+DEDUP_WINDOW_MINUTES = float(os.getenv('DEDUP_WINDOW_MINUTES', '120'))  # За какой период искать повторы
+DEDUP_SIMILARITY = float(os.getenv('DEDUP_SIMILARITY', '0.6'))  # Доля общих пар слов, начиная с которой текст - повтор
+DEDUP_MIN_WORDS = int(os.getenv('DEDUP_MIN_WORDS', '8'))  # Более короткие тексты сравниваются только по медиа
+
+# Догрузка постов, пропущенных пока парсер не работал
+BACKFILL_LIMIT = int(os.getenv('BACKFILL_LIMIT', '200'))  # Максимум постов на канал
+BACKFILL_NOTIFY_LIMIT = int(os.getenv('BACKFILL_NOTIFY_LIMIT', '20'))  # Сколько самых новых из них отправить модераторам
+
+# Настройки записи новостей в базу пачками
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '50'))  # Максимум новостей в одной транзакции
+INGEST_MAX_LATENCY_MS = float(os.getenv('INGEST_MAX_LATENCY_MS', '20'))  # Сколько ждать остальные новости пачки
+
+# Лимиты Telegram на отправку сообщений, общие для парсера и бота
+RATE_LIMIT_GLOBAL_PER_SECOND = int(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', '30'))  # Всего сообщений в секунду
+RATE_LIMIT_CHAT_PER_SECOND = float(os.getenv('RATE_LIMIT_CHAT_PER_SECOND', '1'))  # В один личный чат
+RATE_LIMIT_CHAT_BURST = int(os.getenv('RATE_LIMIT_CHAT_BURST', '3'))  # Допустимая короткая серия в личный чат
+RATE_LIMIT_GROUP_PER_MINUTE = int(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', '20'))  # В один канал или группу
+RATE_LIMIT_GROUP_BURST = int(os.getenv('RATE_LIMIT_GROUP_BURST', '5'))  # Допустимая короткая серия в канал
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '3'))  # Повторов после ответа 429
+
 # Каналы для парсинга (usernames без @)
 SOURCE_CHANNELS = os.getenv('SOURCE_CHANNELS', '').split(',')
 
+# Кэш данных каналов-источников (username, название, access_hash)
+CHANNEL_CACHE_PATH = os.getenv('CHANNEL_CACHE_PATH', 'channel_cache.json')
+CHANNEL_CACHE_TTL_HOURS = float(os.getenv('CHANNEL_CACHE_TTL_HOURS', '24'))  # Через сколько часов обновлять запись канала
+
 # Канал для публикации новостей
 TARGET_CHANNEL = os.getenv('TARGET_CHANNEL')  # Укажите username канала без @ или ID канала
 
 # ID пользователей, которые могут модерировать новости
 MODERATOR_IDS = [int(id) for id in os.getenv('MODERATOR_IDS', '').split(',') if id]
 
+# Сколько модераторов уведомлять одновременно
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '5'))
+
+# Просмотр очереди непроверенных новостей командой /queue
+QUEUE_PAGE_SIZE = int(os.getenv('QUEUE_PAGE_SIZE', '5'))  # Новостей на странице
+QUEUE_PREVIEW_LENGTH = int(os.getenv('QUEUE_PREVIEW_LENGTH', '300'))  # Сколько символов текста показывать
+
+# Способ получения обновлений ботом: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')  # Публичный адрес, по которому Telegram доступен бот, например https://example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')  # Адрес и порт встроенного HTTP-сервера
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Секрет в заголовке запросов от Telegram; пустой - случайный при каждом запуске
+
+# Наблюдение за процессами парсера и бота в main.py
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', '5'))  # Как часто процессы сообщают, что живы, сек
+HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', '60'))  # Процесс без сигналов дольше этого считается зависшим
+RESTART_BACKOFF_MIN = float(os.getenv('RESTART_BACKOFF_MIN', '1'))  # Задержка первого перезапуска, сек
+RESTART_BACKOFF_MAX = float(os.getenv('RESTART_BACKOFF_MAX', '60'))  # Предел растущей задержки перезапуска, сек
+SUPERVISOR_REPORT_INTERVAL = float(os.getenv('SUPERVISOR_REPORT_INTERVAL', '300'))  # Как часто писать состояние процессов в лог
+
+# Передача новостей от парсера боту
+IPC_QUEUE_SIZE = int(os.getenv('IPC_QUEUE_SIZE', '100'))  # Сколько событий может ждать бота, дальше парсер приостанавливается
+IPC_MAX_IN_FLIGHT = int(os.getenv('IPC_MAX_IN_FLIGHT', '10'))  # Сколько новостей бот рассылает одновременно
+
+# Запись входящих сообщений каналов для воспроизведения (benchmarks/replay.py)
+CAPTURE_PATH = os.getenv('CAPTURE_PATH', '')  # Файл .jsonl.gz; пусто - не записывать
+CAPTURE_FLUSH_INTERVAL = float(os.getenv('CAPTURE_FLUSH_INTERVAL', '5'))  # Как часто сбрасывать запись на диск, сек
+
+# Метрики в формате Prometheus, собираются главным процессом из сигналов жизни
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # 0 - не отдавать метрики
+
 # Настройки базы данных
-DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///telegram_news.db') 
\ No newline at end of file
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///telegram_news.db')
+
+# Профиль SQLite для одновременной работы парсера и бота с одной базой
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '10000'))  # Сколько ждать снятия блокировки записи
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # В режиме WAL NORMAL безопасен и не делает fsync на каждый коммит
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '5'))  # Соединений в пуле на процесс
+SQLITE_LOCK_WAIT_THRESHOLD_MS = int(os.getenv('SQLITE_LOCK_WAIT_THRESHOLD_MS', '100'))  # Запись дольше порога считается ожиданием блокировки
@@ -1,42 +1,617 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy import select, insert, update, delete, func, inspect, event, text, case, tuple_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, Session as OrmSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 import datetime
-from config import DATABASE_URL
+import mimetypes
+import time
+import metrics
+from config import (
+    DATABASE_URL, SQLITE_BUSY_TIMEOUT_MS, SQLITE_SYNCHRONOUS, SQLITE_POOL_SIZE, SQLITE_LOCK_WAIT_THRESHOLD_MS
+)
+
+# Асинхронные драйверы для поддерживаемых СУБД
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def make_async_url(url):
+    """Возвращает URL базы данных с асинхронным драйвером"""
+    url = make_url(url)
+    async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if async_driver and url.drivername != async_driver:
+        url = url.set(drivername=async_driver)
+    return url
+
+
+# Счетчики конкуренции за базу в текущем процессе
+db_stats = {
+    'lock_errors': 0,  # Ошибки "database is locked" после исчерпания busy_timeout
+    'lock_waits': 0,  # Операции записи дольше SQLITE_LOCK_WAIT_THRESHOLD_MS
+    'lock_wait_seconds': 0.0,  # Суммарное время таких операций
+    'max_lock_wait_seconds': 0.0,
+}
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def is_sqlite_url(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def is_sqlite_file(url):
+    return is_sqlite_url(url) and make_url(url).database not in (None, '', ':memory:')
+
+
+def engine_options(url, poolclass):
+    """Параметры движка: для файловой SQLite - профиль для нескольких процессов"""
+    if not is_sqlite_file(url):
+        return {}
+    # Постоянный пул вместо NullPool, чтобы не открывать файл и не выполнять PRAGMA на каждую сессию
+    return {
+        'poolclass': poolclass,
+        'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000},
+        'pool_size': SQLITE_POOL_SIZE,
+        'max_overflow': 0,
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL позволяет читать во время записи, busy_timeout - ждать писателя вместо ошибки"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.monotonic())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.monotonic() - conn.info['query_start'].pop()
+    if elapsed * 1000 >= SQLITE_LOCK_WAIT_THRESHOLD_MS and statement.lstrip().upper().startswith(WRITE_STATEMENTS):
+        db_stats['lock_waits'] += 1
+        db_stats['lock_wait_seconds'] += elapsed
+        db_stats['max_lock_wait_seconds'] = max(db_stats['max_lock_wait_seconds'], elapsed)
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+    if 'database is locked' in str(context.original_exception):
+        db_stats['lock_errors'] += 1
+
+
+def apply_sqlite_profile(sync_engine):
+    """Подключает настройки SQLite и счетчики ожидания блокировок к движку"""
+    event.listen(sync_engine, 'connect', _apply_sqlite_pragmas)
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine, 'handle_error', _handle_error)
+
+
+def get_db_stats():
+    """Возвращает снимок счетчиков конкуренции за базу в текущем процессе"""
+    return dict(db_stats)
+
+
+db_commit_seconds = metrics.histogram('db_commit_seconds', 'Время фиксации транзакции: сброс изменений и COMMIT')
+db_lock_errors = metrics.counter('db_lock_errors_total', 'Ошибки "database is locked" после исчерпания busy_timeout')
+db_lock_waits = metrics.counter('db_lock_waits_total', 'Операции записи дольше SQLITE_LOCK_WAIT_THRESHOLD_MS')
+db_lock_wait_seconds = metrics.counter('db_lock_wait_seconds_total', 'Суммарное время долгих операций записи')
+
+
+@event.listens_for(OrmSession, 'before_commit')
+def _before_commit(session):
+    session.info['commit_start'] = time.monotonic()
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _after_commit(session):
+    started = session.info.pop('commit_start', None)
+    if started is not None:
+        db_commit_seconds.observe(time.monotonic() - started)
+
+
+@metrics.add_collector
+def _collect_db_stats():
+    db_lock_errors.set(db_stats['lock_errors'])
+    db_lock_waits.set(db_stats['lock_waits'])
+    db_lock_wait_seconds.set(db_stats['lock_wait_seconds'])
+
 
 # Создаем подключение к базе данных
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, QueuePool))
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
 
+# Асинхронное подключение для парсера и бота, чтобы не блокировать цикл событий
+async_engine = create_async_engine(make_async_url(DATABASE_URL), **engine_options(DATABASE_URL, AsyncAdaptedQueuePool))
+AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+if is_sqlite_url(DATABASE_URL):
+    apply_sqlite_profile(engine)
+    apply_sqlite_profile(async_engine.sync_engine)
+
+
+# Состояния скачивания медиа новости
+MEDIA_PENDING = 'pending'
+MEDIA_READY = 'ready'
+MEDIA_FAILED = 'failed'
+
+# Тип медиа новости, собранной из нескольких сообщений альбома
+MEDIA_ALBUM = 'album'
+
+
+def get_upload_type(media_type, file_name):
+    """Как отправлять медиа через Bot API: изображения - как фото, остальное - как документ"""
+    if media_type == 'photo':
+        return 'photo'
+    mime_type = mimetypes.guess_type(file_name or '')[0]
+    return 'photo' if mime_type and mime_type.startswith('image/') else 'document'
+
 
 # Модель новости
 class News(Base):
     __tablename__ = 'news'
+    __table_args__ = (
+        # Один пост канала - одна новость, даже при повторной доставке обновления
+        Index('ux_news_source_message', 'source_channel', 'message_id', unique=True),
+        # Постраничный просмотр непроверенных новостей по ключу (date, id)
+        Index('ix_news_review_queue', 'is_reviewed', 'date', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     source_channel = Column(String(100), nullable=False)  # Канал-источник
     message_id = Column(Integer, nullable=False)  # ID сообщения в исходном канале
-    date = Column(DateTime, default=datetime.datetime.now)
+    date = Column(DateTime, default=datetime.datetime.now, index=True)
+    posted_at = Column(DateTime, nullable=True)  # Время публикации поста в канале-источнике, UTC
     content = Column(Text, nullable=False)  # Содержание новости
     original_content = Column(Text, nullable=True)  # Оригинальный текст новости
     has_media = Column(Boolean, default=False)  # Есть ли медиа в новости
     media_type = Column(String(20), nullable=True)  # Тип медиа (photo, video, etc.)
     media_path = Column(String(255), nullable=True)  # Путь к сохраненному медиафайлу
-    is_reviewed = Column(Boolean, default=False)  # Просмотрено ли модератором
+    media_file_id = Column(String(255), nullable=True)  # file_id медиа в Telegram после первой загрузки
+    media_status = Column(String(20), nullable=True)  # Состояние скачивания медиа: pending, ready, failed
+    media_hash = Column(String(64), nullable=True, index=True)  # Хеш содержимого файла в хранилище медиа
+    media_name = Column(String(255), nullable=True)  # Исходное имя файла для отправки в Telegram
+    is_reviewed = Column(Boolean, default=False, index=True)  # Просмотрено ли модератором
     is_approved = Column(Boolean, default=False)  # Одобрено ли модератором
-    is_published = Column(Boolean, default=False)  # Опубликовано ли в целевой канал
+    is_published = Column(Boolean, default=False, index=True)  # Опубликовано ли в целевой канал
     published_message_id = Column(Integer, nullable=True)  # ID опубликованного сообщения
+    telegram_media_id = Column(String(64), nullable=True)  # ID фото или документа в Telegram для поиска повторов
+    duplicate_of = Column(Integer, ForeignKey('news.id'), nullable=True, index=True)  # Первая новость, повтором которой является эта
+
+    # Медиа альбома; загружаются вместе с новостью, так как ленивая загрузка недоступна в асинхронной сессии
+    media_items = relationship(
+        'NewsMedia', order_by='NewsMedia.position', lazy='selectin', cascade='all, delete-orphan'
+    )
+
+    @property
+    def upload_type(self):
+        return get_upload_type(self.media_type, self.media_name or self.media_path)
+
+    @property
+    def is_album(self):
+        return self.media_type == MEDIA_ALBUM
 
     def __repr__(self):
         return f"<News(id={self.id}, source={self.source_channel}, reviewed={self.is_reviewed}, approved={self.is_approved})>"
 
 
+# Медиафайл альбома: Telegram присылает каждое фото альбома отдельным сообщением с общим grouped_id
+class NewsMedia(Base):
+    __tablename__ = 'news_media'
+
+    id = Column(Integer, primary_key=True)
+    news_id = Column(Integer, ForeignKey('news.id'), nullable=False, index=True)
+    position = Column(Integer, nullable=False)  # Порядок в альбоме
+    message_id = Column(Integer, nullable=False)  # ID сообщения-части альбома в исходном канале
+    media_type = Column(String(20), nullable=True)  # Тип медиа (photo, document)
+    media_name = Column(String(255), nullable=True)  # Исходное имя файла для отправки в Telegram
+    media_path = Column(String(255), nullable=True)  # Путь к файлу в хранилище
+    media_hash = Column(String(64), nullable=True, index=True)  # Хеш содержимого файла в хранилище медиа
+    media_file_id = Column(String(255), nullable=True)  # file_id медиа в Telegram после первой загрузки
+    published_message_id = Column(Integer, nullable=True)  # ID сообщения альбома в целевом канале
+
+    @property
+    def upload_type(self):
+        return get_upload_type(self.media_type, self.media_name or self.media_path)
+
+    @property
+    def group_type(self):
+        """Тип элемента в sendMediaGroup: фото и видео можно смешивать, документы - только с документами"""
+        if self.upload_type == 'photo':
+            return 'photo'
+        mime_type = mimetypes.guess_type(self.media_name or self.media_path or '')[0]
+        return 'video' if mime_type and mime_type.startswith('video/') else 'document'
+
+    def __repr__(self):
+        return f"<NewsMedia(id={self.id}, news_id={self.news_id}, position={self.position})>"
+
+
+# Медиафайл в хранилище с адресацией по содержимому
+class MediaFile(Base):
+    __tablename__ = 'media_files'
+
+    hash = Column(String(64), primary_key=True)  # SHA-256 содержимого
+    path = Column(String(255), nullable=False)  # Путь к файлу в хранилище
+    size = Column(BigInteger, nullable=False)  # Размер файла в байтах
+    telegram_id = Column(String(64), nullable=True, unique=True)  # ID фото или документа в Telegram
+    refcount = Column(Integer, default=0)  # Сколько новостей ссылается на файл
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+    def __repr__(self):
+        return f"<MediaFile(hash={self.hash}, size={self.size}, refcount={self.refcount})>"
+
+
+# Последний сохраненный пост канала: с него парсер продолжает после перезапуска
+class ChannelState(Base):
+    __tablename__ = 'channel_state'
+
+    channel = Column(String(100), primary_key=True)  # Канал-источник, как в News.source_channel
+    last_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+    def __repr__(self):
+        return f"<ChannelState(channel={self.channel}, last_message_id={self.last_message_id})>"
+
+
+# Счетчики новостей по каналам и дням для /stats; в SQLite поддерживаются триггерами на таблице news
+class NewsStats(Base):
+    __tablename__ = 'news_stats'
+
+    day = Column(String(10), primary_key=True)  # Дата News.date, ГГГГ-ММ-ДД
+    source_channel = Column(String(100), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    reviewed = Column(Integer, nullable=False, default=0)
+    published = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<NewsStats(day={self.day}, source={self.source_channel}, total={self.total})>"
+
+
+# Поля счетчиков и выражения, дающие вклад одной строки news (OLD или NEW в триггере)
+NEWS_STATS_COUNTERS = {
+    'total': '1',
+    'reviewed': 'coalesce({row}.is_reviewed, 0)',
+    'published': 'coalesce({row}.is_published, 0)',
+}
+
+
+def _news_stats_delta(row, sign):
+    """Команды триггера, прибавляющие (sign='+') или вычитающие (sign='-') строку row из счетчиков"""
+    key = f"coalesce(date({row}.date), '')"
+    statements = []
+    if sign == '+':
+        statements.append(
+            f"INSERT OR IGNORE INTO news_stats (day, source_channel, total, reviewed, published) "
+            f"VALUES ({key}, {row}.source_channel, 0, 0, 0);"
+        )
+    assignments = ', '.join(
+        f"{name} = {name} {sign} {expression.format(row=row)}" for name, expression in NEWS_STATS_COUNTERS.items()
+    )
+    statements.append(
+        f"UPDATE news_stats SET {assignments} WHERE day = {key} AND source_channel = {row}.source_channel;"
+    )
+    return ' '.join(statements)
+
+
+NEWS_STATS_TRIGGERS = {
+    'news_stats_insert': f"AFTER INSERT ON news BEGIN {_news_stats_delta('NEW', '+')} END",
+    'news_stats_delete': f"AFTER DELETE ON news BEGIN {_news_stats_delta('OLD', '-')} END",
+    'news_stats_update': (
+        "AFTER UPDATE OF date, source_channel, is_reviewed, is_published ON news "
+        "WHEN OLD.date IS NOT NEW.date OR OLD.source_channel IS NOT NEW.source_channel "
+        "OR OLD.is_reviewed IS NOT NEW.is_reviewed OR OLD.is_published IS NOT NEW.is_published "
+        f"BEGIN {_news_stats_delta('OLD', '-')} {_news_stats_delta('NEW', '+')} END"
+    ),
+}
+
+
+def _create_news_stats_triggers(connection):
+    """
+    Заводит триггеры счетчиков в SQLite. Если их еще нет (новая или старая база), счетчики
+    пересчитываются по таблице news в той же транзакции.
+    """
+    existing = set(connection.scalars(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")))
+    if existing.issuperset(NEWS_STATS_TRIGGERS):
+        return
+    for name in NEWS_STATS_TRIGGERS:
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+    connection.execute(delete(NewsStats))
+    connection.execute(insert(NewsStats).from_select(
+        ['day', 'source_channel', 'total', 'reviewed', 'published'],
+        select(
+            func.coalesce(func.date(News.date), ''), News.source_channel, func.count(News.id),
+            func.coalesce(func.sum(case((News.is_reviewed == True, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((News.is_published == True, 1), else_=0)), 0),
+        ).group_by(func.coalesce(func.date(News.date), ''), News.source_channel)
+    ))
+    for name, body in NEWS_STATS_TRIGGERS.items():
+        connection.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+def _migrate(connection):
+    """Доводит существующую базу до текущей схемы (новые колонки и индексы)"""
+    inspector = inspect(connection)
+    
+    columns = {column['name'] for column in inspector.get_columns(News.__tablename__)}
+    for column in News.__table__.columns:
+        if column.name not in columns:
+            column_type = column.type.compile(connection.dialect)
+            connection.execute(text(f'ALTER TABLE {News.__tablename__} ADD COLUMN {column.name} {column_type}'))
+    
+    existing = {index['name'] for index in inspector.get_indexes(News.__tablename__)}
+    
+    if 'ux_news_source_message' not in existing:
+        # Перед созданием уникального индекса удаляем накопившиеся дубликаты
+        keep_ids = select(func.min(News.id)).group_by(News.source_channel, News.message_id)
+        connection.execute(delete(News).where(News.id.not_in(keep_ids)))
+    
+    for index in News.__table__.indexes:
+        if index.name not in existing:
+            index.create(connection)
+    
+    if connection.dialect.name == 'sqlite':
+        _create_news_stats_triggers(connection)
+
+
+def _create_schema(connection):
+    Base.metadata.create_all(connection)
+    _migrate(connection)
+
+
 # Создаем таблицы в базе данных, если их нет
 def init_db():
-    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        _create_schema(conn)
+
+
+# Асинхронный вариант init_db для кода, работающего внутри цикла событий
+async def init_db_async():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+
+async def news_exists(session, source_channel, message_id):
+    """Проверяет по уникальному индексу, сохранен ли уже пост канала"""
+    news_id = await session.scalar(
+        select(News.id).where(News.source_channel == source_channel, News.message_id == message_id)
+    )
+    return news_id is not None
+
+
+async def insert_news_ignore(session, values):
+    """
+    Идемпотентно добавляет новость: если пост канала уже сохранен, ничего не делает.
+    Возвращает id новой записи или None для дубликата.
+    """
+    dialect = async_engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = (
+            dialect_insert(News)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=['source_channel', 'message_id'])
+            .returning(News.id)
+        )
+        return await session.scalar(stmt)
+    
+    # Для остальных СУБД полагаемся на уникальный индекс
+    try:
+        async with session.begin_nested():
+            result = await session.execute(insert(News).values(**values))
+        return result.inserted_primary_key[0]
+    except IntegrityError:
+        return None
+
+
+async def insert_news_bulk(session, rows):
+    """
+    Добавляет пачку новостей одним запросом, пропуская уже сохраненные посты.
+    Все строки должны иметь одинаковый набор полей. Возвращает {message_id: id} добавленных записей.
+    """
+    dialect = async_engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = (
+            dialect_insert(News)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=['source_channel', 'message_id'])
+            .returning(News.id, News.message_id)
+        )
+        return {message_id: news_id for news_id, message_id in (await session.execute(stmt)).all()}
+    
+    news_ids = {}
+    for values in rows:
+        news_id = await insert_news_ignore(session, values)
+        if news_id:
+            news_ids[values['message_id']] = news_id
+    return news_ids
+
+
+async def update_channel_state(session, channel, message_id):
+    """Запоминает последний сохраненный пост канала (значение только растет)"""
+    dialect = async_engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(ChannelState).values(
+            channel=channel, last_message_id=message_id, updated_at=datetime.datetime.now()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['channel'],
+            set_={
+                'last_message_id': case(
+                    (stmt.excluded.last_message_id > ChannelState.last_message_id, stmt.excluded.last_message_id),
+                    else_=ChannelState.last_message_id
+                ),
+                'updated_at': stmt.excluded.updated_at,
+            }
+        )
+        await session.execute(stmt)
+        return
+    
+    state = await session.get(ChannelState, channel)
+    if state is None:
+        session.add(ChannelState(channel=channel, last_message_id=message_id))
+    elif message_id > state.last_message_id:
+        state.last_message_id = message_id
+
+
+def _news_counts(source):
+    """Столбцы счетчиков: суммы по news_stats или подсчет по news"""
+    if source is NewsStats:
+        return (
+            func.coalesce(func.sum(NewsStats.total), 0),
+            func.coalesce(func.sum(NewsStats.reviewed), 0),
+            func.coalesce(func.sum(NewsStats.published), 0),
+        )
+    return (
+        func.count(News.id),
+        func.coalesce(func.sum(case((News.is_reviewed == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((News.is_published == True, 1), else_=0)), 0),
+    )
+
+
+def _stats_row(total, reviewed, published):
+    total, reviewed, published = int(total), int(reviewed), int(published)
+    return {'total': total, 'reviewed': reviewed, 'published': published, 'pending': total - published}
+
+
+async def get_news_stats(session, days=7, channels=10):
+    """
+    Счетчики новостей: всего, просмотрено, опубликовано и ожидает публикации, а также по каналам
+    (channels самых крупных) и за последние days дней. В SQLite читаются из news_stats, размер которой
+    зависит от числа каналов и дней, а не новостей; в остальных СУБД считаются по таблице news.
+    """
+    if async_engine.dialect.name == 'sqlite':
+        source, channel_column = NewsStats, NewsStats.source_channel
+        day_column = NewsStats.day
+    else:
+        source, channel_column = News, News.source_channel
+        day_column = func.date(News.date)
+    counts = _news_counts(source)
+    since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+    
+    totals = (await session.execute(select(*counts).select_from(source))).one()
+    by_channel = (await session.execute(
+        select(channel_column, *counts).group_by(channel_column).order_by(counts[0].desc()).limit(channels)
+    )).all()
+    by_day = (await session.execute(
+        select(day_column, *counts).where(day_column >= since).group_by(day_column).order_by(day_column.desc())
+    )).all()
+    return {
+        **_stats_row(*totals),
+        'channels': [(channel, _stats_row(*row)) for channel, *row in by_channel],
+        'days': [(str(day), _stats_row(*row)) for day, *row in by_day],
+    }
+
+
+# Фильтры очереди модерации по типу медиа
+QUEUE_MEDIA_TYPES = ('text', 'photo', 'document', MEDIA_ALBUM)
+
+
+def review_queue_filter(source_channel=None, media_type=None):
+    """Условие отбора непроверенных новостей очереди; повторы в очередь не попадают"""
+    conditions = [News.is_reviewed == False, News.duplicate_of.is_(None)]
+    if source_channel:
+        conditions.append(News.source_channel == source_channel)
+    if media_type == 'text':
+        conditions.append(News.media_type.is_(None))
+    elif media_type:
+        conditions.append(News.media_type == media_type)
+    return conditions
+
+
+async def get_review_queue_page(session, start=None, limit=5, source_channel=None, media_type=None):
+    """
+    Страница очереди по ключу (date, id), начиная с ключа start включительно (None - с начала очереди).
+    Возвращает (новости, ключ начала предыдущей страницы или None, ключ начала следующей или None).
+    Ключ - пара (date, id); переход по ключу, а не по OFFSET, не замедляется в глубине очереди.
+    """
+    conditions = review_queue_filter(source_channel, media_type)
+    key = tuple_(News.date, News.id)
+    query = select(News).where(*conditions)
+    if start is not None:
+        query = query.where(key >= tuple_(*start))
+    items = list(await session.scalars(query.order_by(News.date, News.id).limit(limit + 1)))
+    next_start = (items[limit].date, items[limit].id) if len(items) > limit else None
+    
+    prev_start = None
+    if start is not None:
+        previous = (await session.execute(
+            select(News.date, News.id).where(*conditions, key < tuple_(*start))
+            .order_by(News.date.desc(), News.id.desc()).limit(limit)
+        )).all()
+        if previous:
+            prev_start = tuple(previous[-1])
+    return items[:limit], prev_start, next_start
+
+
+async def count_review_queue(session, source_channel=None, media_type=None):
+    return await session.scalar(select(func.count(News.id)).where(*review_queue_filter(source_channel, media_type)))
+
+
+async def review_news_bulk(session, approved, news_ids=None, source_channel=None, media_type=None):
+    """
+    Одним запросом отмечает проверенными (approved - одобренными, иначе отклоненными) непроверенные новости:
+    с ID из news_ids или все новости очереди с фильтрами. Новости, которые уже проверил кто-то другой, пропускаются,
+    при одобрении - и новости, медиа которых еще скачивается. Возвращает ID отмеченных новостей по порядку очереди.
+    """
+    conditions = review_queue_filter(source_channel, media_type)
+    if news_ids is not None:
+        conditions.append(News.id.in_(news_ids))
+    if approved:
+        conditions.append(or_(News.media_status.is_(None), News.media_status != MEDIA_PENDING))
+    values = {'is_reviewed': True, 'is_approved': approved}
+    
+    if async_engine.dialect.name in ('sqlite', 'postgresql'):
+        stmt = (
+            update(News).where(*conditions).values(**values).returning(News.id, News.date)
+            .execution_options(synchronize_session=False)
+        )
+        rows = (await session.execute(stmt)).all()
+    else:
+        rows = (await session.execute(select(News.id, News.date).where(*conditions).with_for_update())).all()
+        if rows:
+            await session.execute(
+                update(News).where(News.id.in_([news_id for news_id, _ in rows])).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+    return [news_id for news_id, _ in sorted(rows, key=lambda row: (row.date, row.id))]
+
+
+async def set_media_file_id(news_id, file_id):
+    """Запоминает file_id загруженного в Telegram медиафайла новости"""
+    async with get_async_session() as session:
+        await session.execute(update(News).where(News.id == news_id).values(media_file_id=file_id))
+        await session.commit()
+
+
+async def set_album_file_ids(file_ids):
+    """Запоминает file_id загруженных в Telegram медиафайлов альбома: {id элемента: file_id}"""
+    async with get_async_session() as session:
+        for item_id, file_id in file_ids.items():
+            await session.execute(update(NewsMedia).where(NewsMedia.id == item_id).values(media_file_id=file_id))
+        await session.commit()
 
 
 # Функция для получения сессии базы данных
 def get_session():
-    return Session() 
\ No newline at end of file
+    return Session()
+
+
+# Функция для получения асинхронной сессии базы данных
+def get_async_session():
+    return AsyncSession()
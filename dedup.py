@@ -0,0 +1,124 @@
+import hashlib
+import random
+import re
+import time
+from collections import deque
+
+from config import DEDUP_WINDOW_MINUTES, DEDUP_SIMILARITY, DEDUP_MIN_WORDS
+
+# MinHash из 32 хеш-функций, индекс из 16 полос по 2 значения. Тексты с похожестью 0.6 попадают
+# в общую полосу с вероятностью больше 99%, совсем разные почти никогда, поэтому кандидатов мало
+MINHASH_SIZE = 32
+BAND_ROWS = 2
+
+MERSENNE_PRIME = (1 << 61) - 1
+# Параметры хеш-функций фиксированы, чтобы подписи совпадали между перезапусками
+_random = random.Random(20240101)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME)) for _ in range(MINHASH_SIZE)
+]
+
+URL_RE = re.compile(r'https?://\S+|www\.\S+')
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Слова текста без регистра, ссылок и знаков препинания"""
+    text = URL_RE.sub(' ', (text or '').lower()).replace('ё', 'е')
+    return WORD_RE.findall(text)
+
+
+def minhash(text):
+    """
+    MinHash-подпись множества пар соседних слов текста.
+    Для коротких текстов (меньше DEDUP_MIN_WORDS слов) возвращает None: сравнение по ним дает ложные совпадения.
+    """
+    words = normalize(text)
+    if len(words) < DEDUP_MIN_WORDS:
+        return None
+
+    shingles = {
+        int.from_bytes(hashlib.blake2b(f'{words[i]} {words[i + 1]}'.encode(), digest_size=8).digest(), 'big')
+        for i in range(len(words) - 1)
+    }
+    return tuple(
+        min((a * shingle + b) % MERSENNE_PRIME for shingle in shingles)
+        for a, b in PERMUTATIONS
+    )
+
+
+def similarity(a, b):
+    """Оценка коэффициента Жаккара по двум подписям"""
+    return sum(x == y for x, y in zip(a, b)) / MINHASH_SIZE
+
+
+def get_bands(signature):
+    return [
+        (band, signature[band * BAND_ROWS:(band + 1) * BAND_ROWS])
+        for band in range(MINHASH_SIZE // BAND_ROWS)
+    ]
+
+
+class DuplicateIndex:
+    """
+    Индекс недавних новостей для поиска повторов: по MinHash текста и по ID медиа в Telegram.
+    Хранит только новости за последние DEDUP_WINDOW_MINUTES, поэтому поиск не замедляется с ростом базы.
+    Новость в индексе представлена ссылкой news_ref - ее ID или любым объектом, через который его можно получить.
+    Повтором считается только новость из другого канала: каналы часто повторяют свои фирменные картинки.
+    """
+
+    def __init__(self, window_seconds=DEDUP_WINDOW_MINUTES * 60, min_similarity=DEDUP_SIMILARITY):
+        self.window_seconds = window_seconds
+        self.min_similarity = min_similarity
+        self.buckets = {}  # (полоса, значения) -> {news_ref: (подпись, канал)}
+        self.media = {}  # ID медиа в Telegram -> {news_ref: (подпись, канал)}
+        self.entries = deque()  # (время, news_ref, подпись, ID медиа) в порядке добавления
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, signature, media_id, source_channel, now=None):
+        """Возвращает ссылку на первую новость из другого канала, повтором которой является новая, или None"""
+        self.expire(time.time() if now is None else now)
+
+        # Общее медиа без текста достаточно; если текст есть у обеих новостей, он тоже должен совпадать
+        for news_ref, (other, channel) in self.media.get(media_id, {}).items():
+            if channel != source_channel and (
+                signature is None or other is None or similarity(signature, other) >= self.min_similarity
+            ):
+                return news_ref
+
+        if signature is None:
+            return None
+        for key in get_bands(signature):
+            for news_ref, (other, channel) in self.buckets.get(key, {}).items():
+                if channel != source_channel and similarity(signature, other) >= self.min_similarity:
+                    return news_ref
+        return None
+
+    def add(self, news_ref, signature, media_id, source_channel, timestamp=None):
+        """Добавляет новость в индекс"""
+        self.entries.append((time.time() if timestamp is None else timestamp, news_ref, signature, media_id))
+        if signature is not None:
+            for key in get_bands(signature):
+                self.buckets.setdefault(key, {})[news_ref] = (signature, source_channel)
+        if media_id is not None:
+            self.media.setdefault(media_id, {})[news_ref] = (signature, source_channel)
+
+    def expire(self, now):
+        """Удаляет из индекса новости старше окна"""
+        while self.entries and self.entries[0][0] < now - self.window_seconds:
+            _, news_ref, signature, media_id = self.entries.popleft()
+            if signature is not None:
+                for key in get_bands(signature):
+                    self.discard(self.buckets, key, news_ref)
+            if media_id is not None:
+                self.discard(self.media, media_id, news_ref)
+
+    @staticmethod
+    def discard(index, key, news_ref):
+        entries = index.get(key)
+        if entries is not None:
+            entries.pop(news_ref, None)
+            if not entries:
+                del index[key]
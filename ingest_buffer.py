@@ -0,0 +1,118 @@
+import asyncio
+import logging
+
+from sqlalchemy import select
+
+from config import INGEST_BATCH_SIZE, INGEST_MAX_LATENCY_MS
+from database import get_async_session, News, NewsMedia, insert_news_ignore, update_channel_state
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """
+    Буфер вставки новостей: новости, пришедшие почти одновременно, записываются одной транзакцией.
+    Пачка записывается, когда в ней набралось max_batch_size новостей или с первой прошло max_latency секунд.
+    Каждый вызывающий получает свою сохраненную новость после коммита пачки.
+    """
+
+    def __init__(self, max_batch_size=INGEST_BATCH_SIZE, max_latency=INGEST_MAX_LATENCY_MS / 1000):
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.pending = []  # (values, элементы альбома, последний ID сообщения, future)
+        self.timer = None
+        self.write_lock = asyncio.Lock()  # SQLite допускает одного писателя, пачки пишутся по очереди
+        self.write_tasks = set()
+        self.stats = {'batches': 0, 'items': 0, 'max_batch_size': 0}
+
+    async def submit(self, values, album_items=None, last_message_id=None):
+        """Добавляет новость в пачку и ждет коммита. Возвращает новость или None, если пост уже был сохранен"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((values, album_items, last_message_id or values['message_id'], future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_latency, self.flush)
+        return await future
+
+    def flush(self):
+        """Отправляет накопленную пачку на запись"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self.write(batch))
+            self.write_tasks.add(task)
+            task.add_done_callback(self.write_tasks.discard)
+
+    async def close(self):
+        """Записывает оставшиеся новости и дожидается всех пачек"""
+        self.flush()
+        await asyncio.gather(*self.write_tasks, return_exceptions=True)
+
+    async def write(self, batch):
+        async with self.write_lock:
+            try:
+                results = await self.write_batch(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    self.resolve(batch[0], error=e)
+                    return
+                # Одна ошибочная новость не должна терять остальные: пишем пачку по одной
+                logger.error(f"Ошибка при записи пачки из {len(batch)} новостей, записываем по одной: {e}")
+                for item in batch:
+                    try:
+                        self.resolve(item, (await self.write_batch([item]))[0])
+                    except Exception as item_error:
+                        self.resolve(item, error=item_error)
+                return
+
+        for item, news in zip(batch, results):
+            self.resolve(item, news)
+
+    @staticmethod
+    def resolve(item, news=None, error=None):
+        """Передает результат записи ожидающему вызову, если он еще ждет"""
+        future = item[3]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(news)
+
+    async def write_batch(self, batch):
+        """Записывает пачку одной транзакцией и возвращает сохраненные новости в порядке пачки"""
+        async with get_async_session() as session:
+            news_ids = []
+            last_message_ids = {}
+            for values, album_items, last_message_id, _ in batch:
+                news_id = await insert_news_ignore(session, values)
+                if news_id and album_items:
+                    session.add_all(NewsMedia(news_id=news_id, **item) for item in album_items)
+                news_ids.append(news_id)
+                channel = values['source_channel']
+                last_message_ids[channel] = max(last_message_ids.get(channel, 0), last_message_id)
+            for channel, last_message_id in last_message_ids.items():
+                await update_channel_state(session, channel, last_message_id)
+            await session.commit()
+
+            saved_ids = [news_id for news_id in news_ids if news_id]
+            saved = {
+                news.id: news
+                for news in (await session.scalars(select(News).where(News.id.in_(saved_ids)))).all()
+            } if saved_ids else {}
+
+        self.stats['batches'] += 1
+        self.stats['items'] += len(batch)
+        self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+        return [saved.get(news_id) for news_id in news_ids]
+
+    def get_stats(self):
+        """Число пачек, новостей и средний размер пачки"""
+        stats = dict(self.stats, pending=len(self.pending))
+        stats['avg_batch_size'] = stats['items'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
@@ -0,0 +1,274 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import select
+import shutil
+import socket
+import tempfile
+import threading
+
+from config import IPC_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# События, которые парсер передает боту
+NEWS_SAVED = 'news_saved'  # Новая новость сохранена, ее нужно разослать модераторам
+NEWS_MEDIA_READY = 'news_media_ready'  # Медиа новости скачано, текстовые превью нужно заменить версией с медиа
+NEWS_MEDIA_FAILED = 'news_media_failed'  # Медиа новости не скачано, заменять текстовые превью нечем
+
+# Роли подключений к посреднику
+ROLE_SENDER = 'sender'
+ROLE_RECEIVER = 'receiver'
+
+ACK = b'ok\n'
+
+# Пауза перед повторным подключением к посреднику, сек
+RECONNECT_DELAY = 1.0
+
+# Через сколько секунд ожидания подтверждения писать в лог, что очередь заполнена
+FULL_WARNING_DELAY = 1.0
+
+
+def encode(message):
+    return json.dumps(message).encode() + b'\n'
+
+
+class NewsBroker:
+    """
+    Посредник событий о новостях между парсером и ботом. Работает в главном процессе, который
+    не перезапускается, и хранит события в памяти; парсер и бот подключаются к нему через Unix-сокет.
+
+    Между процессами нет общих блокировок, поэтому убитый наблюдателем парсер или бот не может
+    оставить канал в неработающем состоянии: его соединение просто закрывается, а новый процесс
+    подключается заново. Событие считается переданным боту только после подтверждения; неподтвержденное
+    событие отключившегося бота возвращается в начало очереди.
+
+    В очереди не больше maxsize событий: когда она заполнена, посредник не подтверждает событие парсеру,
+    и тот ждет, а не копит события в памяти.
+    """
+
+    def __init__(self, maxsize=IPC_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.events = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        # Сокет в личном временном каталоге, чтобы к нему не подключились другие пользователи
+        self.directory = tempfile.mkdtemp(prefix='news-ipc-')
+        self.path = os.path.join(self.directory, 'events.sock')
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen()
+        threading.Thread(target=self.accept_connections, name='news-broker', daemon=True).start()
+
+    def channel(self):
+        """Канал для дочернего процесса"""
+        return NewsChannel(self.path)
+
+    def qsize(self):
+        return len(self.events)
+
+    def accept_connections(self):
+        while not self.closed:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.serve, args=(connection,), name='news-broker-client', daemon=True).start()
+
+    def serve(self, connection):
+        try:
+            with connection, connection.makefile('rb') as stream:
+                role = stream.readline().strip().decode()
+                if role == ROLE_SENDER:
+                    self.serve_sender(connection, stream)
+                elif role == ROLE_RECEIVER:
+                    self.serve_receiver(connection, stream)
+                else:
+                    logger.warning(f"Неизвестная роль подключения к посреднику событий: {role!r}")
+        except OSError as e:
+            logger.info(f"Соединение с посредником событий закрыто: {e}")
+
+    def serve_sender(self, connection, stream):
+        """Принимает события парсера; подтверждает каждое, только когда в очереди есть для него место"""
+        for line in stream:
+            event = tuple(json.loads(line))
+            with self.condition:
+                while len(self.events) >= self.maxsize and not self.closed:
+                    self.condition.wait()
+                self.events.append(event)
+                self.condition.notify_all()
+            connection.sendall(ACK)
+
+    def serve_receiver(self, connection, stream):
+        """Передает события боту по одному и удаляет событие из очереди после подтверждения"""
+        while not self.closed:
+            with self.condition:
+                while not self.events and not self.closed:
+                    self.condition.wait(timeout=1.0)
+                    if is_closed_by_peer(connection):
+                        return
+                if self.closed:
+                    return
+                event = self.events.popleft()
+                self.condition.notify_all()
+            try:
+                connection.sendall(encode([*event, len(self.events)]))
+                acknowledged = stream.readline() == ACK
+            except OSError:
+                acknowledged = False
+            if not acknowledged:
+                # Бот отключился, не подтвердив событие: его получит следующий процесс бота
+                with self.condition:
+                    self.events.appendleft(event)
+                    self.condition.notify_all()
+                return
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.listener.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def is_closed_by_peer(connection):
+    """Закрыл ли процесс на другой стороне соединение (например, был убит)"""
+    readable, _, _ = select.select([connection], [], [], 0)
+    if not readable:
+        return False
+    try:
+        return connection.recv(1, socket.MSG_PEEK) == b''
+    except OSError:
+        return True
+
+
+class NewsChannel:
+    """
+    Канал событий о новостях от парсера к боту через посредника в главном процессе (NewsBroker).
+    Передаются только ID новостей: данные бот читает из базы. Процесс подключается при первом
+    использовании канала и переподключается после обрыва. В одном процессе канал либо отправляет
+    события (парсер), либо получает (бот).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = None
+        self.writer = None
+        self.lock = None
+        self.depth = 0  # Глубина очереди посредника по последнему полученному событию
+
+    def __getstate__(self):
+        # В дочерний процесс передается только адрес, соединение и блокировка в каждом процессе свои
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    async def connect(self, role):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self.writer.write(role.encode() + b'\n')
+        await self.writer.drain()
+
+    def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    def get_lock(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+    async def send(self, event, news_id):
+        """Отправляет событие боту; при заполненной очереди ждет, пока бот ее разберет"""
+        # События отправляются по одному, чтобы сохранить их порядок
+        async with self.get_lock():
+            while True:
+                try:
+                    if self.writer is None:
+                        await self.connect(ROLE_SENDER)
+                    self.writer.write(encode([event, news_id]))
+                    await self.writer.drain()
+                    # Посредник подтверждает событие, только когда в очереди есть место
+                    reading = asyncio.ensure_future(self.reader.readline())
+                    try:
+                        done, _ = await asyncio.wait({reading}, timeout=FULL_WARNING_DELAY)
+                        if not done:
+                            logger.warning("Очередь событий для бота заполнена: бот не успевает рассылать новости, ждем")
+                        ack = await reading
+                    finally:
+                        reading.cancel()
+                    if ack == ACK:
+                        return
+                    raise ConnectionError("посредник закрыл соединение")
+                except OSError as e:
+                    # Событие отправляется заново: посредник мог не успеть его принять
+                    logger.error(f"Нет связи с посредником событий: {e}, повтор через {RECONNECT_DELAY:g} с")
+                    self.disconnect()
+                    await asyncio.sleep(RECONNECT_DELAY)
+
+    async def receive(self, timeout=1.0):
+        """Возвращает следующее событие (тип, ID новости) или None, если за timeout секунд событий не было"""
+        async with self.get_lock():
+            try:
+                if self.reader is None:
+                    await self.connect(ROLE_RECEIVER)
+                try:
+                    line = await asyncio.wait_for(self.reader.readline(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+                if not line:
+                    raise ConnectionError("посредник закрыл соединение")
+                event, news_id, self.depth = json.loads(line)
+                self.writer.write(ACK)
+                await self.writer.drain()
+                return event, news_id
+            except OSError as e:
+                logger.error(f"Нет связи с посредником событий: {e}, повтор через {RECONNECT_DELAY:g} с")
+                self.disconnect()
+                await asyncio.sleep(RECONNECT_DELAY)
+                return None
+
+    def qsize(self):
+        """Число событий в очереди посредника по последним данным"""
+        return self.depth
+
+
+class LocalNewsChannel:
+    """Канал внутри одного процесса, когда парсер и бот запущены без главного процесса (замеры, отладка)"""
+
+    def __init__(self, maxsize=IPC_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize)
+
+    async def send(self, event, news_id):
+        if self.queue.full():
+            logger.warning("Очередь событий для бота заполнена: бот не успевает рассылать новости, ждем")
+        await self.queue.put((event, news_id))
+
+    async def receive(self, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+_news_channel = None
+
+
+def use_news_channel(channel):
+    """Подключает процесс к каналу, созданному в главном процессе"""
+    global _news_channel
+    _news_channel = channel
+
+
+def get_news_channel():
+    """Канал текущего процесса; без канала из главного процесса создается локальный"""
+    global _news_channel
+    if _news_channel is None:
+        _news_channel = LocalNewsChannel()
+    return _news_channel
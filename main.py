@@ -1,12 +1,13 @@
 import asyncio
 import logging
 import sys
-import os
-from multiprocessing import Process
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 
 from config import API_ID, API_HASH, PHONE_NUMBER
+from ipc import NewsBroker, use_news_channel
+from rate_limiter import SharedRateState, use_shared_state
+from supervisor import Supervisor, run_with_heartbeats
 
 # Настройка логирования
 logging.basicConfig(
@@ -52,16 +53,31 @@ async def authenticate_telethon():
     await parser_client.disconnect()
 
 
-def run_parser():
+def init_database():
+    """
+    Создает и обновляет схему базы один раз до запуска процессов. Если парсер и бот делают это
+    одновременно, один из них падает на уже созданной другим таблице.
+    """
+    from database import init_db, engine
+    init_db()
+    # Соединения главного процесса не должны достаться дочерним процессам при fork
+    engine.dispose()
+
+
+def run_parser(rate_state, news_channel, heartbeats):
     """Запускает парсер новостей"""
+    use_shared_state(rate_state)
+    use_news_channel(news_channel)
     from parser import run_parser
-    asyncio.run(run_parser())
+    asyncio.run(run_with_heartbeats('parser', heartbeats, run_parser()))
 
 
-def run_bot():
+def run_bot(rate_state, news_channel, heartbeats):
     """Запускает бота модерации"""
+    use_shared_state(rate_state)
+    use_news_channel(news_channel)
     from bot import main
-    asyncio.run(main())
+    asyncio.run(run_with_heartbeats('bot', heartbeats, main()))
 
 
 if __name__ == "__main__":
@@ -74,31 +90,32 @@ if __name__ == "__main__":
         logger.error(f"Ошибка при аутентификации: {e}")
         sys.exit(1)
     
-    # Создаем процесс для парсера
-    parser_process = Process(target=run_parser)
-    parser_process.start()
-    logger.info("Парсер новостей запущен")
+    try:
+        init_database()
+    except Exception as e:
+        logger.error(f"Ошибка при подготовке базы данных: {e}")
+        sys.exit(1)
+    
+    # Общие для обоих процессов лимиты отправки в Bot API
+    rate_state = SharedRateState()
     
-    # Создаем процесс для бота
-    bot_process = Process(target=run_bot)
-    bot_process.start()
-    logger.info("Бот модерации запущен")
+    # Парсер передает боту ID новых новостей через посредника в этом процессе, вся отправка
+    # в Telegram идет из процесса бота. Посредник переживает перезапуск любого из процессов
+    news_broker = NewsBroker()
+    news_channel = news_broker.channel()
+    
+    # Супервизор запускает процессы и перезапускает упавшие или зависшие;
+    # канал для сигналов жизни он передает процессу последним аргументом
+    supervisor = Supervisor()
+    supervisor.add('parser', run_parser, (rate_state, news_channel))
+    supervisor.add('bot', run_bot, (rate_state, news_channel))
     
     try:
-        # Ожидаем завершения процессов
-        parser_process.join()
-        bot_process.join()
+        supervisor.run()
     except KeyboardInterrupt:
-        logger.info("Получен сигнал завершения, останавливаем приложение...")
-        parser_process.terminate()
-        bot_process.terminate()
-        parser_process.join()
-        bot_process.join()
-        logger.info("Приложение остановлено")
+        logger.info("Получен сигнал завершения, приложение остановлено")
     except Exception as e:
         logger.error(f"Произошла ошибка: {e}")
-        parser_process.terminate()
-        bot_process.terminate()
-        parser_process.join()
-        bot_process.join()
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        news_broker.close()
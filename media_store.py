@@ -0,0 +1,230 @@
+import os
+import asyncio
+import datetime
+import hashlib
+import logging
+import uuid
+
+from sqlalchemy import select, update, delete, func, case, and_, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+
+from config import MEDIA_CACHE_MAX_BYTES, MEDIA_STALE_DAYS
+from database import get_async_session, async_engine, MediaFile, News, NewsMedia
+
+logger = logging.getLogger(__name__)
+
+# Директория хранилища медиа
+MEDIA_DIR = os.path.join(os.getcwd(), 'media')
+
+# Размер блока при подсчете хеша файла
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_telegram_media_id(message):
+    """ID фото или документа в Telegram: один и тот же файл, пересланный разными каналами, имеет один ID"""
+    media = message.media
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return f'photo:{media.photo.id}'
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return f'document:{media.document.id}'
+    return None
+
+
+def hash_file(path):
+    """Считает SHA-256 файла блоками, не читая его в память целиком. Возвращает хеш и размер"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class MediaStore:
+    """
+    Хранилище медиа с адресацией по содержимому: файл лежит по пути из его SHA-256,
+    поэтому одинаковые файлы хранятся один раз, а файлы с одинаковыми именами не перезаписывают друг друга.
+    """
+
+    def __init__(self, root=MEDIA_DIR):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.in_progress = {}  # Скачивания, идущие прямо сейчас, по ID медиа в Telegram
+
+    def path_for(self, digest, ext=''):
+        """Путь файла в хранилище: ab/cd/abcd...ext, чтобы в одной директории не копились тысячи файлов"""
+        return os.path.join(self.root, digest[:2], digest[2:4], f'{digest}{ext}')
+
+    async def find_by_telegram_id(self, telegram_id):
+        """Ищет уже сохраненный файл по ID медиа в Telegram"""
+        if telegram_id is None:
+            return None
+        async with get_async_session() as session:
+            media_file = await session.scalar(select(MediaFile).where(MediaFile.telegram_id == telegram_id))
+        if media_file is not None and os.path.exists(media_file.path):
+            return media_file
+        return None
+
+    async def fetch(self, client, message, media_name):
+        """
+        Возвращает файл медиа сообщения из хранилища, скачивая его только если такого медиа еще нет.
+        Второй элемент результата - было ли скачивание.
+        """
+        telegram_id = get_telegram_media_id(message)
+
+        while True:
+            media_file = await self.find_by_telegram_id(telegram_id)
+            if media_file is not None:
+                return media_file, False
+            if telegram_id not in self.in_progress:
+                break
+            # Тот же файл уже скачивается для другой новости - ждем его вместо повторного скачивания
+            await self.in_progress[telegram_id].wait()
+
+        done = asyncio.Event()
+        if telegram_id is not None:
+            self.in_progress[telegram_id] = done
+        try:
+            return await self.download(client, message, media_name, telegram_id), True
+        finally:
+            self.in_progress.pop(telegram_id, None)
+            done.set()
+
+    async def download(self, client, message, media_name, telegram_id):
+        """Скачивает файл во временную директорию, считает хеш и переносит файл на его место в хранилище"""
+        ext = os.path.splitext(media_name or '')[1].lower()
+        temp_path = os.path.join(self.tmp_dir, f'{uuid.uuid4().hex}{ext}')
+        try:
+            await client.download_media(message, temp_path)
+            digest, size = await asyncio.get_running_loop().run_in_executor(None, hash_file, temp_path)
+            path = self.path_for(digest, ext)
+            if os.path.exists(path):
+                logger.info(f"Файл {media_name} совпадает с уже сохраненным {path}")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return await self.register(digest, path, size, telegram_id)
+
+    async def register(self, digest, path, size, telegram_id):
+        """Добавляет файл в таблицу хранилища; если такое содержимое уже есть, запоминает ID медиа в Telegram"""
+        async with get_async_session() as session:
+            dialect = async_engine.dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+                await session.execute(
+                    dialect_insert(MediaFile)
+                    .values(hash=digest, path=path, size=size, refcount=0)
+                    .on_conflict_do_nothing(index_elements=['hash'])
+                )
+            elif await session.get(MediaFile, digest) is None:
+                session.add(MediaFile(hash=digest, path=path, size=size, refcount=0))
+                await session.flush()
+
+            if telegram_id is not None:
+                # Один файл может прийти под разными ID; в таблице хранится первый, остальные находятся по хешу
+                taken = await session.scalar(select(MediaFile.hash).where(MediaFile.telegram_id == telegram_id))
+                if taken is None:
+                    await session.execute(
+                        update(MediaFile)
+                        .where(MediaFile.hash == digest, MediaFile.telegram_id.is_(None))
+                        .values(telegram_id=telegram_id)
+                    )
+
+            media_file = await session.get(MediaFile, digest)
+            await session.commit()
+        return media_file
+
+    @staticmethod
+    async def attach(session, news, media_file):
+        """Привязывает файл к новости (или элементу альбома) и увеличивает число ссылок на него"""
+        if news.media_hash == media_file.hash:
+            return
+        if news.media_hash:
+            await session.execute(
+                update(MediaFile).where(MediaFile.hash == news.media_hash).values(refcount=MediaFile.refcount - 1)
+            )
+        await session.execute(
+            update(MediaFile).where(MediaFile.hash == media_file.hash).values(refcount=MediaFile.refcount + 1)
+        )
+        news.media_hash = media_file.hash
+        news.media_path = media_file.path
+
+        if not news.media_file_id:
+            # Файл уже загружался в Telegram с другой новостью - переиспользуем его file_id
+            for model in (News, NewsMedia):
+                news.media_file_id = await session.scalar(
+                    select(model.media_file_id)
+                    .where(model.media_hash == media_file.hash, model.media_file_id.is_not(None))
+                    .limit(1)
+                )
+                if news.media_file_id:
+                    break
+
+    async def evict(self, max_bytes=MEDIA_CACHE_MAX_BYTES, stale_days=MEDIA_STALE_DAYS):
+        """
+        Удаляет файлы, пока хранилище больше max_bytes.
+        Файлы новостей, ожидающих модерации или публикации, не трогаются; остальные удаляются
+        начиная с давно не использовавшихся. Возвращает число удаленных файлов и освобожденных байт.
+        """
+        async with get_async_session() as session:
+            total = await session.scalar(select(func.coalesce(func.sum(MediaFile.size), 0)))
+            if total <= max_bytes:
+                return 0, 0
+
+            # На файл ссылаются новости напрямую или через элементы альбома
+            refs = union_all(
+                select(News.media_hash.label('hash'), News.date, News.is_published),
+                select(NewsMedia.media_hash, News.date, News.is_published).join(News, News.id == NewsMedia.news_id),
+            ).subquery()
+
+            # Новость еще в работе, если она не опубликована и не устарела
+            cutoff = datetime.datetime.now() - datetime.timedelta(days=stale_days)
+            in_work = func.coalesce(func.sum(case(
+                (and_(refs.c.is_published.is_(False), refs.c.date >= cutoff), 1), else_=0
+            )), 0)
+            last_used = func.coalesce(func.max(refs.c.date), MediaFile.created_at)
+            candidates = (await session.execute(
+                select(MediaFile.hash, MediaFile.path, MediaFile.size)
+                .outerjoin(refs, refs.c.hash == MediaFile.hash)
+                .group_by(MediaFile.hash, MediaFile.path, MediaFile.size, MediaFile.created_at)
+                .having(in_work == 0)
+                .order_by(last_used)
+            )).all()
+
+            evicted = []
+            freed = 0
+            for digest, path, size in candidates:
+                if total - freed <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Не удалось удалить файл {path} из хранилища: {e}")
+                    continue
+                evicted.append(digest)
+                freed += size
+
+            if evicted:
+                # Новости остаются с кэшированным file_id, по которому медиа можно отправить без файла
+                for model in (News, NewsMedia):
+                    await session.execute(
+                        update(model).where(model.media_hash.in_(evicted)).values(media_path=None, media_hash=None)
+                    )
+                await session.execute(delete(MediaFile).where(MediaFile.hash.in_(evicted)))
+                await session.commit()
+
+        if total - freed > max_bytes:
+            logger.warning(
+                f"Хранилище медиа занимает {total - freed} байт при лимите {max_bytes}: "
+                f"остальные файлы принадлежат новостям на модерации"
+            )
+        return len(evicted), freed
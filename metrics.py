@@ -0,0 +1,204 @@
+import math
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        return [(dict(zip(self.labelnames, key)), value) for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Для счетчиков, которые ведутся в другом месте и копируются в метрику сборщиком"""
+        self.values[self.key(labels)] = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        if key not in self.values:
+            # Число попаданий в каждую корзину (не накопительно), сумма и количество
+            self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        state = self.values[key]
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                state['buckets'][position] += 1
+                break
+        state['sum'] += value
+        state['count'] += 1
+
+    def samples(self):
+        # Копии: снимок сериализуется при отправке в канал сигналов жизни (Pipe) в потоке исполнителя,
+        # пока цикл событий продолжает менять значения
+        return [
+            (labels, dict(state, buckets=list(state['buckets'])))
+            for labels, state in super().samples()
+        ]
+
+
+class Registry:
+    """Метрики процесса. Снимок передается главному процессу вместе с сигналом жизни"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric_class, name, documentation, labelnames=(), **kwargs):
+        if name not in self.metrics:
+            self.metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+        return self.metrics[name]
+
+    def add_collector(self, collector):
+        """Функция, обновляющая метрики (например, глубину очередей) перед каждым снимком"""
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        """Значения всех метрик в виде, пригодном для передачи между процессами"""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Ошибка при сборе метрик: {e}")
+        return [
+            describe(metric.name, metric.documentation, metric.type, metric.samples(), getattr(metric, 'buckets', None))
+            for metric in self.metrics.values()
+        ]
+
+
+def describe(name, documentation, type, samples, buckets=None):
+    """Описание метрики в снимке: samples - список пар (метки, значение)"""
+    return {'name': name, 'documentation': documentation, 'type': type, 'buckets': buckets, 'samples': samples}
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def add_collector(collector):
+    REGISTRY.add_collector(collector)
+    return collector
+
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def render(snapshots):
+    """
+    Объединяет снимки процессов в текстовый формат Prometheus.
+    snapshots - {имя процесса: снимок}; к каждому значению добавляется метка process.
+    """
+    merged = {}
+    for process, metrics in snapshots.items():
+        for metric in metrics:
+            entry = merged.setdefault(metric['name'], dict(metric, samples=[]))
+            entry['samples'] += [(dict(labels, process=process), value) for labels, value in metric['samples']]
+
+    lines = []
+    for name, metric in merged.items():
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in metric['samples']:
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'], value['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(dict(labels, le=format_value(float(bound))))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(dict(labels, le='+Inf'))} {value['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_value(value['sum'])}")
+            lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def start_http_server(host, port, collect):
+    """
+    Отдает метрики по HTTP (GET /metrics) в отдельном потоке.
+    collect - функция, возвращающая {имя процесса: снимок} на момент запроса.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render(collect()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Метрики доступны по адресу http://{host}:{port}/metrics")
+    return server
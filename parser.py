@@ -1,15 +1,28 @@
-import os
 import asyncio
-import json
+import mimetypes
+import time
 from telethon import TelegramClient, events
-from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage, PeerChannel
 import logging
-from datetime import datetime
-import aiohttp
-import mimetypes
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, func
 
-from config import API_ID, API_HASH, PHONE_NUMBER, SOURCE_CHANNELS, BOT_TOKEN, MODERATOR_IDS
-from database import get_session, News, init_db
+from config import (
+    API_ID, API_HASH, SOURCE_CHANNELS,
+    MEDIA_DOWNLOAD_WORKERS, MEDIA_DOWNLOAD_QUEUE_SIZE, MEDIA_EVICTION_INTERVAL, ALBUM_COLLECT_WINDOW,
+    DEDUP_WINDOW_MINUTES, BACKFILL_LIMIT, BACKFILL_NOTIFY_LIMIT, CAPTURE_PATH
+)
+from database import (
+    get_async_session, News, NewsMedia, ChannelState, init_db_async, MEDIA_PENDING, MEDIA_READY, MEDIA_FAILED,
+    MEDIA_ALBUM, news_exists, insert_news_bulk, update_channel_state
+)
+from capture import CaptureWriter, EVENT_NEW, EVENT_EDIT
+from channel_cache import ChannelCache
+import metrics
+from dedup import DuplicateIndex, minhash
+from ingest_buffer import IngestBuffer
+from ipc import get_news_channel, NEWS_SAVED, NEWS_MEDIA_READY, NEWS_MEDIA_FAILED
+from media_store import MediaStore, get_telegram_media_id
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,264 +31,665 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Директория для сохранения медиа
-MEDIA_DIR = os.path.join(os.getcwd(), 'media')
-os.makedirs(MEDIA_DIR, exist_ok=True)
+media_download_seconds = metrics.histogram('media_download_seconds', 'Время скачивания медиа из Telegram')
+media_download_bytes = metrics.counter('media_download_bytes_total', 'Скачано байт медиа')
+media_downloads = metrics.counter(
+    'media_downloads_total', 'Получение медиа: downloaded, deduplicated (уже в хранилище), failed', ['result']
+)
+queue_depth = metrics.gauge('queue_depth', 'Глубина внутренних очередей', ['queue'])
+
+
+def get_posted_at(message):
+    """Время публикации поста в канале-источнике: UTC без часового пояса, как остальные даты в базе"""
+    if message.date is None:
+        return None
+    return message.date.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 class NewsParser:
     def __init__(self):
         self.client = None
-        self.session = get_session()
+        self.news_channel = get_news_channel()  # Рассылкой модераторам занимается бот, парсер передает ему ID новостей
+        self.download_queue = asyncio.Queue(maxsize=MEDIA_DOWNLOAD_QUEUE_SIZE)  # Медиа, ожидающие скачивания
+        self.download_tasks = []
+        self.download_stats = {'completed': 0, 'failed': 0, 'deduplicated': 0, 'bytes': 0, 'seconds': 0.0}
+        self.media_store = MediaStore()  # Медиа хранятся по хешу содержимого
+        self.eviction_task = None
+        self.albums = {}  # Части альбомов, ожидающие окончания окна сбора, по (канал, grouped_id)
+        self.duplicates = DuplicateIndex()  # Недавние новости для поиска повторов из других каналов
+        self.ingest = IngestBuffer()  # Группирует вставки новостей в общие транзакции
+        self.channels = ChannelCache()  # Данные каналов-источников, чтобы не запрашивать их на каждое сообщение
+        self.channel_ids = []  # ID каналов-источников
+        self.capture = CaptureWriter(CAPTURE_PATH) if CAPTURE_PATH else None  # Запись входящих сообщений
+        metrics.add_collector(self.collect_metrics)
 
     async def start(self):
-        # Инициализация клиента Telethon, используя существующую сессию
-        self.client = TelegramClient('parser_session', API_ID, API_HASH)
-        
-        # Подключаемся без запроса кода (использует существующую сессию)
-        await self.client.connect()
-        
-        # Проверяем, что пользователь авторизован
-        if not await self.client.is_user_authorized():
-            logger.error("Парсер не авторизован. Запустите main.py для авторизации.")
-            return
-        
-        logger.info("Парсер запущен и авторизован")
+        try:
+            # Инициализация клиента Telethon, используя существующую сессию
+            self.client = TelegramClient('parser_session', API_ID, API_HASH)
+            
+            # Подключаемся без запроса кода (использует существующую сессию)
+            await self.client.connect()
+            
+            # Проверяем, что пользователь авторизован
+            if not await self.client.is_user_authorized():
+                logger.error("Парсер не авторизован. Запустите main.py для авторизации.")
+                return
+            
+            logger.info("Парсер запущен и авторизован")
+            
+            # Каналы разрешаются один раз; известные по прошлым запускам берутся из кэша без запросов
+            self.channel_ids = await self.channels.warm(
+                self.client, [channel.strip() for channel in SOURCE_CHANNELS if channel.strip()]
+            )
+            
+            await self.warm_duplicate_index()
+            self.start_workers()
+            await self.requeue_pending_downloads()
+
+            # Подписка на новые сообщения в указанных каналах
+            @self.client.on(events.NewMessage(chats=[PeerChannel(channel_id) for channel_id in self.channel_ids]))
+            async def new_message_handler(event):
+                await self.process_message(event)
+            
+            if self.capture is not None:
+                # Правки постов парсер не обрабатывает, но они нужны в записи для воспроизведения
+                @self.client.on(events.MessageEdited(chats=[PeerChannel(channel_id) for channel_id in self.channel_ids]))
+                async def message_edited_handler(event):
+                    await self.capture_edit(event)
+            
+            # Посты, опубликованные пока парсер не работал, догружаются после подписки,
+            # чтобы не потерять сообщения, пришедшие во время догрузки
+            try:
+                await self.backfill()
+            except Exception as e:
+                logger.error(f"Ошибка при догрузке пропущенных постов: {e}")
+
+            # Бесконечный цикл для поддержания работы клиента
+            await self.client.run_until_disconnected()
+        finally:
+            await self.stop()
 
-        # Подписка на новые сообщения в указанных каналах
-        @self.client.on(events.NewMessage(chats=SOURCE_CHANNELS))
-        async def new_message_handler(event):
-            await self.process_message(event)
+    def start_workers(self):
+        """Запускает пул фоновых загрузок медиа и периодическую очистку хранилища"""
+        self.download_tasks = [
+            asyncio.create_task(self.download_worker()) for _ in range(MEDIA_DOWNLOAD_WORKERS)
+        ]
+        self.eviction_task = asyncio.create_task(self.media_eviction_loop())
 
-        # Бесконечный цикл для поддержания работы клиента
-        await self.client.run_until_disconnected()
+    async def stop(self):
+        """Останавливает фоновые загрузки и закрывает соединения парсера"""
+        # Новости, ожидающие записи, сохраняются до остановки
+        await self.ingest.close()
+        await self.channels.close()
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        tasks = self.download_tasks + ([self.eviction_task] if self.eviction_task else [])
+        tasks += [album['task'] for album in self.albums.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.download_tasks = []
+        self.eviction_task = None
+        if self.client is not None and self.client.is_connected():
+            await self.client.disconnect()
 
     async def process_message(self, event):
         """Обрабатывает новое сообщение из канала"""
         message = event.message
-        chat = await event.get_chat()
+        channel_id, source_channel = await self.channels.get_for_event(event)
+        if self.capture is not None:
+            self.capture.record(EVENT_NEW, message, channel_id, self.channels.channels.get(channel_id))
+        
+        if message.grouped_id:
+            # Часть альбома: новость создается, когда придут все части
+            self.collect_album_part(source_channel, message)
+            return
         
         # Получаем содержимое сообщения
         content = message.text or message.message or ""
-        logger.info(f"Получено новое сообщение от {chat.username or chat.id}: {content[:50]}...")
+        logger.info(f"Получено новое сообщение от {source_channel}: {content[:50]}...")
+        
+        # Повторная доставка того же поста (переподключение, перезапуск) не должна порождать дубликат
+        async with get_async_session() as session:
+            if await news_exists(session, source_channel, message.id):
+                logger.info(f"Сообщение {message.id} из канала {source_channel} уже сохранено, пропускаем")
+                return
+        
+        entry = self.build_news(source_channel, message)
+        if entry is None:
+            logger.info("Пустое сообщение без медиа, пропускаем")
+            return
+        await self.save_news(*entry)
+
+    async def capture_edit(self, event):
+        channel_id, _ = await self.channels.get_for_event(event)
+        self.capture.record(EVENT_EDIT, event.message, channel_id, self.channels.channels.get(channel_id))
+
+    def build_news(self, source_channel, message):
+        """
+        Готовит запись новости из сообщения: значения полей, сообщения с медиа для скачивания и элементы альбома.
+        None, если сообщение пустое.
+        """
+        content = message.text or message.message or ""
         
         # Проверяем, есть ли медиа в сообщении
         has_media = message.media is not None
-        media_path = None
+        media_name = None
         media_type = None
         
         if has_media:
             logger.info(f"Сообщение содержит медиа типа: {type(message.media).__name__}")
-            
-            # Обрабатываем медиа
-            if isinstance(message.media, MessageMediaPhoto):
-                media_type = 'photo'
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                media_path = os.path.join(MEDIA_DIR, f'photo_{message.id}_{timestamp}.jpg')
-                try:
-                    await self.client.download_media(message, media_path)
-                    logger.info(f"Фото успешно сохранено: {media_path}")
-                    
-                    # Проверяем, существует ли файл и его размер
-                    if os.path.exists(media_path):
-                        file_size = os.path.getsize(media_path)
-                        logger.info(f"Размер файла: {file_size} байт")
-                    else:
-                        logger.error(f"Файл не найден после сохранения: {media_path}")
-                except Exception as e:
-                    logger.error(f"Ошибка при скачивании фото: {e}")
-                    media_path = None
-            
-            elif isinstance(message.media, MessageMediaDocument):
-                # Определяем тип документа
-                document = message.media.document
-                mime_type = document.mime_type
-                file_name = None
-                
-                # Пытаемся получить оригинальное имя файла
-                for attribute in document.attributes:
-                    if hasattr(attribute, 'file_name') and attribute.file_name:
-                        file_name = attribute.file_name
-                        break
-                
-                if not file_name:
-                    # Если имя не найдено, создаем на основе mime-типа
-                    ext = mimetypes.guess_extension(mime_type) or '.dat'
-                    file_name = f'doc_{message.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}{ext}'
-                
-                # Сохраняем документ
-                media_type = 'document'
-                media_path = os.path.join(MEDIA_DIR, file_name)
-                try:
-                    await self.client.download_media(message, media_path)
-                    logger.info(f"Документ успешно сохранен: {media_path}, MIME: {mime_type}")
-                    
-                    # Проверяем, существует ли файл и его размер
-                    if os.path.exists(media_path):
-                        file_size = os.path.getsize(media_path)
-                        logger.info(f"Размер файла: {file_size} байт")
-                    else:
-                        logger.error(f"Файл не найден после сохранения: {media_path}")
-                except Exception as e:
-                    logger.error(f"Ошибка при скачивании документа: {e}")
-                    media_path = None
-            
-            elif isinstance(message.media, MessageMediaWebPage):
-                # Для веб-страниц просто извлекаем информацию, но не скачиваем
-                logger.info("Сообщение содержит веб-страницу, медиафайл не будет скачан")
-                has_media = False
-            
-            else:
-                logger.warning(f"Неизвестный тип медиа: {type(message.media).__name__}, скачивание будет пропущено")
-                has_media = False
+            media_type, media_name = self.get_media_info(message)
+            has_media = media_type is not None
         
         # Если сообщение полностью пустое (нет текста и медиа), пропускаем его
         if not content and not has_media:
-            logger.info("Пустое сообщение без медиа, пропускаем")
-            return
+            return None
         
-        # Создаем запись в базе данных
-        news = News(
-            source_channel=chat.username or str(chat.id),
+        # Запись создается сразу, не дожидаясь скачивания медиа
+        values = dict(
+            source_channel=source_channel,
             message_id=message.id,
             content=content,
             original_content=content,  # Сохраняем оригинальный текст
             has_media=has_media,
             media_type=media_type,
-            media_path=media_path
+            media_name=media_name,
+            media_status=MEDIA_PENDING if has_media else None,
+            telegram_media_id=get_telegram_media_id(message) if has_media else None,
+            posted_at=get_posted_at(message)
         )
+        return values, [message] if has_media else [], None
+
+    def build_album(self, source_channel, messages):
+        """Готовит запись новости из частей альбома; None, если в альбоме нет медиа для скачивания"""
+        # Подпись альбома хранится в одной из частей, обычно в первой
+        content = next((message.text or message.message for message in messages if message.text or message.message), "")
         
-        self.session.add(news)
-        self.session.commit()
+        album_items = []
+        media_messages = []
+        for message in messages:
+            media_type, media_name = self.get_media_info(message)
+            if media_type is None:
+                continue
+            album_items.append(dict(
+                position=len(album_items), message_id=message.id, media_type=media_type, media_name=media_name
+            ))
+            media_messages.append(message)
         
-        logger.info(f"Новая новость сохранена из канала {chat.username or chat.id}, ID: {news.id}, has_media: {has_media}, media_path: {media_path}")
+        if not album_items:
+            return None
         
-        # Отправляем уведомление о новой новости всем модераторам через нашего бота
-        await self.notify_moderators_about_new_news(news)
+        values = dict(
+            source_channel=source_channel,
+            message_id=messages[0].id,
+            content=content,
+            original_content=content,
+            has_media=True,
+            media_type=MEDIA_ALBUM,
+            media_name=None,
+            media_status=MEDIA_PENDING,
+            telegram_media_id=get_telegram_media_id(media_messages[0]),
+            posted_at=get_posted_at(messages[0])
+        )
+        return values, media_messages, album_items
 
-    async def notify_moderators_about_new_news(self, news):
-        """Отправляет уведомление модераторам о новой новости"""
+    async def save_news(self, values, media_messages, album_items=None):
+        """Сохраняет новость, уведомляет модераторов и ставит медиа в очередь загрузки"""
+        # Та же новость из другого канала связывается с первой и модераторам не рассылается
+        signature = minhash(values['content'])
+        original, slot = self.check_duplicate(signature, values['telegram_media_id'], values['source_channel'])
+        news = None
         try:
-            # Отправляем уведомление каждому модератору через бота
-            for moderator_id in MODERATOR_IDS:
-                # Создаем inline кнопки для действий
-                inline_keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {"text": "✅ Одобрить и опубликовать", "callback_data": f"approve_{news.id}"},
-                            {"text": "✏️ Редактировать", "callback_data": f"edit_{news.id}"}
-                        ]
-                    ]
-                }
-                
-                # Формируем сообщение
-                message_text = f"📢 <b>Новая новость №{news.id}</b> из канала <b>{news.source_channel}</b>:\n\n{news.content}"
-                
-                # Если есть медиа, отправляем с медиа
-                if news.has_media and news.media_path and os.path.exists(news.media_path):
-                    logger.info(f"Отправка новости {news.id} с медиа {news.media_path} модератору {moderator_id}")
-                    await self.send_media_to_moderator(moderator_id, news, message_text, inline_keyboard)
-                else:
-                    # Иначе отправляем просто текст
-                    logger.info(f"Отправка текстовой новости {news.id} модератору {moderator_id}")
-                    await self.send_text_to_moderator(moderator_id, message_text, inline_keyboard)
-                
-                logger.info(f"Уведомление о новой новости {news.id} отправлено модератору {moderator_id}")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления о новой новости: {e}")
-
-    async def send_text_to_moderator(self, moderator_id, text, inline_keyboard):
-        """Отправляет текстовое сообщение модератору через бота"""
-        bot_api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+            # Если первая новость еще записывается, дожидаемся ее ID
+            original_id = await original if original is not None else None
+            if original_id is not None:
+                values = dict(values, duplicate_of=original_id, media_status=None)
+            
+            # Новости, пришедшие почти одновременно, записываются одной транзакцией
+            last_message_id = max([values['message_id']] + [message.id for message in media_messages])
+            news = await self.ingest.submit(values, album_items, last_message_id)
+        finally:
+            if slot is not None:
+                slot.set_result(news.id if news is not None else None)
         
-        payload = {
-            "chat_id": moderator_id,
-            "text": text,
-            "parse_mode": "HTML",
-            "reply_markup": json.dumps(inline_keyboard)
-        }
+        if news is None:
+            # Параллельный обработчик уже сохранил этот пост
+            logger.info(
+                f"Сообщение {values['message_id']} из канала {values['source_channel']} уже сохранено, "
+                f"уведомление не отправляется"
+            )
+            return
         
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(bot_api_url, json=payload) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        logger.error(f"Ошибка при отправке сообщения: {response_text}")
-                    else:
-                        logger.info(f"Текстовое сообщение успешно отправлено модератору {moderator_id}")
-            except Exception as e:
-                logger.error(f"Исключение при отправке текстового сообщения: {e}")
-
-    async def send_media_to_moderator(self, moderator_id, news, caption, inline_keyboard):
-        """Отправляет медиа сообщение модератору через бота"""
-        if news.media_type == 'photo':
-            bot_api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-            file_param = "photo"
-        else:  # document
-            bot_api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendDocument"
-            file_param = "document"
-        
-        # Проверяем существование файла перед отправкой
-        if not os.path.exists(news.media_path):
-            logger.error(f"Файл не найден перед отправкой: {news.media_path}")
-            # Если файл не найден, отправляем только текст
-            await self.send_text_to_moderator(
-                moderator_id, 
-                f"{caption}\n\n⚠️ <i>Медиафайл не найден, показан только текст</i>", 
-                inline_keyboard
+        if news.duplicate_of is not None:
+            logger.info(
+                f"Новость {news.id} из канала {news.source_channel} - повтор новости {news.duplicate_of}, "
+                f"модераторам не отправляется"
+            )
+            return
+        
+        logger.info(
+            f"Новая новость сохранена из канала {news.source_channel}, ID: {news.id}, has_media: {news.has_media}, "
+            f"media_type: {news.media_type}"
+        )
+        await self.announce_news(news, media_messages)
+
+    def check_duplicate(self, signature, media_id, source_channel):
+        """
+        Ищет первую новость, повтором которой является новая. Возвращает ссылку на нее (future с ID)
+        и, если повтора нет, место в индексе для новой новости: в него нужно записать ID после сохранения.
+        Проверка и резервирование выполняются без переключения задач, поэтому из одновременно пришедших
+        копий новости первой считается только одна.
+        """
+        original = self.duplicates.find(signature, media_id, source_channel)
+        if original is not None:
+            return original, None
+        slot = asyncio.get_running_loop().create_future()
+        self.duplicates.add(slot, signature, media_id, source_channel)
+        return None, slot
+
+    @staticmethod
+    def saved_news_ref(news_id):
+        """Ссылка на уже сохраненную новость для индекса повторов"""
+        ref = asyncio.get_running_loop().create_future()
+        ref.set_result(news_id)
+        return ref
+
+    async def announce_news(self, news, media_messages, notify=True):
+        """Передает новость боту для рассылки модераторам и ставит ее медиа в очередь загрузки"""
+        # Если медиа еще скачивается, модераторы сразу получают текст, а медиа придет после загрузки
+        if notify:
+            await self.news_channel.send(NEWS_SAVED, news.id)
+        
+        if media_messages:
+            await self.download_queue.put((news.id, media_messages, notify))
+            logger.info(f"Медиа новости {news.id} поставлено в очередь загрузки, в очереди: {self.download_queue.qsize()}")
+
+    async def save_news_batch(self, source_channel, entries, last_message_id):
+        """
+        Сохраняет пачку новостей канала одним запросом (используется при догрузке пропущенных постов).
+        Возвращает сохраненные новости, которые не являются повторами, вместе с их сообщениями с медиа.
+        """
+        rows = []
+        slots = {}  # Места в индексе повторов для новостей пачки -> ID сообщения
+        batch_duplicates = {}  # Повторы внутри пачки: ID сообщения -> ID сообщения первой новости
+        # Повторы новостей, которые еще записывают другие обработчики: ID сообщения -> ссылка на первую новость.
+        # Их не ждем до записи пачки: тот обработчик сам может ждать места, зарезервированного этой пачкой
+        deferred = {}
+        for values, media_messages, album_items in entries:
+            original, slot = self.check_duplicate(
+                minhash(values['content']), values['telegram_media_id'], source_channel
             )
+            original_id = None
+            if slot is not None:
+                slots[slot] = values['message_id']
+            elif original in slots:
+                # ID первой новости из этой же пачки станет известен только после вставки
+                batch_duplicates[values['message_id']] = slots[original]
+            elif original.done():
+                original_id = original.result()
+            else:
+                deferred[values['message_id']] = original
+            if original_id is not None or values['message_id'] in batch_duplicates:
+                values = dict(values, media_status=None)
+            rows.append(dict(values, duplicate_of=original_id))
+        
+        news_ids = {}
+        try:
+            async with get_async_session() as session:
+                news_ids = await insert_news_bulk(session, rows) if rows else {}
+                for values, media_messages, album_items in entries:
+                    news_id = news_ids.get(values['message_id'])
+                    if news_id and album_items:
+                        session.add_all(NewsMedia(news_id=news_id, **item) for item in album_items)
+                for message_id, original_message_id in batch_duplicates.items():
+                    if message_id in news_ids and original_message_id in news_ids:
+                        await session.execute(
+                            update(News).where(News.id == news_ids[message_id])
+                            .values(duplicate_of=news_ids[original_message_id])
+                        )
+                await update_channel_state(session, source_channel, last_message_id)
+                await session.commit()
+        finally:
+            for slot, message_id in slots.items():
+                slot.set_result(news_ids.get(message_id))
+        
+        # Места этой пачки заполнены, теперь можно дождаться чужих
+        if deferred:
+            original_ids = dict(zip(deferred, await asyncio.gather(*deferred.values())))
+            links = {
+                news_ids[message_id]: original_id for message_id, original_id in original_ids.items()
+                if original_id is not None and message_id in news_ids
+            }
+            if links:
+                async with get_async_session() as session:
+                    for news_id, original_id in links.items():
+                        await session.execute(
+                            update(News).where(News.id == news_id).values(duplicate_of=original_id, media_status=None)
+                        )
+                    await session.commit()
+        
+        saved = []
+        if news_ids:
+            async with get_async_session() as session:
+                saved = (await session.scalars(
+                    select(News).where(News.id.in_(news_ids.values())).order_by(News.id)
+                )).all()
+        
+        media_by_news = {values['message_id']: media_messages for values, media_messages, _ in entries}
+        duplicates = sum(news.duplicate_of is not None for news in saved)
+        logger.info(
+            f"Из канала {source_channel} догружено новостей: {len(saved)}, из них повторов: {duplicates}"
+        )
+        return [(news, media_by_news[news.message_id]) for news in saved if news.duplicate_of is None]
+
+    async def backfill(self):
+        """
+        Догружает посты, опубликованные, пока парсер не работал: каналы обрабатываются параллельно.
+        Модераторам отправляются только BACKFILL_NOTIFY_LIMIT самых новых из них, остальные сохраняются в базе.
+        """
+        async with get_async_session() as session:
+            states = dict((await session.execute(select(ChannelState.channel, ChannelState.last_message_id))).all())
+        
+        results = await asyncio.gather(
+            *(self.backfill_channel(channel_id, states) for channel_id in self.channel_ids), return_exceptions=True
+        )
+        
+        saved = []
+        for channel_id, result in zip(self.channel_ids, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Ошибка при догрузке пропущенных постов канала {self.channels.get_source_name(channel_id)}: {result}"
+                )
+                continue
+            saved += result
+        if not saved:
             return
         
+        saved.sort(key=lambda item: item[0].id)
+        notify_from = max(len(saved) - BACKFILL_NOTIFY_LIMIT, 0)
+        if notify_from:
+            logger.warning(
+                f"Догружено {len(saved)} пропущенных новостей, модераторам отправлены только "
+                f"{len(saved) - notify_from} самых новых"
+            )
+        for position, (news, media_messages) in enumerate(saved):
+            await self.announce_news(news, media_messages, notify=position >= notify_from)
+
+    async def backfill_channel(self, channel_id, states):
+        """Догружает пропущенные посты одного канала; возвращает сохраненные новости"""
+        entity = self.channels.get_input_peer(channel_id)
+        source_channel = self.channels.get_source_name(channel_id)
+        
+        last_message_id = states.get(source_channel)
+        if last_message_id is None:
+            async with get_async_session() as session:
+                last_message_id = await session.scalar(
+                    select(func.max(News.message_id)).where(News.source_channel == source_channel)
+                )
+        if last_message_id is None:
+            # Канал только добавлен: историю не загружаем, запоминаем последний пост как точку отсчета
+            latest = await self.client.get_messages(entity, limit=1)
+            if latest:
+                async with get_async_session() as session:
+                    await update_channel_state(session, source_channel, latest[0].id)
+                    await session.commit()
+            return []
+        
+        # Самые новые BACKFILL_LIMIT постов после последнего сохраненного, затем в порядке публикации
+        messages = [
+            message async for message in self.client.iter_messages(entity, min_id=last_message_id, limit=BACKFILL_LIMIT)
+        ]
+        if not messages:
+            return []
+        if len(messages) == BACKFILL_LIMIT:
+            logger.warning(f"В канале {source_channel} пропущено больше {BACKFILL_LIMIT} постов, более старые не загружаются")
+        messages.reverse()
+        
+        # Части альбома объединяются так же, как при получении в реальном времени
+        entries = []
+        albums = {}
+        for message in messages:
+            if message.grouped_id:
+                if message.grouped_id not in albums:
+                    albums[message.grouped_id] = []
+                    entries.append(albums[message.grouped_id])
+                albums[message.grouped_id].append(message)
+            else:
+                entries.append(message)
+        
+        entries = [
+            self.build_album(source_channel, entry) if isinstance(entry, list) else self.build_news(source_channel, entry)
+            for entry in entries
+        ]
+        entries = [entry for entry in entries if entry is not None]
+        return await self.save_news_batch(source_channel, entries, messages[-1].id)
+
+    async def warm_duplicate_index(self):
+        """Заполняет индекс повторов новостями за последние DEDUP_WINDOW_MINUTES, чтобы перезапуск не пропускал повторы"""
+        since = datetime.now() - timedelta(minutes=DEDUP_WINDOW_MINUTES)
+        async with get_async_session() as session:
+            rows = (await session.execute(
+                select(News.id, News.date, News.source_channel, News.content, News.telegram_media_id)
+                .where(News.date >= since, News.duplicate_of.is_(None))
+                .order_by(News.date)
+            )).all()
+        
+        # Подписи не хранятся в базе: они дешево пересчитываются по тексту
+        for news_id, date, source_channel, content, telegram_media_id in rows:
+            self.duplicates.add(
+                self.saved_news_ref(news_id), minhash(content), telegram_media_id, source_channel, date.timestamp()
+            )
+        logger.info(f"Индекс повторов заполнен: {len(self.duplicates)} новостей")
+
+    def collect_album_part(self, source_channel, message):
+        """Добавляет часть альбома в буфер и откладывает создание новости до конца окна сбора"""
+        key = (source_channel, message.grouped_id)
+        album = self.albums.setdefault(key, {'messages': [], 'task': None})
+        album['messages'].append(message)
+        # Каждая новая часть продлевает окно сбора
+        if album['task'] is not None:
+            album['task'].cancel()
+        album['task'] = asyncio.create_task(self.finish_album(key))
+
+    async def finish_album(self, key):
+        """Дожидается конца окна сбора и сохраняет альбом одной новостью"""
+        await asyncio.sleep(ALBUM_COLLECT_WINDOW)
+        album = self.albums.pop(key)
         try:
-            # Сначала читаем файл в память
-            with open(news.media_path, 'rb') as file:
-                file_content = file.read()
-                
-            filename = os.path.basename(news.media_path)
-            content_type = mimetypes.guess_type(news.media_path)[0] or 'application/octet-stream'
-            logger.info(f"Подготовлен файл для отправки: {filename}, тип: {content_type}, размер: {len(file_content)} байт")
+            await self.process_album(key[0], album['messages'])
+        except Exception as e:
+            logger.error(f"Ошибка при обработке альбома {key[1]} из канала {key[0]}: {e}")
+
+    async def process_album(self, source_channel, messages):
+        """Сохраняет части альбома одной новостью с несколькими медиа"""
+        messages = sorted(messages, key=lambda message: message.id)
+        first_id = messages[0].id
+        logger.info(f"Получен альбом из {len(messages)} частей от {source_channel}")
+        
+        async with get_async_session() as session:
+            if await news_exists(session, source_channel, first_id):
+                logger.info(f"Альбом {first_id} из канала {source_channel} уже сохранен, пропускаем")
+                return
+        
+        entry = self.build_album(source_channel, messages)
+        if entry is None:
+            logger.info(f"В альбоме {first_id} нет медиа для скачивания, пропускаем")
+            return
+        await self.save_news(*entry)
+
+    @staticmethod
+    def get_media_info(message):
+        """Определяет тип медиа сообщения и имя файла для отправки; (None, None), если медиа не скачивается"""
+        # Обрабатываем медиа
+        if isinstance(message.media, MessageMediaPhoto):
+            return 'photo', f'photo_{message.id}.jpg'
+        
+        if isinstance(message.media, MessageMediaDocument):
+            # Определяем тип документа
+            document = message.media.document
+            mime_type = document.mime_type
+            file_name = None
             
-            # Создаем данные формы с уже прочитанным содержимым файла
-            data = aiohttp.FormData()
-            data.add_field('chat_id', str(moderator_id))
-            data.add_field('caption', caption)
-            data.add_field('parse_mode', 'HTML')
-            data.add_field('reply_markup', json.dumps(inline_keyboard))
-            data.add_field(
-                file_param, 
-                file_content, 
-                filename=filename,
-                content_type=content_type
-            )
+            # Пытаемся получить оригинальное имя файла
+            for attribute in document.attributes:
+                if hasattr(attribute, 'file_name') and attribute.file_name:
+                    file_name = attribute.file_name
+                    break
             
-            # Отправляем запрос
-            async with aiohttp.ClientSession() as session:
-                async with session.post(bot_api_url, data=data) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        logger.error(f"Ошибка при отправке медиа: {response_text}")
-                        
-                        # Если не удалось отправить медиа, пробуем отправить хотя бы текст
-                        await self.send_text_to_moderator(
-                            moderator_id, 
-                            f"{caption}\n\n⚠️ <i>Не удалось отправить медиафайл: {response_text}</i>", 
-                            inline_keyboard
-                        )
-                    else:
-                        logger.info(f"Медиафайл успешно отправлен модератору {moderator_id}")
+            if not file_name:
+                # Если имя не найдено, создаем на основе mime-типа
+                ext = mimetypes.guess_extension(mime_type) or '.dat'
+                file_name = f'doc_{message.id}{ext}'
+            
+            return 'document', file_name
+        
+        if isinstance(message.media, MessageMediaWebPage):
+            # Для веб-страниц просто извлекаем информацию, но не скачиваем
+            logger.info("Сообщение содержит веб-страницу, медиафайл не будет скачан")
+        else:
+            logger.warning(f"Неизвестный тип медиа: {type(message.media).__name__}, скачивание будет пропущено")
+        return None, None
+
+    async def download_worker(self):
+        """Скачивает медиа из очереди в фоне, не задерживая прием следующих сообщений"""
+        while True:
+            news_id, messages, notify = await self.download_queue.get()
+            try:
+                try:
+                    media_status = await self.download_news_media(news_id, messages)
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке загрузки медиа новости {news_id}: {e}")
+                    media_status = MEDIA_FAILED
+                if notify:
+                    # Бот заменит текстовые превью у модераторов версией с медиа, а без медиа перестанет его ждать
+                    await self.news_channel.send(
+                        NEWS_MEDIA_READY if media_status == MEDIA_READY else NEWS_MEDIA_FAILED, news_id
+                    )
+            finally:
+                self.download_queue.task_done()
+
+    @staticmethod
+    def get_media_targets(news):
+        """Куда записывать скачанные файлы по ID сообщений: элементы альбома или сама новость"""
+        if news.is_album:
+            return {item.message_id: item for item in news.media_items}
+        return {news.message_id: news}
+
+    async def download_news_media(self, news_id, messages):
+        """Скачивает медиа новости в хранилище и привязывает файлы в базе; возвращает новое состояние медиа"""
+        async with get_async_session() as session:
+            news = await session.get(News, news_id)
+        if news is None:
+            return None
+        
+        targets = self.get_media_targets(news)
+        media_files = {}
+        for message in messages:
+            target = targets.get(message.id)
+            if target is None:
+                continue
+            media_name = target.media_name or self.get_media_info(message)[1]
+            media_file = await self.fetch_media(news_id, message, media_name)
+            if media_file is not None:
+                media_files[message.id] = media_file
+        
+        # Альбом показывается, даже если часть файлов скачать не удалось
+        media_status = MEDIA_READY if media_files else MEDIA_FAILED
+        
+        async with get_async_session() as session:
+            news = await session.get(News, news_id)
+            if news is None:
+                return None
+            targets = self.get_media_targets(news)
+            for message_id, media_file in media_files.items():
+                await self.media_store.attach(session, targets[message_id], media_file)
+            news.media_status = media_status
+            await session.commit()
+        return media_status
+
+    async def fetch_media(self, news_id, message, media_name):
+        """Получает файл сообщения из хранилища или скачивает его; None при ошибке"""
+        started = time.monotonic()
+        try:
+            media_file, downloaded = await self.media_store.fetch(self.client, message, media_name)
         except Exception as e:
-            logger.error(f"Исключение при отправке медиафайла: {e}")
-            # При любой ошибке отправляем хотя бы текст
-            await self.send_text_to_moderator(
-                moderator_id, 
-                f"{caption}\n\n⚠️ <i>Ошибка при отправке медиафайла: {str(e)}</i>", 
-                inline_keyboard
+            logger.error(f"Ошибка при скачивании медиа новости {news_id}: {e}")
+            self.download_stats['failed'] += 1
+            media_downloads.inc(result='failed')
+            return None
+        
+        elapsed = time.monotonic() - started
+        if downloaded:
+            self.download_stats['completed'] += 1
+            self.download_stats['bytes'] += media_file.size
+            self.download_stats['seconds'] += elapsed
+            media_downloads.inc(result='downloaded')
+            media_download_bytes.inc(media_file.size)
+            media_download_seconds.observe(elapsed)
+            logger.info(
+                f"Медиа новости {news_id} сохранено: {media_file.path}, {media_file.size} байт за {elapsed:.2f} с "
+                f"({media_file.size / max(elapsed, 1e-6) / 1024 / 1024:.2f} МБ/с), в очереди: {self.download_queue.qsize()}"
             )
+        else:
+            self.download_stats['deduplicated'] += 1
+            media_downloads.inc(result='deduplicated')
+            logger.info(f"Медиа новости {news_id} уже есть в хранилище: {media_file.path}, скачивание пропущено")
+        return media_file
+
+    async def requeue_pending_downloads(self):
+        """Возвращает в очередь загрузки медиа, которые не успели скачаться до перезапуска парсера"""
+        async with get_async_session() as session:
+            pending = (await session.scalars(select(News).where(News.media_status == MEDIA_PENDING))).all()
+        
+        for news in pending:
+            channel = self.channels.get_peer(news.source_channel)
+            message_ids = list(self.get_media_targets(news))
+            try:
+                messages = await self.client.get_messages(channel, ids=message_ids)
+            except Exception as e:
+                logger.error(f"Не удалось получить сообщения новости {news.id} для загрузки медиа: {e}")
+                await self.news_channel.send(NEWS_MEDIA_FAILED, news.id)
+                continue
+            messages = [message for message in messages if message is not None and message.media is not None]
+            if not messages:
+                await self.news_channel.send(NEWS_MEDIA_FAILED, news.id)
+                continue
+            
+            # Модераторы получат медиа отдельным сообщением
+            await self.download_queue.put((news.id, messages, True))
+        
+        if pending:
+            logger.info(f"В очередь загрузки возвращено медиа {len(pending)} новостей")
+
+    async def media_eviction_loop(self):
+        """Периодически освобождает место в хранилище медиа, удаляя файлы обработанных новостей"""
+        while True:
+            try:
+                count, freed = await self.media_store.evict()
+                if count:
+                    logger.info(f"Из хранилища медиа удалено файлов: {count}, освобождено {freed} байт")
+            except Exception as e:
+                logger.error(f"Ошибка при очистке хранилища медиа: {e}")
+            await asyncio.sleep(MEDIA_EVICTION_INTERVAL)
+
+    def get_download_stats(self):
+        """Глубина очереди загрузки и средняя скорость скачивания"""
+        stats = dict(self.download_stats, queue_depth=self.download_queue.qsize())
+        stats['bytes_per_second'] = stats['bytes'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+    def collect_metrics(self):
+        queue_depth.set(self.download_queue.qsize(), queue='media_download')
+        queue_depth.set(self.ingest.get_stats()['pending'], queue='ingest')
+        queue_depth.set(sum(len(album['messages']) for album in self.albums.values()), queue='album_parts')
 
 
 async def run_parser():
     # Инициализация базы данных
-    init_db()
+    await init_db_async()
     
     # Запуск парсера
     parser = NewsParser()
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+import zlib
+
+from config import (
+    RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_SECOND, RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_GROUP_PER_MINUTE, RATE_LIMIT_GROUP_BURST, RATE_LIMIT_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Число ячеек под чаты в разделяемой памяти. Чаты распределяются по ячейкам по хешу,
+# при редком совпадении два чата делят один лимит (ограничение становится только строже)
+CHAT_SLOTS = 4096
+
+
+class TooManyRequests(Exception):
+    """Bot API ответил 429, повторить запрос можно через retry_after секунд"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too Many Requests: retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+def is_group_chat(chat_id):
+    """Каналы и группы адресуются через @username или отрицательный ID"""
+    chat_id = str(chat_id)
+    return chat_id.startswith('@') or chat_id.startswith('-')
+
+
+class SharedRateState:
+    """
+    Состояние ограничителя в разделяемой памяти.
+    Создается в главном процессе и передается парсеру и боту, чтобы лимиты Telegram считались на оба процесса.
+    Лимиты реализованы через GCRA: для каждого ведра хранится теоретическое время следующей отправки.
+    """
+
+    def __init__(self, chat_slots=CHAT_SLOTS):
+        self.lock = multiprocessing.Lock()
+        self.global_tat = multiprocessing.RawValue('d', 0.0)
+        self.chat_tat = multiprocessing.RawArray('d', chat_slots)
+        self.chat_slots = chat_slots
+
+    def _slot(self, chat_id):
+        # hash() строк различается между процессами, поэтому используем crc32
+        return zlib.crc32(str(chat_id).encode()) % self.chat_slots
+
+    @staticmethod
+    def _chat_limits(chat_id):
+        if is_group_chat(chat_id):
+            return 60.0 / RATE_LIMIT_GROUP_PER_MINUTE, RATE_LIMIT_GROUP_BURST
+        return 1.0 / RATE_LIMIT_CHAT_PER_SECOND, RATE_LIMIT_CHAT_BURST
+
+    @staticmethod
+    def _global_limits():
+        return 1.0 / RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_GLOBAL_PER_SECOND
+
+    def reserve(self, chat_id, now):
+        """Резервирует слот отправки и возвращает, сколько секунд до него ждать"""
+        global_interval, global_burst = self._global_limits()
+
+        with self.lock:
+            start = max(now, self.global_tat.value - global_interval * (global_burst - 1))
+
+            if chat_id is not None:
+                slot = self._slot(chat_id)
+                chat_interval, chat_burst = self._chat_limits(chat_id)
+                start = max(start, self.chat_tat[slot] - chat_interval * (chat_burst - 1))
+                self.chat_tat[slot] = max(self.chat_tat[slot], start) + chat_interval
+
+            self.global_tat.value = max(self.global_tat.value, start) + global_interval
+
+        return start - now
+
+    def penalize(self, chat_id, retry_after, now):
+        """Запрещает отправки в чат (или все отправки) на retry_after секунд после ответа 429"""
+        with self.lock:
+            if chat_id is None:
+                interval, burst = self._global_limits()
+                self.global_tat.value = max(self.global_tat.value, now + retry_after + interval * (burst - 1))
+            else:
+                slot = self._slot(chat_id)
+                interval, burst = self._chat_limits(chat_id)
+                self.chat_tat[slot] = max(self.chat_tat[slot], now + retry_after + interval * (burst - 1))
+
+
+class BotApiRateLimiter:
+    """Ограничитель запросов к Bot API текущего процесса поверх общего состояния"""
+
+    def __init__(self, state):
+        self.state = state
+        self.waiting = {}  # Сколько запросов сейчас ждет своей очереди, по чатам
+        self.stats = {
+            'requests': 0,
+            'delayed': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'max_queue_depth': 0,
+            'retries_429': 0,
+        }
+
+    @property
+    def queue_depth(self):
+        return sum(self.waiting.values())
+
+    async def acquire(self, chat_id=None):
+        """Дожидается разрешения на отправку в чат (порядок ожидания - порядок резервирования)"""
+        delay = self.state.reserve(chat_id, time.time())
+        self.stats['requests'] += 1
+        if delay <= 0:
+            return
+
+        self.stats['delayed'] += 1
+        self.stats['total_wait_seconds'] += delay
+        self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], delay)
+
+        self.waiting[chat_id] = self.waiting.get(chat_id, 0) + 1
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.queue_depth)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting[chat_id] -= 1
+            if not self.waiting[chat_id]:
+                del self.waiting[chat_id]
+
+    async def call(self, chat_id, request, max_retries=RATE_LIMIT_MAX_RETRIES):
+        """
+        Выполняет запрос с учетом лимитов. request - функция, возвращающая новую корутину запроса,
+        чтобы после 429 запрос можно было отправить повторно.
+        """
+        for attempt in range(max_retries + 1):
+            await self.acquire(chat_id)
+            try:
+                return await request()
+            except TooManyRequests as e:
+                if attempt == max_retries:
+                    raise
+                self.stats['retries_429'] += 1
+                logger.warning(f"Bot API вернул 429 для чата {chat_id}, повтор через {e.retry_after} с")
+                self.state.penalize(chat_id, e.retry_after, time.time())
+
+    def get_stats(self):
+        """Снимок статистики: глубина очереди и время ожидания"""
+        return dict(self.stats, queue_depth=self.queue_depth, chats_waiting=len(self.waiting))
+
+
+_shared_state = None
+_rate_limiter = None
+
+
+def use_shared_state(state):
+    """Подключает процесс к общему состоянию, созданному в главном процессе"""
+    global _shared_state, _rate_limiter
+    _shared_state = state
+    _rate_limiter = None
+
+
+def get_rate_limiter():
+    """Ограничитель текущего процесса; без общего состояния лимиты считаются только в этом процессе"""
+    global _shared_state, _rate_limiter
+    if _rate_limiter is None:
+        if _shared_state is None:
+            _shared_state = SharedRateState()
+        _rate_limiter = BotApiRateLimiter(_shared_state)
+    return _rate_limiter
@@ -0,0 +1,234 @@
+import os
+import time
+import asyncio
+import logging
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+
+import metrics
+from config import (
+    HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, RESTART_BACKOFF_MIN, RESTART_BACKOFF_MAX, SUPERVISOR_REPORT_INTERVAL,
+    METRICS_HOST, METRICS_PORT
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать завершения зависшего процесса после SIGTERM, прежде чем убить его
+TERMINATE_TIMEOUT = 5
+
+# Процесс, проработавший столько секунд, считается восстановившимся: задержка перезапуска сбрасывается
+STABLE_SECONDS = 60
+
+
+async def send_heartbeats(name, heartbeats, interval=HEARTBEAT_INTERVAL):
+    """
+    Отправляет главному процессу сигналы жизни с задержкой цикла событий: насколько позже
+    запланированного проснулся этот цикл. Большая задержка значит, что цикл чем-то заблокирован.
+    Вместе с сигналом передается снимок метрик процесса. heartbeats - конец канала, созданного
+    наблюдателем для этого запуска процесса.
+    """
+    pid = os.getpid()
+    lag = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            # Запись в канал может ждать, пока главный процесс его прочитает, поэтому идет не в цикле событий
+            await loop.run_in_executor(None, heartbeats.send, (name, pid, time.time(), lag, metrics.snapshot()))
+        except OSError as e:
+            logger.error(f"Не удалось отправить сигнал жизни: {e}")
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(time.monotonic() - started - interval, 0.0)
+
+
+async def run_with_heartbeats(name, heartbeats, coro):
+    """Выполняет основную корутину процесса, параллельно отправляя сигналы жизни"""
+    heartbeat_task = asyncio.create_task(send_heartbeats(name, heartbeats))
+    try:
+        return await coro
+    finally:
+        heartbeat_task.cancel()
+
+
+class ChildProcess:
+    """Дочерний процесс под наблюдением и его статистика"""
+
+    def __init__(self, name, target, args):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.heartbeats = None  # Конец канала сигналов жизни текущего запуска в главном процессе
+        self.started_at = None
+        self.last_heartbeat = None
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.restarts = 0
+        self.failures = 0  # Сбоев подряд, от них зависит задержка перезапуска
+        self.restart_at = None  # Когда перезапустить упавший процесс
+        self.metrics = []  # Последний снимок метрик процесса
+
+    def start(self):
+        # Канал сигналов жизни создается заново на каждый запуск: межпроцессная очередь с общими блокировками
+        # перестала бы работать, если процесс убит, пока держит ее блокировку
+        if self.heartbeats is not None:
+            self.heartbeats.close()
+        self.heartbeats, writer = Pipe(duplex=False)
+        self.process = Process(target=self.target, args=(*self.args, writer), name=self.name)
+        self.process.start()
+        writer.close()
+        self.started_at = time.time()
+        self.last_heartbeat = None
+        self.restart_at = None
+        logger.info(f"Процесс {self.name} запущен, pid {self.process.pid}")
+
+    @property
+    def uptime(self):
+        return time.time() - self.started_at if self.started_at and self.restart_at is None else 0.0
+
+    def get_status(self):
+        return {
+            'pid': self.process.pid if self.process else None,
+            'alive': bool(self.process and self.process.is_alive()),
+            'uptime': self.uptime,
+            'restarts': self.restarts,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+            'last_heartbeat_age': time.time() - self.last_heartbeat if self.last_heartbeat else None,
+        }
+
+
+class Supervisor:
+    """
+    Запускает парсер и бота, принимает от них сигналы жизни и перезапускает процесс, который завершился
+    или перестал присылать сигналы дольше HEARTBEAT_TIMEOUT секунд (например, завис его цикл событий).
+    Перезапуск идет с растущей задержкой от RESTART_BACKOFF_MIN до RESTART_BACKOFF_MAX секунд.
+    Авторизация не повторяется: новый процесс использует сохраненную сессию Telethon.
+    Метрики процессов из сигналов жизни отдаются на METRICS_HOST:METRICS_PORT.
+    Функция процесса получает последним аргументом канал для сигналов жизни.
+    """
+
+    def __init__(self):
+        self.children = {}
+        self.last_report = time.monotonic()
+        self.metrics_server = None
+
+    def add(self, name, target, args=()):
+        self.children[name] = ChildProcess(name, target, args)
+
+    def run(self):
+        if METRICS_PORT:
+            self.metrics_server = metrics.start_http_server(METRICS_HOST, METRICS_PORT, self.collect_metrics)
+        for child in self.children.values():
+            child.start()
+        try:
+            while True:
+                self.receive_heartbeats(timeout=1.0)
+                now = time.time()
+                for child in self.children.values():
+                    self.check(child, now)
+                if time.monotonic() - self.last_report >= SUPERVISOR_REPORT_INTERVAL:
+                    self.report()
+        finally:
+            self.stop()
+
+    def receive_heartbeats(self, timeout):
+        """Читает накопившиеся сигналы жизни, ожидая первый не дольше timeout секунд"""
+        connections = {
+            child.heartbeats: child for child in self.children.values()
+            if child.heartbeats is not None and child.restart_at is None
+        }
+        for connection in wait(list(connections), timeout):
+            child = connections[connection]
+            try:
+                while connection.poll():
+                    name, pid, sent_at, lag, snapshot = connection.recv()
+                    child.last_heartbeat = sent_at
+                    child.lag = lag
+                    child.max_lag = max(child.max_lag, lag)
+                    child.metrics = snapshot
+            except (EOFError, OSError):
+                # Процесс завершился; это обнаружит check, а канал будет заменен при перезапуске
+                child.heartbeats.close()
+                child.heartbeats = None
+
+    def check(self, child, now):
+        if child.restart_at is not None:
+            if now >= child.restart_at:
+                child.restarts += 1
+                child.start()
+            return
+
+        if not child.process.is_alive():
+            reason = f"завершился с кодом {child.process.exitcode}"
+        else:
+            # До первого сигнала отсчет идет от запуска: процессу нужно время на подключение
+            last_seen = child.last_heartbeat or child.started_at
+            if now - last_seen <= HEARTBEAT_TIMEOUT:
+                if now - child.started_at >= STABLE_SECONDS:
+                    child.failures = 0
+                return
+            reason = f"не отвечает {now - last_seen:.0f} с"
+            self.terminate(child)
+
+        delay = min(RESTART_BACKOFF_MIN * 2 ** child.failures, RESTART_BACKOFF_MAX)
+        child.failures += 1
+        child.restart_at = now + delay
+        logger.error(f"Процесс {child.name} {reason}, перезапуск через {delay:g} с")
+
+    @staticmethod
+    def terminate(child):
+        child.process.terminate()
+        child.process.join(TERMINATE_TIMEOUT)
+        if child.process.is_alive():
+            child.process.kill()
+            child.process.join()
+
+    def get_status(self):
+        """Время работы, число перезапусков и задержка цикла событий каждого процесса"""
+        return {name: child.get_status() for name, child in self.children.items()}
+
+    def collect_metrics(self):
+        """
+        Снимки метрик процессов и состояние процессов по данным наблюдателя.
+        Вызывается из потока HTTP-сервера метрик, поэтому только читает поля процессов.
+        """
+        snapshots = {}
+        for name, child in list(self.children.items()):
+            status = child.get_status()
+            snapshots[name] = child.metrics + [
+                metrics.describe('process_up', 'Процесс работает', 'gauge', [({}, int(status['alive']))]),
+                metrics.describe(
+                    'process_uptime_seconds', 'Время работы процесса с последнего запуска', 'gauge',
+                    [({}, status['uptime'])]
+                ),
+                metrics.describe(
+                    'process_restarts_total', 'Перезапусков процесса наблюдателем', 'counter',
+                    [({}, status['restarts'])]
+                ),
+                metrics.describe(
+                    'event_loop_lag_seconds', 'Задержка цикла событий по последнему сигналу жизни', 'gauge',
+                    [({}, status['lag'])]
+                ),
+            ]
+        return snapshots
+
+    def report(self):
+        self.last_report = time.monotonic()
+        for name, status in self.get_status().items():
+            logger.info(
+                f"Процесс {name}: {'работает' if status['alive'] else 'остановлен'}, "
+                f"время работы {status['uptime']:.0f} с, перезапусков {status['restarts']}, "
+                f"задержка цикла событий {status['lag'] * 1000:.0f} мс (макс. {status['max_lag'] * 1000:.0f} мс)"
+            )
+
+    def stop(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server = None
+        for child in self.children.values():
+            if child.process is not None and child.process.is_alive():
+                child.process.terminate()
+        for child in self.children.values():
+            if child.process is not None:
+                child.process.join()
@@ -0,0 +1,72 @@
+"""
+Окружение тестов. Задается до импорта модулей проекта: config читает настройки при импорте,
+а значения из окружения имеют приоритет над файлом .env.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix='news_tests_')
+FAKE_PORT = 8092
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}",
+    CHANNEL_CACHE_PATH=os.path.join(WORK_DIR, 'channel_cache.json'),
+    BOT_TOKEN='123456:FAKE',
+    BOT_API_URL=f'http://127.0.0.1:{FAKE_PORT}',
+    MODERATOR_IDS='1,2',
+    TARGET_CHANNEL='-1001',
+    CAPTURE_PATH='',
+    METRICS_PORT='0',
+    # Ограничитель частоты не должен замедлять тесты
+    RATE_LIMIT_GLOBAL_PER_SECOND='100000',
+    RATE_LIMIT_CHAT_PER_SECOND='100000',
+    RATE_LIMIT_CHAT_BURST='100000',
+    RATE_LIMIT_GROUP_PER_MINUTE='10000000',
+    RATE_LIMIT_GROUP_BURST='100000',
+)
+# Хранилище медиа создается в текущей директории
+os.chdir(WORK_DIR)
+# Заглушки Telethon и Bot API лежат рядом с замерами; модули проекта важнее модулей замеров
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину теста в отдельном цикле событий с пустой базой"""
+    from database import Base, async_engine, init_db_async
+
+    def run(coro_function, *args):
+        async def main():
+            async with async_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+            await init_db_async()
+            try:
+                return await coro_function(*args)
+            finally:
+                # Соединения пула привязаны к циклу событий теста
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def run_with_bot_api(run):
+    """Как run, но с заглушкой Bot API (benchmarks/fake_telegram.py): корутина теста получает ее первым аргументом"""
+    import bot
+    from fake_telegram import FakeTelegram
+
+    def run_with_bot_api(coro_function, *args):
+        async def main():
+            fake = await FakeTelegram(port=FAKE_PORT).start()
+            try:
+                return await coro_function(fake, *args)
+            finally:
+                await (await bot.bot.get_session()).close()
+                await fake.stop()
+        return run(main)
+    return run_with_bot_api
@@ -0,0 +1,40 @@
+from dedup import DuplicateIndex, minhash
+
+STORY = "Центральный банк сохранил ключевую ставку на прежнем уровне и пообещал пересмотреть прогноз инфляции летом"
+OTHER_STORY = "В городе открылся новый парк с фонтанами, детскими площадками и прокатом велосипедов для всех жителей"
+
+
+def test_same_story_from_another_channel_is_duplicate():
+    index = DuplicateIndex()
+    index.add('first', minhash(STORY), None, 'channel_a')
+    assert index.find(minhash(STORY + " Подробности позже"), None, 'channel_b') == 'first'
+
+
+def test_same_channel_is_never_duplicate():
+    index = DuplicateIndex()
+    index.add('first', minhash(STORY), 'photo-1', 'channel_a')
+    assert index.find(minhash(STORY), None, 'channel_a') is None
+    assert index.find(minhash(OTHER_STORY), 'photo-1', 'channel_a') is None
+
+
+def test_shared_media_with_different_text_is_not_duplicate():
+    # Стоковая картинка под разными новостями
+    index = DuplicateIndex()
+    index.add('first', minhash(STORY), 'photo-1', 'channel_a')
+    assert index.find(minhash(OTHER_STORY), 'photo-1', 'channel_b') is None
+
+
+def test_shared_media_without_text_is_duplicate():
+    index = DuplicateIndex()
+    index.add('first', minhash(STORY), 'photo-1', 'channel_a')
+    assert index.find(None, 'photo-1', 'channel_b') == 'first'
+    index.add('second', None, 'photo-2', 'channel_a')
+    assert index.find(minhash(OTHER_STORY), 'photo-2', 'channel_b') == 'second'
+
+
+def test_entries_expire_after_window():
+    index = DuplicateIndex(window_seconds=60)
+    index.add('first', minhash(STORY), 'photo-1', 'channel_a', timestamp=1000)
+    assert index.find(minhash(STORY), 'photo-1', 'channel_b', now=1030) == 'first'
+    assert index.find(minhash(STORY), 'photo-1', 'channel_b', now=1100) is None
+    assert len(index) == 0 and not index.buckets and not index.media
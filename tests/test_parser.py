@@ -0,0 +1,81 @@
+import asyncio
+
+from sqlalchemy import select
+
+from database import get_async_session, News
+from dedup import minhash
+from fake_telethon import make_document, make_message
+from ipc import LocalNewsChannel, NEWS_MEDIA_FAILED
+from parser import NewsParser
+
+STORY_A = "Министерство транспорта объявило о запуске нового скоростного поезда между двумя столицами уже этой осенью"
+STORY_B = "Ученые обнаружили в архиве неизвестную рукопись известного писателя с черновиками последнего романа и письмами"
+STORY_LIVE = "Сборная страны по хоккею выиграла финальный матч чемпионата мира в серии буллитов после двух овертаймов"
+
+
+def test_concurrent_backfill_batches_do_not_wait_for_each_other(run):
+    run(check_concurrent_backfill_batches)
+
+
+async def check_concurrent_backfill_batches():
+    parser = NewsParser()
+
+    async with get_async_session() as session:
+        live_news = News(source_channel='live', message_id=1, content=STORY_LIVE)
+        session.add(live_news)
+        await session.commit()
+    # Живой обработчик еще записывает новость: ее место в индексе повторов не заполнено
+    _, live_slot = parser.check_duplicate(minhash(STORY_LIVE), None, 'live')
+
+    def entries(source_channel, texts):
+        return [parser.build_news(source_channel, make_message(1, number, text)) for number, text in enumerate(texts, 1)]
+
+    # Пачки ссылаются на места друг друга и на место живого обработчика
+    batch_x = asyncio.create_task(parser.save_news_batch('x', entries('x', [STORY_A, STORY_LIVE, STORY_B]), 3))
+    await asyncio.sleep(0)
+    batch_y = asyncio.create_task(parser.save_news_batch('y', entries('y', [STORY_B, STORY_A]), 2))
+    await asyncio.sleep(0)
+    live_slot.set_result(live_news.id)
+
+    saved_x, saved_y = await asyncio.wait_for(asyncio.gather(batch_x, batch_y), 10)
+
+    assert [news.content for news, _ in saved_x] == [STORY_A, STORY_B]
+    assert saved_y == []
+    async with get_async_session() as session:
+        rows = (await session.execute(select(News.source_channel, News.content, News.id, News.duplicate_of))).all()
+    ids = {(channel, content): news_id for channel, content, news_id, _ in rows}
+    links = {(channel, content): duplicate_of for channel, content, _, duplicate_of in rows}
+    assert links[('x', STORY_LIVE)] == live_news.id
+    assert links[('y', STORY_A)] == ids[('x', STORY_A)]
+    assert links[('y', STORY_B)] == ids[('x', STORY_B)]
+    assert links[('x', STORY_A)] is None and links[('x', STORY_B)] is None
+
+
+class FailingClient:
+    """Клиент Telethon, у которого обрывается каждое скачивание"""
+
+    async def download_media(self, message, path):
+        raise ConnectionError("соединение разорвано")
+
+
+def test_failed_download_is_reported_to_bot(run):
+    run(check_failed_download_is_reported)
+
+
+async def check_failed_download_is_reported():
+    parser = NewsParser()
+    parser.client = FailingClient()
+    parser.news_channel = LocalNewsChannel()
+    message = make_message(1, 1, 'Отчет', media=make_document(1, 1024))
+    values, media_messages, _ = parser.build_news('channel', message)
+    async with get_async_session() as session:
+        news = News(**values)
+        session.add(news)
+        await session.commit()
+
+    worker = asyncio.create_task(parser.download_worker())
+    try:
+        await parser.download_queue.put((news.id, media_messages, True))
+        assert await parser.news_channel.receive(timeout=5) == (NEWS_MEDIA_FAILED, news.id)
+    finally:
+        worker.cancel()
@@ -0,0 +1,71 @@
+import pytest
+
+import bot
+from database import get_async_session, News, MEDIA_PENDING, MEDIA_READY
+from fake_telethon import make_document, make_message
+from ipc import NEWS_MEDIA_FAILED, NEWS_SAVED
+from parser import NewsParser
+
+
+def test_get_media_info_names_nameless_document():
+    # Видео, голосовые и кружки приходят без DocumentAttributeFilename: имя строится по MIME-типу
+    message = make_message(1, 7, 'Видео', media=make_document(1, 1024, None, 'video/mp4'))
+    assert NewsParser.get_media_info(message) == ('document', 'doc_7.mp4')
+
+
+def test_get_media_info_keeps_document_name():
+    message = make_message(1, 7, 'Отчет', media=make_document(1, 1024, 'report.pdf', 'application/pdf'))
+    assert NewsParser.get_media_info(message) == ('document', 'report.pdf')
+
+
+@pytest.mark.parametrize('media_status, sent, deleted', [
+    # Медиа скачалось до рассылки: модератор получает новость с медиа один раз
+    (MEDIA_READY, 1, 0),
+    # Медиа скачивается после рассылки: модератор получает превью, затем версию с медиа, а превью удаляется
+    (MEDIA_PENDING, 2, 1),
+])
+def test_media_ready_event_after_announcement(run_with_bot_api, media_status, sent, deleted):
+    calls = run_with_bot_api(announce_and_replace, media_status)
+    for moderator_id in bot.MODERATOR_IDS:
+        chat_calls = [method for method, data in calls if str(data.get('chat_id')) == str(moderator_id)]
+        assert len(chat_calls) - chat_calls.count('deleteMessage') == sent
+        assert chat_calls.count('deleteMessage') == deleted
+
+
+def test_failed_media_download_forgets_previews(run_with_bot_api):
+    calls, previews = run_with_bot_api(announce_and_fail)
+    assert previews is None
+    # Модераторы получили только первую рассылку, превью не удалялись
+    assert len(calls) == len(bot.MODERATOR_IDS)
+    assert 'deleteMessage' not in [method for method, _ in calls]
+
+
+async def save_photo_news(media_status):
+    async with get_async_session() as session:
+        news = News(
+            source_channel='channel', message_id=1, content='Новость с фото', has_media=True, media_type='photo',
+            media_file_id='cached-photo', media_status=media_status
+        )
+        session.add(news)
+        await session.commit()
+        return news.id
+
+
+async def announce_and_fail(fake):
+    """Рассылает новость, медиа которой скачивается, затем обрабатывает событие об ошибке скачивания"""
+    news_id = await save_photo_news(MEDIA_PENDING)
+    await bot.handle_parser_event(NEWS_SAVED, news_id)
+    await bot.handle_parser_event(NEWS_MEDIA_FAILED, news_id)
+    return [(method, data) for _, method, data in fake.calls], bot.moderator_previews.get(news_id)
+
+
+async def announce_and_replace(fake, media_status):
+    """Рассылает новость с медиа в состоянии media_status, затем обрабатывает событие о готовности медиа"""
+    news_id = await save_photo_news(media_status)
+    await bot.announce_news(news_id)
+    if media_status == MEDIA_PENDING:
+        async with get_async_session() as session:
+            (await session.get(News, news_id)).media_status = MEDIA_READY
+            await session.commit()
+    await bot.replace_previews_with_media(news_id)
+    return [(method, data) for _, method, data in fake.calls]
@@ -0,0 +1,77 @@
+import asyncio
+import contextvars
+import hmac
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.webhook import AnswerCallbackQuery
+
+logger = logging.getLogger(__name__)
+
+# Telegram ждет ответа на webhook не дольше минуты; после этого обработка продолжается, а в ответе - пусто
+RESPONSE_TIMEOUT = 55
+
+# Заголовок, в котором Telegram передает секрет, указанный в setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Ответ на нажатие кнопки, который можно вернуть прямо в ответе на webhook текущего обновления
+webhook_answer = contextvars.ContextVar('webhook_answer', default=None)
+
+
+def answer_in_response(callback_query_id, text=None, show_alert=None):
+    """
+    Передает ответ на нажатие кнопки в ответ на webhook, не делая отдельного запроса к Bot API.
+    Возвращает False, если это невозможно (режим polling или ответ для этого обновления уже отдан).
+    """
+    answer = webhook_answer.get()
+    if answer is None or answer.done():
+        return False
+    answer.set_result(AnswerCallbackQuery(callback_query_id, text=text, show_alert=show_alert))
+    return True
+
+
+def create_webhook_app(dispatcher, path, secret):
+    """
+    Приложение aiohttp, принимающее обновления от Telegram.
+    Запросы без правильного секрета отклоняются. Обновление обрабатывается в фоне: ответ на webhook
+    отдается, как только обработчик ответил на нажатие кнопки (ответ уходит в теле ответа) или закончил работу.
+    """
+    tasks = set()
+
+    async def process(update, answer):
+        webhook_answer.set(answer)
+        # Как в обработчике webhook aiogram: обработчики получают бота и диспетчер из контекста
+        Dispatcher.set_current(dispatcher)
+        Bot.set_current(dispatcher.bot)
+        try:
+            # Через updates_handler, чтобы сработали middleware диспетчера
+            await dispatcher.updates_handler.notify(update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+
+    async def handle(request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret):
+            logger.warning(f"Запрос к webhook с неверным секретом от {request.remote}")
+            return web.Response(status=401)
+
+        update = types.Update(**await request.json())
+        answer = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(process(update, answer))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+        await asyncio.wait({task, answer}, timeout=RESPONSE_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        if answer.done():
+            return answer.result().get_web_response()
+        # Ответа на кнопку не будет: запрещаем его передачу в ответе, если обработчик ответит позже
+        answer.cancel()
+        return web.Response(text='ok')
+
+    async def on_shutdown(app):
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    app.on_shutdown.append(on_shutdown)
+    return app